@@ -14,6 +14,7 @@ Share = {
 	this.detailsElem = document.getElementById(this.pluginId+'-sharedetails');
 	this.finalizeElem = document.getElementById(this.pluginId+'-sharefinalize');
 	this.respondersElem = document.getElementById(this.pluginId+'-shareresponders');
+	this.tallyElem = document.getElementById(this.pluginId+'-sharetally');
 	this.teamgenToggleElem = document.getElementById(this.pluginId+'-teamgen-toggle');
 	this.teamgenContainerElem = document.getElementById(this.pluginId+'-teamgen-container');
 	this.teamgenOptionsElem = document.getElementById(this.pluginId+'-teamgen-options');
@@ -36,6 +37,8 @@ Share = {
 
 	this.countElem.textContent = manage ? '(?)' : '';
 	this.respondersElem.textContent = '';
+	this.tallyElem.textContent = '';
+	this.tallyElem.style.display = 'none';
 
 	this.respErrors = null;
 	if (manage)
@@ -66,7 +69,7 @@ Share = {
 	if (!Slidoc.PluginManager.onLastSlide())
 	    return false;
 
-	if (methodName == 'answerNotify' || (methodName == 'finalizeShare' && isAdmin))
+	if (methodName == 'answerNotify' || ((methodName == 'finalizeShare' || methodName == 'tallyNotify') && isAdmin))
 	    return this[methodName].apply(this, extraArgs);
 
 	throw('Share.js: Denied access to relay method '+methodName);
@@ -105,6 +108,48 @@ Share = {
 	}
     },
 
+    tallyNotify: function (qnumber, tally) {
+	// Live tally of interactive responses (sent only to admin users)
+	Slidoc.log('Slidoc.Plugins.Share.tallyNotify:', qnumber, tally);
+	if (!this.testUser || qnumber != this.qattributes.qnumber || !tally)
+	    return;
+	this.countElem.textContent = '('+tally.responders+')';
+
+	var lines = ['Live tally ('+tally.responders+' responders):'];
+	if (tally.choices) {
+	    var choiceBlock = document.getElementById(this.slideId+'-choice-block');
+	    var shuffleStr = choiceBlock ? choiceBlock.dataset.shuffle : '';
+	    var choices = Object.keys(tally.choices);
+	    choices.sort();
+	    for (var j=0; j<choices.length; j++) {
+		var dispChoice = choices[j].toUpperCase();
+		if (shuffleStr) {
+		    var k = shuffleStr.indexOf(dispChoice);
+		    dispChoice = (k>=1) ? String.fromCharCode('A'.charCodeAt(0) + k-1) : '';
+		}
+		lines.push(dispChoice+': '+tally.choices[choices[j]]);
+	    }
+	} else if (tally.histogram) {
+	    var hist = tally.histogram;
+	    var binWidth = (hist.max - hist.min) / hist.bins.length;
+	    for (var j=0; j<hist.bins.length; j++) {
+		if (!hist.bins[j])
+		    continue;
+		if (binWidth)
+		    lines.push((hist.min+j*binWidth).toPrecision(4)+' to '+(hist.min+(j+1)*binWidth).toPrecision(4)+': '+hist.bins[j]);
+		else
+		    lines.push(hist.min+': '+hist.bins[j]);
+	    }
+	} else if (tally.words) {
+	    var words = [];
+	    for (var j=0; j<tally.words.length; j++)
+		words.push(tally.words[j][0]+' ('+tally.words[j][1]+')');
+	    lines.push(words.join(', '));
+	}
+	this.tallyElem.textContent = lines.join('\n');
+	this.tallyElem.style.display = null;
+    },
+
     enterSlide: function(paceStart, backward){
 	console.log('Slidoc.Plugins.Share.enterSlide:', paceStart, backward);
 	if (!backward && Slidoc.PluginManager.autoInteractMode())
@@ -669,7 +714,8 @@ pre.slidoc-plugin-Share-responders {
    <div id="%(pluginId)s-sharedetails" class="slidoc-plugin-Share-details %(pluginId)s-sharedetails slidoc-shareable-hide">
      <input type="button" id="%(pluginId)s-sharefinalize" class="slidoc-clickable slidoc-button" value="Finalize"
      onclick="Slidoc.Plugins['%(pluginName)s']['%(pluginSlideId)s'].finalizeShare();"></input>
-     <pre id="%(pluginId)s-shareresponders" class="slidoc-plugin-Share-responders %(pluginId)s-shareresponders"><pre>
+     <pre id="%(pluginId)s-shareresponders" class="slidoc-plugin-Share-responders %(pluginId)s-shareresponders"></pre>
+     <pre id="%(pluginId)s-sharetally" class="slidoc-plugin-Share-responders %(pluginId)s-sharetally" style="display: none;"></pre>
    </div>
    <span id="%(pluginId)s-teamgen-toggle" class="slidoc-clickable slidoc-teamgenonly" onclick="document.getElementById('%(pluginId)s-teamgen-container').style.display=null;this.style.display='none';">Team creation options</span><br>
    <div id="%(pluginId)s-teamgen-container" class="slidoc-plugin-Share-teamgen %(pluginId)s-teamgen slidoc-teamgenonly" style="display: none;">
@@ -0,0 +1,593 @@
+#!/usr/bin/env python
+
+"""
+sdbench: End-to-end load benchmark for a paced session
+
+Starts sdsheets (local stand-in for the Google Sheets web app) and sdserver in a scratch directory,
+compiles a generated paced session through the server proxy, and then simulates a class:
+    N students log in, open a WebSocket to the session, answer M questions (with random think times) and submit
+    Admin user(s) repeatedly load the grading view (all rows), the session stats, and grade submitted responses
+
+Measured:
+    actions:      Latency percentiles (p50/p95/p99), mean, max and error counts for each action
+    ioloop_lag:   Server responsiveness (round trip of a trivial WebSocket request, sent every lag_interval sec)
+    client_lag:   Benchmark client IOLoop lag (large values mean the client, not the server, is saturated)
+    upstream:     Upstream flush rate (update requests and rows per second, from sdsheets /_stats)
+    memory:       Server resident memory (start, peak, end, growth; Linux only)
+    websocket:    Messages received by clients (count, average size and decode time; --ws_encoding=msgpack to compare)
+
+Results are written as JSON to --output (with the git commit, if available) for comparison across commits.
+Use --compare=previous.json to print the change relative to an earlier run.
+
+Usage:
+    sdbench.py --students=50 --questions=10 --think_min=2 --think_max=10 [--latency=0.5 --jitter=0.3] [--output=results.json]
+
+"""
+
+from __future__ import print_function
+
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import urllib
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import tornado.gen
+import tornado.httpclient
+import tornado.websocket
+
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+import sliauth
+
+BENCH_VERSION = 1
+
+SESSION_NAME = 'bench01'
+ADMIN_USER = 'admin'
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+Options = {
+    'admin_interval': 5.0,
+    'admins': 1,
+    'auth_key': 'benchkey-0123456789abcdef',
+    'compare': '',
+    'debug': False,
+    'drain_sec': 10.0,
+    'jitter': 0.0,
+    'keep': False,
+    'label': '',
+    'lag_interval': 0.5,
+    'latency': 0.0,
+    'min_wait_sec': 0,
+    'output': 'sdbench_results.json',
+    'port': 8091,
+    'questions': 5,
+    'ramp_sec': 5.0,
+    'sample_interval': 1.0,
+    'seed': 1,
+    'server_args': '',
+    'sheets_port': 8092,
+    'students': 10,
+    'think_max': 5.0,
+    'think_min': 1.0,
+    'timeout': 60.0,
+    'work_dir': '',
+    'ws_encoding': 'json',
+    }
+
+class Dummy():
+    pass
+
+Global = Dummy()
+Global.random = random.Random()
+Global.procs = []
+Global.timings = {}      # action -> list of latencies (sec)
+Global.errors = {}       # action -> error count
+Global.messages = []     # First few error messages
+Global.samples = []      # [elapsed_sec, server_rss_kb, upstream_updates, upstream_rows]
+Global.clientLag = []
+Global.serverPid = None
+Global.wsReceived = [0, 0, 0.0]  # [count, bytes, decode_sec] for WebSocket messages received
+
+def record(action, elapsed, error=''):
+    Global.timings.setdefault(action, []).append(elapsed)
+    if error:
+        Global.errors[action] = Global.errors.get(action, 0) + 1
+        if len(Global.messages) < 20:
+            Global.messages.append('%s: %s' % (action, error))
+
+def percentile(sortedValues, pct):
+    if not sortedValues:
+        return None
+    k = (len(sortedValues)-1) * pct / 100.0
+    f = int(math.floor(k))
+    c = min(f+1, len(sortedValues)-1)
+    return sortedValues[f] + (sortedValues[c] - sortedValues[f]) * (k - f)
+
+def summarize(values, scale=1000.0):
+    # Returns summary dict (in ms, by default)
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+    return {'count': len(values),
+            'mean': round(scale*sum(values)/len(values), 3),
+            'p50': round(scale*percentile(values, 50), 3),
+            'p95': round(scale*percentile(values, 95), 3),
+            'p99': round(scale*percentile(values, 99), 3),
+            'max': round(scale*values[-1], 3)}
+
+def getRSS(pid):
+    # Returns resident memory (KB) of process, or None
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except Exception:
+        pass
+    return None
+
+def gitCommit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR, stderr=subprocess.STDOUT).strip()
+    except Exception:
+        return ''
+
+def studentId(j):
+    return 'bench%03d' % (j+1)
+
+def sessionText(nQuestions):
+    # Paced session with choice, numeric and (gradable) open-ended questions
+    lines = ['<!--slidoc-defaults --pace=1 --features=grade_response -->', '# Benchmark session', '']
+    for qno in range(1, nQuestions+1):
+        lines += ['---', '', '## Question %d' % qno, '']
+        if qno % 3 == 1:
+            lines += ['What is %d+%d?' % (qno, qno), '', 'A. %d' % qno, '', 'B. %d' % (2*qno), '', 'Answer: B', '']
+        elif qno % 3 == 2:
+            lines += ['What is %d*%d?' % (qno, qno), '', 'Answer: %d' % (qno*qno), '']
+        else:
+            lines += ['Explain question %d.' % qno, '', 'Answer: text/markdown; weight=0,5', '']
+    return '\n'.join(lines) + '\n'
+
+def setupWorkDir(workDir):
+    # Roster and session source files
+    loadDir = os.path.join(workDir, 'sheets')
+    webDir = os.path.join(workDir, 'web')
+    for dirpath in (loadDir, webDir):
+        if not os.path.exists(dirpath):
+            os.makedirs(dirpath)
+    with open(os.path.join(loadDir, 'roster_slidoc.csv'), 'wb') as f:
+        f.write('name,id,email,altid\n')
+        for j in range(Options['students']):
+            f.write('"Student, %03d",%s,,\n' % (j+1, studentId(j)))
+    with open(os.path.join(workDir, SESSION_NAME+'.md'), 'wb') as f:
+        f.write(sessionText(Options['questions']))
+    return loadDir, webDir
+
+def startProcess(name, args, workDir):
+    logFile = open(os.path.join(workDir, name+'.log'), 'wb')
+    proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, name+'.py')] + args, cwd=workDir,
+                            stdout=logFile, stderr=subprocess.STDOUT)
+    Global.procs.append(proc)
+    return proc
+
+def waitForURL(url, timeout=20):
+    client = tornado.httpclient.HTTPClient()
+    try:
+        endTime = time.time() + timeout
+        while time.time() < endTime:
+            try:
+                client.fetch(url, follow_redirects=False)
+                return
+            except tornado.httpclient.HTTPError, excp:
+                if excp.code != 599:
+                    # Any HTTP response means the server is listening
+                    return
+            except Exception:
+                pass
+            time.sleep(0.25)
+        raise Exception('Timed out waiting for '+url)
+    finally:
+        client.close()
+
+def stopProcesses():
+    for proc in Global.procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in Global.procs:
+        proc.wait()
+    Global.procs = []
+
+def sheetsURL(path):
+    return 'http://localhost:%d/%s' % (Options['sheets_port'], path)
+
+def serverURL(path, ws=False):
+    return '%s://localhost:%d/%s' % ('ws' if ws else 'http', Options['port'], path)
+
+def setupServers(workDir):
+    loadDir, webDir = setupWorkDir(workDir)
+    startProcess('sdsheets', ['--auth_key='+Options['auth_key'], '--port=%d' % Options['sheets_port'], '--load_dir='+loadDir,
+                              '--latency=%s' % Options['latency'], '--jitter=%s' % Options['jitter'], '--seed=%d' % Options['seed']], workDir)
+    waitForURL(sheetsURL('_stats'))
+
+    serverArgs = ['--auth_key='+Options['auth_key'], '--auth_type=token', '--gsheet_url='+sheetsURL('_sheets'), '--port=%d' % Options['port'],
+                  '--web_dir='+webDir, '--min_wait_sec=%s' % Options['min_wait_sec']]
+    if Options['debug']:
+        serverArgs.append('--debug')
+    if Options['ws_encoding'] == 'msgpack':
+        serverArgs.append('--ws_msgpack')
+    serverArgs += Options['server_args'].split()
+    Global.serverPid = startProcess('sdserver', serverArgs, workDir).pid
+    waitForURL(serverURL(''))
+
+    # Compile session through the server proxy (creating index entry and session sheet)
+    cmd = [sys.executable, os.path.join(SCRIPT_DIR, 'slidoc.py'), '--auth_key='+Options['auth_key'],
+           '--gsheet_url='+serverURL('_proxy'), '--dest_dir='+webDir, SESSION_NAME+'.md']
+    with open(os.path.join(workDir, 'slidoc.log'), 'wb') as logFile:
+        if subprocess.call(cmd, cwd=workDir, stdout=logFile, stderr=subprocess.STDOUT):
+            raise Exception('Error in compiling benchmark session; see '+os.path.join(workDir, 'slidoc.log'))
+
+
+class BenchClient(object):
+    # WebSocket connection for a single user, with request/response matching by callback index
+    def __init__(self, userId, admin=False):
+        self.userId = userId
+        self.admin = admin
+        self.conn = None
+        self.cookie = ''
+        self.sessionVersion = ''
+        self.callbackIndex = 0
+        self.pending = {}
+        self.setup = Future()
+
+    @tornado.gen.coroutine
+    def login(self):
+        token = Options['auth_key'] if self.admin else sliauth.gen_auth_token(Options['auth_key'], self.userId)
+        url = serverURL('_auth/login/?'+urllib.urlencode({'username': self.userId, 'token': token}))
+        resp = yield tornado.httpclient.AsyncHTTPClient().fetch(url, follow_redirects=False, raise_error=False)
+        cookies = [x.split(';')[0] for x in resp.headers.get_list('Set-Cookie')]
+        if not cookies:
+            raise Exception('Login failed for user %s (HTTP %s)' % (self.userId, resp.code))
+        self.cookie = '; '.join(cookies)
+
+    @tornado.gen.coroutine
+    def connect(self):
+        wsPath = '_websocket/'+SESSION_NAME
+        if Options['ws_encoding'] == 'msgpack':
+            wsPath += '?encoding=msgpack'
+        request = tornado.httpclient.HTTPRequest(serverURL(wsPath, ws=True), headers={'Cookie': self.cookie})
+        self.conn = yield tornado.websocket.websocket_connect(request)
+        IOLoop.current().spawn_callback(self.reader)
+        yield tornado.gen.with_timeout(time.time()+Options['timeout'], self.setup)
+
+    @tornado.gen.coroutine
+    def reader(self):
+        while True:
+            msg = yield self.conn.read_message()
+            if msg is None:
+                break
+            startTime = time.time()
+            if isinstance(msg, bytes) and Options['ws_encoding'] == 'msgpack':
+                obj = msgpack.unpackb(msg, raw=False)
+            else:
+                obj = json.loads(msg)
+            Global.wsReceived[0] += 1
+            Global.wsReceived[1] += len(msg)
+            Global.wsReceived[2] += time.time() - startTime
+            if obj[0]:
+                future = self.pending.pop(obj[0], None)
+                if future:
+                    future.set_result(obj[2])
+            elif obj[1] == 'session_setup':
+                self.sessionVersion = obj[2][0]
+                if not self.setup.done():
+                    self.setup.set_result(True)
+            elif obj[1] == 'close':
+                record('closed', 0.0, '%s: %s' % (self.userId, obj[2][0]))
+
+        # Connection closed; fail any pending requests
+        for future in self.pending.values():
+            future.set_exception(Exception('Connection closed'))
+        self.pending = {}
+
+    @tornado.gen.coroutine
+    def request(self, action, method, args):
+        # Returns result object (or None, on error); records latency
+        self.callbackIndex += 1
+        future = Future()
+        self.pending[self.callbackIndex] = future
+        startTime = time.time()
+        retObj = None
+        try:
+            self.conn.write_message(json.dumps([self.sessionVersion, self.callbackIndex, method, args]))
+            retObj = yield tornado.gen.with_timeout(startTime+Options['timeout'], future)
+            error = retObj.get('error', '') if retObj.get('result') != 'success' else ''
+        except Exception, excp:
+            self.pending.pop(self.callbackIndex, None)
+            error = str(excp) or excp.__class__.__name__
+        record(action, time.time()-startTime, error)
+        raise tornado.gen.Return(None if error else retObj)
+
+    def proxy(self, action, params):
+        params = params.copy()
+        params['sheet'] = SESSION_NAME
+        if self.admin:
+            # Effective user token (see GoogleSheet.setUserToken)
+            params['token'] = params.get('id', '') + sliauth.gen_auth_token(Options['auth_key'], ADMIN_USER, 'admin', prefixed=True)
+            params['admin'] = ADMIN_USER
+        else:
+            params['id'] = self.userId
+            params['token'] = sliauth.gen_auth_token(Options['auth_key'], self.userId)
+        return self.request(action, 'proxy', params)
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+
+
+class Benchmark(object):
+    def __init__(self):
+        self.startTime = None
+        self.submitted = []
+        self.active = 0
+        self.done = False
+
+    @tornado.gen.coroutine
+    def student(self, j, startDelay):
+        yield tornado.gen.sleep(startDelay)
+        client = BenchClient(studentId(j))
+        self.active += 1
+        try:
+            startTime = time.time()
+            try:
+                yield client.login()
+                yield client.connect()
+                record('login', time.time()-startTime)
+            except Exception, excp:
+                record('login', time.time()-startTime, str(excp))
+                return
+
+            retObj = yield client.proxy('open', {'get': '1', 'create': 'browser', 'getheaders': '1'})
+            if not retObj or not retObj.get('headers'):
+                return
+            headers = retObj['headers']
+            row = [None] * len(headers)
+            row[headers.index('name')] = retObj['value'][headers.index('name')]
+            row[headers.index('id')] = client.userId
+
+            for qno in range(1, Options['questions']+1):
+                yield tornado.gen.sleep(Global.random.uniform(Options['think_min'], Options['think_max']))
+                col = 'q%d_response' % qno
+                if col in headers:
+                    row[headers.index(col)] = ('B', str(qno*qno), 'Answer %d from %s' % (qno, client.userId))[(qno-1) % 3]
+                if 'lastSlide' in headers:
+                    row[headers.index('lastSlide')] = qno+1
+                yield client.proxy('answer', {'row': json.dumps(row)})
+
+            yield tornado.gen.sleep(Global.random.uniform(Options['think_min'], Options['think_max']))
+            retObj = yield client.proxy('submit', {'row': json.dumps(row), 'submit': '1'})
+            if retObj:
+                self.submitted.append(client.userId)
+        finally:
+            self.active -= 1
+            client.close()
+
+    @tornado.gen.coroutine
+    def administrator(self, j):
+        client = BenchClient(ADMIN_USER, admin=True)
+        yield client.login()
+        yield client.connect()
+        graded = set()
+        while not self.done:
+            yield tornado.gen.sleep(Options['admin_interval'] * (0.5 + Global.random.random()))
+            yield client.proxy('grading_view', {'all': '1', 'get': '1'})
+            if self.submitted:
+                yield client.proxy('stats_view', {'id': self.submitted[0], 'get': '1', 'getstats': '1'})
+            for userId in self.submitted[:]:
+                if userId in graded:
+                    continue
+                graded.add(userId)
+                for qno in range(3, Options['questions']+1, 3):
+                    yield client.proxy('grade', {'id': userId, 'update': json.dumps([['id', userId], ['q%d_grade' % qno, 4]])})
+        client.close()
+
+    @tornado.gen.coroutine
+    def lagProbe(self):
+        # Round trip of a trivial request measures server IOLoop responsiveness under load
+        client = BenchClient(ADMIN_USER, admin=True)
+        yield client.login()
+        yield client.connect()
+        while not self.done:
+            yield client.request('ioloop_lag', 'switch_session', [SESSION_NAME, False])
+            yield tornado.gen.sleep(Options['lag_interval'])
+        client.close()
+
+    @tornado.gen.coroutine
+    def sampler(self):
+        httpClient = tornado.httpclient.AsyncHTTPClient()
+        while True:
+            try:
+                resp = yield httpClient.fetch(sheetsURL('_stats'))
+                stats = json.loads(resp.body)
+                Global.samples.append([round(time.time()-self.startTime, 3), getRSS(Global.serverPid), stats['updates'],
+                                       stats['inserted_rows']+stats['updated_rows']])
+            except Exception, excp:
+                if Options['debug']:
+                    print('sdbench: Error in sampling stats', excp, file=sys.stderr)
+            if self.done == 'final':
+                break
+            yield tornado.gen.sleep(Options['sample_interval'])
+
+    def clientLag(self):
+        curTime = time.time()
+        if self.lastTick:
+            Global.clientLag.append(max(0.0, curTime - self.lastTick - 0.1))
+        self.lastTick = curTime
+
+    @tornado.gen.coroutine
+    def run(self):
+        yield tornado.httpclient.AsyncHTTPClient().fetch(sheetsURL('_reset'))
+        self.startTime = time.time()
+        self.lastTick = None
+        ticker = PeriodicCallback(self.clientLag, 100)
+        ticker.start()
+        IOLoop.current().spawn_callback(self.sampler)
+
+        tasks = [self.student(j, Options['ramp_sec']*j/max(1, Options['students'])) for j in range(Options['students'])]
+        adminTasks = [self.administrator(j) for j in range(Options['admins'])] + [self.lagProbe()]
+        yield tasks
+        self.studentSec = time.time() - self.startTime
+
+        # Allow upstream updates to drain
+        yield tornado.gen.sleep(Options['drain_sec'])
+        self.done = True
+        yield adminTasks
+        ticker.stop()
+        self.done = 'final'
+        yield self.sampler()
+        self.duration = time.time() - self.startTime
+
+    def results(self):
+        retObj = {'bench_version': BENCH_VERSION, 'label': Options['label'], 'commit': gitCommit(),
+                  'date': sliauth.iso_date(nosubsec=True), 'options': dict((k, v) for k, v in Options.items() if k not in ('auth_key', 'compare')),
+                  'duration_sec': round(self.duration, 3), 'student_sec': round(self.studentSec, 3), 'submitted': len(self.submitted)}
+
+        retObj['actions'] = {}
+        for action, values in Global.timings.items():
+            if action in ('ioloop_lag', 'closed'):
+                continue
+            retObj['actions'][action] = summarize(values)
+            retObj['actions'][action]['errors'] = Global.errors.get(action, 0)
+
+        retObj['ioloop_lag'] = summarize(Global.timings.get('ioloop_lag', []))
+        retObj['client_lag'] = summarize(Global.clientLag)
+        count, nbytes, seconds = Global.wsReceived
+        retObj['ws_messages'] = {'encoding': Options['ws_encoding'], 'count': count, 'average_bytes': nbytes//max(1, count),
+                                 'average_decode_us': round(1.0e6*seconds/max(1, count), 1)}
+        retObj['errors'] = sum(Global.errors.values())
+        retObj['error_messages'] = Global.messages
+
+        samples = Global.samples
+        if samples:
+            elapsed = samples[-1][0] or 1.0
+            retObj['upstream'] = {'updates': samples[-1][2], 'rows': samples[-1][3],
+                                  'updates_per_sec': round(samples[-1][2]/elapsed, 3), 'rows_per_sec': round(samples[-1][3]/elapsed, 3)}
+            rssValues = [x[1] for x in samples if x[1]]
+            if rssValues:
+                retObj['memory'] = {'start_kb': rssValues[0], 'peak_kb': max(rssValues), 'end_kb': rssValues[-1],
+                                    'growth_kb': rssValues[-1]-rssValues[0]}
+        retObj['samples'] = samples
+        return retObj
+
+
+def printResults(results, prevResults=None):
+    def change(value, prevValue):
+        if not prevValue or value is None:
+            return ''
+        return ' (%+.1f%%)' % (100.0*(value-prevValue)/prevValue)
+
+    prevActions = prevResults.get('actions', {}) if prevResults else {}
+    print('sdbench: %d students, %d questions, %d submitted, %.1fs (commit %s)' % (Options['students'], Options['questions'],
+                                                                                 results['submitted'], results['duration_sec'], results['commit'] or '-'))
+    print('%-14s %7s %7s %10s %10s %10s %10s' % ('action(ms)', 'count', 'errors', 'p50', 'p95', 'p99', 'max'))
+    for action in sorted(results['actions'].keys()) + ['ioloop_lag', 'client_lag']:
+        stats = results[action] if action in ('ioloop_lag', 'client_lag') else results['actions'][action]
+        prevStats = (prevResults.get(action) if action in ('ioloop_lag', 'client_lag') else prevActions.get(action)) if prevResults else None
+        if not stats.get('count'):
+            continue
+        print('%-14s %7d %7s %10.1f %10.1f %10.1f %10.1f%s' % (action, stats['count'], stats.get('errors', ''), stats['p50'], stats['p95'],
+                                                               stats['p99'], stats['max'], change(stats['p95'], (prevStats or {}).get('p95'))))
+    if 'upstream' in results:
+        upstream = results['upstream']
+        prevRate = prevResults.get('upstream', {}).get('updates_per_sec') if prevResults else None
+        print('upstream: %d updates (%.2f/s%s), %d rows (%.2f/s)' % (upstream['updates'], upstream['updates_per_sec'],
+                                                                    change(upstream['updates_per_sec'], prevRate), upstream['rows'], upstream['rows_per_sec']))
+    if 'ws_messages' in results:
+        wsMessages = results['ws_messages']
+        print('websocket (%s): %d messages received, average %d bytes, decode %.1fus' % (wsMessages['encoding'], wsMessages['count'],
+                                                                                       wsMessages['average_bytes'], wsMessages['average_decode_us']))
+    if 'memory' in results:
+        memory = results['memory']
+        print('memory: start %dKB, peak %dKB, growth %+dKB' % (memory['start_kb'], memory['peak_kb'], memory['growth_kb']))
+    for msg in results['error_messages']:
+        print('error:', msg)
+
+
+def main():
+    from tornado.options import define, options, parse_command_line
+
+    define("admin_interval", default=Options['admin_interval'], help="Mean interval between admin grading/stats views (sec)")
+    define("admins", default=Options['admins'], help="Number of admin users")
+    define("auth_key", default=Options['auth_key'], help="Site authentication key (at least 20 characters)")
+    define("compare", default=Options['compare'], help="Previous results file to compare with")
+    define("debug", default=False, help="Debug mode (also enables server debug output)")
+    define("drain_sec", default=Options['drain_sec'], help="Wait after last submission for upstream updates to drain (sec)")
+    define("jitter", default=Options['jitter'], help="Upstream random latency variation (+/- sec)")
+    define("keep", default=False, help="Keep work directory (with server logs)")
+    define("label", default=Options['label'], help="Label for results")
+    define("lag_interval", default=Options['lag_interval'], help="Interval between server IOLoop lag probes (sec)")
+    define("latency", default=Options['latency'], help="Upstream base latency (sec)")
+    define("min_wait_sec", default=Options['min_wait_sec'], help="Server minimum time between upstream updates (sec)")
+    define("output", default=Options['output'], help="Results file (JSON)")
+    define("port", default=Options['port'], help="Server port", type=int)
+    define("questions", default=Options['questions'], help="Number of questions", type=int)
+    define("ramp_sec", default=Options['ramp_sec'], help="Interval over which students join (sec)")
+    define("sample_interval", default=Options['sample_interval'], help="Interval for sampling memory and upstream stats (sec)")
+    define("seed", default=Options['seed'], help="Random seed", type=int)
+    define("server_args", default=Options['server_args'], help="Additional sdserver options (space-separated)")
+    define("sheets_port", default=Options['sheets_port'], help="sdsheets port", type=int)
+    define("students", default=Options['students'], help="Number of students", type=int)
+    define("think_max", default=Options['think_max'], help="Maximum think time per question (sec)")
+    define("think_min", default=Options['think_min'], help="Minimum think time per question (sec)")
+    define("timeout", default=Options['timeout'], help="Request timeout (sec)")
+    define("work_dir", default=Options['work_dir'], help="Work directory (default: temporary)")
+    define("ws_encoding", default=Options['ws_encoding'], help="WebSocket message encoding requested from server: json/msgpack")
+    parse_command_line()
+
+    for key in Options:
+        Options[key] = getattr(options, key)
+
+    Global.random.seed(Options['seed'])
+
+    if Options['ws_encoding'] not in ('json', 'msgpack'):
+        sys.exit('sdbench: Invalid --ws_encoding=%s; must be json or msgpack' % Options['ws_encoding'])
+    if Options['ws_encoding'] == 'msgpack' and not msgpack:
+        sys.exit('sdbench: msgpack module required for --ws_encoding=msgpack')
+
+    prevResults = None
+    if Options['compare']:
+        with open(Options['compare']) as f:
+            prevResults = json.load(f)
+
+    workDir = Options['work_dir'] or tempfile.mkdtemp(prefix='sdbench')
+    bench = Benchmark()
+    try:
+        setupServers(workDir)
+        IOLoop.current().run_sync(bench.run)
+    finally:
+        stopProcesses()
+        if not Options['work_dir'] and not Options['keep']:
+            shutil.rmtree(workDir, ignore_errors=True)
+        elif Options['keep']:
+            print('sdbench: Work directory', workDir, file=sys.stderr)
+
+    results = bench.results()
+    if Options['output']:
+        with open(Options['output'], 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    printResults(results, prevResults)
+
+if __name__ == '__main__':
+    main()
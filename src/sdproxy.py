@@ -23,6 +23,7 @@ import cStringIO
 import csv
 import datetime
 import functools
+import heapq
 import io
 import json
 import math
@@ -84,6 +85,7 @@ Settings = {
 
     'lock_proxy_url': '', # URL of proxy server to lock sheet (used to "safely" allow direct access to Google Sheets from an auxiliary server)
     'min_wait_sec': 0,    # Minimum time (sec) between successful Google Sheet requests
+    'max_wait_sec': 10,   # Maximum time (sec) to batch modifications before a Google Sheet request (adaptive)
 
     'request_timeout': 75,   # Proxy update request timeout (sec)
     }
@@ -96,7 +98,7 @@ COPY_FROM_CONFIG = ['gsheet_url', 'site_label', 'site_title', 'site_access',
     
 COPY_FROM_SERVER = ['auth_key', 'auth_type', 'site_name',  'server_url',
                     'debug', 'dry_run', 'email_addr', 'gapps_url', 'root_users',
-                    'lock_proxy_url', 'min_wait_sec', 'request_timeout',]
+                    'lock_proxy_url', 'min_wait_sec', 'max_wait_sec', 'request_timeout',]
 
 # Site access:
 #  adminonly: Only admin/grader has access
@@ -119,10 +121,18 @@ RETRY_MAX_COUNT = 5             # Maximum number of failed Google Sheet requests
 CACHE_HOLD_SEC = 3600           # Maximum time (sec) to hold sheet in cache
 MISS_RETRY_SEC = 1800           # Time period between attempts to access missed optional sheets
 TIMED_GRACE_SEC = 15            # Grace period for timed submissions (usually about 15 seconds)
+TIMED_TICK_SEC = 1              # Resolution of timed submission deadlines (expirations in the same tick are submitted together)
+PREFILL_SLICE_ROWS = 100        # Max. no. of session rows created per IOLoop callback when prefilling sessions
 
-PROXY_UPDATE_ROW_LIMIT = 200    # Max. no of rows per sheet, per proxy update request
+PROXY_UPDATE_ROW_LIMIT = 200    # Initial max. no of rows per sheet, per proxy update request (adapted within MIN/MAX)
 # (Set to 0 for no limit to update row count, approximating transactional behavior for databases,
 #  because remote cache updates occur between web requests, except when shutting down.)
+PROXY_UPDATE_ROW_MIN = 20       # Lower bound for adaptive row limit
+PROXY_UPDATE_ROW_MAX = 2000     # Upper bound for adaptive row limit
+PROXY_UPDATE_MAX_BYTES = 4000000 # Target max. size of proxy update request (bytes)
+PROXY_UPDATE_TARGET_FRAC = 0.25 # Target duration of proxy update request, as fraction of request_timeout
+PROXY_UPDATE_SMOOTHING = 0.3    # Weight of latest request in moving averages of latency and row size
+PROXY_UPDATE_DECISIONS = 10     # No. of recent scheduling decisions to report in cache status
 
 ADMIN_ROLE = 'admin'
 GRADER_ROLE = 'grader'
@@ -200,6 +210,9 @@ Sheet_cache = {}    # Cache of sheets
 Miss_cache = {}     # For optional sheets that are missing
 Lock_cache = {}     # Locked sheets
 Lock_passthru = defaultdict(int)  # Count of passthru
+Discuss_index = {}  # Parsed discussion posts: (sessionName, discussNum) -> {userId: [cellValue, parsedPosts]}
+Discuss_state = {}  # Parsed discussion state (read-only): sessionName -> [cellValue, discussState]
+Map_cache = {}      # Maps derived from sheet contents: sheetName -> [sheetVersion, {key: (keyVersion, map)}]
 
 Locked_proxy_sheets = set()  # Set of sheets locked on upstream proxy
 
@@ -211,6 +224,12 @@ Global.shuttingDown = False
 Global.updatePartial = UPDATE_PARTIAL_ROWS
 
 Global.displayNameMap = {}
+Global.displayNameVersion = 0
+
+Global.timedDeadlines = []     # Heap of [deadlineTick, sessionName, userId] for timed session submissions
+Global.timedDeadlineKeys = {}  # (sessionName, userId) -> deadlineTick (for discarding superseded heap entries)
+Global.timedTimeout = None     # [deadlineTick, IOLoop timeout handle] for earliest deadline
+Global.sheetVersion = 0
 
 Global.gradebookActive = False
 Global.accessCodeCallback = None
@@ -221,17 +240,28 @@ Global.discussPostCallback = None
 def mapDisplayName(userId, displayName):
     if displayName and (',' in displayName or userId not in Global.displayNameMap):
         # Comma-formatted names override
-        Global.displayNameMap[userId] = displayName
+        if Global.displayNameMap.get(userId) != displayName:
+            Global.displayNameMap[userId] = displayName
+            Global.displayNameVersion += 1
 
 def getDisplayNames(includeNonRoster=False):
     # Returns id->name mapping, sorted by name
-    rosterNameMap = lookupRoster('name')
-    if rosterNameMap is None and not includeNonRoster:
-        return None
-    nameMap = Global.displayNameMap.copy() if includeNonRoster else {}
-    if rosterNameMap:
-        nameMap.update(rosterNameMap)
-    return OrderedDict(sorted(nameMap.items(), key=lambda x:x[1]))
+    # (Sorted mapping is cached until the roster, or non-roster display names, are modified)
+    def makeNameMap():
+        rosterNameMap = lookupRoster('name', shared=True)
+        if rosterNameMap is None and not includeNonRoster:
+            return None
+        nameMap = Global.displayNameMap.copy() if includeNonRoster else {}
+        if rosterNameMap:
+            nameMap.update(rosterNameMap)
+        return OrderedDict(sorted(nameMap.items(), key=lambda x:x[1]))
+
+    rosterSheet = getSheet(ROSTER_SHEET)
+    if not rosterSheet:
+        return makeNameMap()
+
+    nameMap = sheetMap(rosterSheet, ('displayNames', includeNonRoster), makeNameMap, keyVersion=Global.displayNameVersion if includeNonRoster else None)
+    return None if nameMap is None else OrderedDict(nameMap)
 
 
 def initProxy(gradebookActive=False, accessCodeCallback=None, teamSetupCallback=None, discussPostCallback=None):
@@ -262,10 +292,13 @@ def split_list(list_str, sep=',', lower=False, keep_null=False):
 def delSheet(sheetName, deleteRemote=False):
     Sheet.relateSheet(sheetName, remove=True)
 
-    for cache in (Sheet_cache, Miss_cache, Lock_cache, Lock_passthru):
+    for cache in (Sheet_cache, Miss_cache, Lock_cache, Lock_passthru, Map_cache):
         if sheetName in cache:
             del cache[sheetName]
 
+    if sheetName.endswith('_discuss'):
+        clearDiscussIndex(sheetName[:-len('_discuss')])
+
     if deleteRemote:
         if Settings['dry_run']:
             Global.dryDeletedSheets.add(sheetName)
@@ -285,6 +318,9 @@ def initCache():
     Miss_cache.clear()
     Lock_cache.clear()
     Lock_passthru.clear()
+    Discuss_index.clear()
+    Discuss_state.clear()
+    Map_cache.clear()
 
     Global.httpRequestId = ''
     Global.notifiedAdmin = ''
@@ -301,9 +337,17 @@ def initCache():
 
     Global.cachePendingUpdate = None
     Global.suspended = ''
+
+    # Adaptive update scheduling
+    Global.flushWindowSec = 0
+    Global.flushRowLimit = PROXY_UPDATE_ROW_LIMIT
+    Global.flushLatencySec = 0
+    Global.flushRowBytes = 0
+    Global.flushDecisions = []
     Global.previewStatus = {}
 
     Global.transactSessions = {}
+    Global.prefilledSessions = set()
 
 initCache()
 
@@ -378,7 +422,7 @@ def startPreview(sessionName, rollingOver=False):
         del Miss_cache[sessionName]
     sessionSheet = Sheet_cache.get(sessionName)
     if sessionSheet:
-        if sessionSheet.get_updates() is not None:
+        if sessionSheet.has_updates():
             if Global.cacheUpdateError:
                 return 'Cache update error (%s); need to restart server' % Global.cacheUpdateError
             return 'PENDING:Pending updates for session %s; retry preview after about 5 seconds (reqid=%s)' % (sessionName, Global.httpRequestId)
@@ -387,7 +431,7 @@ def startPreview(sessionName, rollingOver=False):
 
     indexSheet = Sheet_cache.get(INDEX_SHEET)
     if indexSheet:
-        if indexSheet.get_updates() is not None and not rollingOver:
+        if indexSheet.has_updates() and not rollingOver:
             return 'PENDING:Pending updates for sheet '+INDEX_SHEET+'; retry preview after about 5 seconds'
     else:
         indexSheet = getSheet(INDEX_SHEET)
@@ -731,6 +775,7 @@ class Sheet(object):
         self.keyHeader = keyHeader
         self.deletedRowCount = deletedRowCount
         self.modTime = modTime
+        self.newVersion()
         self.accessTime = sliauth.epoch_ms() if accessTime is None else accessTime
         self.relatedSheets = relatedSheets[:]
 
@@ -777,6 +822,9 @@ class Sheet(object):
                 key = row[self.keyCol-1] if self.keyCol else j+2+self.deletedRowCount
                 self.keyMap[key] = [modTime, inserted, set()]  # [modTime, insertedFlag, modColsSet]
 
+        # Keys of inserted/modified rows (maintained by mutation methods, for O(1) pending update checks)
+        self.dirtyKeys = set(k for k, v in self.keyMap.items() if k and (v[1] or v[2]))
+
         if self.keyCol and 1+len(self.keyMap) != len(self.xrows):
             raise Exception('Duplicate key in initial rows for sheet %s: %s' % (self.name, [x[self.keyCol-1] for x in self.xrows[1:]]))
 
@@ -806,7 +854,8 @@ class Sheet(object):
                     self.totalCols.append(j+totalCol+1)
             self.totalColSet = set(self.totalCols)
 
-    def update_total(self, rowNum):
+    def update_total(self, rowNum, delayMods=False):
+        # If delayMods, sheet mod time is not updated (caller must call modifiedSheet)
         totalCol = self.totalCols[0]
         row = self.xrows[rowNum-1]     # Not a copy!
 
@@ -832,8 +881,10 @@ class Sheet(object):
         if not self.keyMap[key][1]:
             # Not inserted row; mark total column as modified
             self.keyMap[key][2].add(totalCol)
+            self.markDirty(key)
         self.keyMap[key][0] = modTime
-        self.modifiedSheet(modTime)
+        if not delayMods:
+            self.modifiedSheet(modTime)
         return True
 
     def copy(self):
@@ -914,6 +965,7 @@ class Sheet(object):
         self.check_lock_status(keyValue)
         del self.xrows[rowNum-1]
         del self.keyMap[keyValue]
+        self.dirtyKeys.discard(keyValue)
         self.modifiedSheet()
 
     def deleteRows(self, startRow, nRows):
@@ -928,6 +980,7 @@ class Sheet(object):
         for j in range(nRows):
             key = 2+self.deletedRowCount
             del self.keyMap[key]
+            self.dirtyKeys.discard(key)
             self.deletedRowCount += 1
         self.modifiedSheet()
 
@@ -950,8 +1003,10 @@ class Sheet(object):
                 raise Exception('Duplicate key %s for row insertion in sheet %s' % (keyValue, self.name))
             newRow[self.keyCol-1] = keyValue
             self.keyMap[keyValue] = [modTime, 1, set()]
+            self.markDirty(keyValue)
         else:
             self.keyMap[rowNum+self.deletedRowCount] = [modTime, 1, set()]
+            self.markDirty(rowNum+self.deletedRowCount)
 
         if self.totalCols:
             newRow[self.totalCols[0]-1] = 0
@@ -959,6 +1014,83 @@ class Sheet(object):
         self.xrows.insert(rowNum-1, newRow)
         self.modifiedSheet(modTime)
 
+    def importRows(self, rows, sortCols=[]):
+        # Insert new rows and update existing rows (matched by key) as a single modification, recomputing totals once
+        # New rows are inserted in sorted order of sortCols values (as in locateNewRow), or appended if sortCols is empty
+        # Returns list of keys of inserted rows
+        if not self.keyHeader:
+            raise Exception('Cannot import rows for non-keyed spreadsheet '+self.name)
+        self.check_lock_status()
+
+        rowIndex = dict((row[self.keyCol-1], j) for j, row in enumerate(self.xrows[1:]))
+        newRows = []
+        modRows = []
+        newKeys = set()
+        for rowValues in rows:
+            if len(rowValues) != self.nCols:
+                raise Exception('Incorrect number of cols in imported row for sheet %s: expected %d but found %d' % (self.name, self.nCols, len(rowValues)))
+            keyValue = rowValues[self.keyCol-1]
+            if not keyValue or keyValue in newKeys:
+                raise Exception('Null or duplicate key %s for row import in sheet %s' % (keyValue, self.name))
+            newKeys.add(keyValue)
+            if keyValue in rowIndex:
+                modRows.append( (rowIndex[keyValue], rowValues[:]) )
+            else:
+                newRows.append(rowValues[:])
+
+        modTime = sliauth.epoch_ms()
+        for j, rowValues in modRows:
+            keyValue = rowValues[self.keyCol-1]
+            if not self.keyMap[keyValue][1]:
+                # Not inserted row; keep track of which columns are being updated
+                oldValues = self.xrows[j+1]
+                for icol in range(self.nCols):
+                    oldValue, newValue = oldValues[icol], rowValues[icol]
+                    if isinstance(newValue, datetime.datetime) and isinstance(oldValue, datetime.datetime):
+                        isEqual = (sliauth.iso_date(newValue, nosubsec=True) == sliauth.iso_date(oldValue, nosubsec=True))
+                    else:
+                        isEqual = (newValue == oldValue)
+                    if not isEqual:
+                        self.keyMap[keyValue][2].add(icol+1)
+                if not self.keyMap[keyValue][2]:
+                    continue
+                self.markDirty(keyValue)
+            self.keyMap[keyValue][0] = modTime
+            self.xrows[j+1] = rowValues
+
+        for rowValues in newRows:
+            keyValue = rowValues[self.keyCol-1]
+            self.keyMap[keyValue] = [modTime, 1, set()]
+            self.markDirty(keyValue)
+
+        if sortCols:
+            # Merge sorted new rows with existing rows (each new row is inserted before the first existing row that sorts after it)
+            sortKey = lambda row: [row[col-1] for col in sortCols]
+            newRows.sort(key=sortKey)
+            oldRows = self.xrows[1:]
+            mergedRows = []
+            k = 0
+            for rowValues in newRows:
+                newSortKey = sortKey(rowValues)
+                while k < len(oldRows) and not (sortKey(oldRows[k]) > newSortKey):
+                    mergedRows.append(oldRows[k])
+                    k += 1
+                mergedRows.append(rowValues)
+            self.xrows[1:] = mergedRows + oldRows[k:]
+        else:
+            self.xrows += newRows
+
+        if self.totalCols:
+            totalsModified = False
+            for rowNum in range(2, len(self.xrows)+1):
+                if self.update_total(rowNum, delayMods=True):
+                    totalsModified = True
+            if totalsModified:
+                refreshGradebook(self.name)
+
+        self.modifiedSheet(modTime)
+        return [row[self.keyCol-1] for row in newRows]
+
     def appendColumns(self, headers):
         self.check_lock_status()
         if self.modifiedHeaders:
@@ -979,6 +1111,7 @@ class Sheet(object):
             raise Exception('Cannot trim columns now while updating sheet '+self.name)
 
         modTime = sliauth.epoch_ms()
+        self.newVersion()
         self.nCols -= ncols
         trimmedCols = set( range(self.nCols+1, self.nCols+ncols+1) )
         self.xrows[0] = self.xrows[0][:-ncols]
@@ -988,6 +1121,8 @@ class Sheet(object):
                 key = self.xrows[j][self.keyCol-1] if self.keyCol else j+1+self.deletedRowCount
                 if self.keyMap[key][2]:
                     self.keyMap[key][2].difference_update(trimmedCols)
+                    if not self.keyMap[key][1] and not self.keyMap[key][2]:
+                        self.dirtyKeys.discard(key)
 
         if delayMods:
             return
@@ -1105,6 +1240,7 @@ class Sheet(object):
                         updateSheet = True
                         diffCol = icol+colMin
                         self.keyMap[keyValue][2].add(diffCol)
+                        self.markDirty(keyValue)
                         if diffCol in self.totalColSet:
                             # Column affecting total being updated
                             updateTotal = True
@@ -1121,9 +1257,42 @@ class Sheet(object):
         if modTime:
             self.modifiedSheet(modTime)
 
+    def markDirty(self, key):
+        if key:  # Non-key rows are never updated
+            self.dirtyKeys.add(key)
+
+    def has_updates(self):
+        # Returns True if get_updates() would return pending updates (O(1), without building the update payload)
+        if self.readOnly:
+            return False
+
+        if Global.previewStatus and self.name in (INDEX_SHEET, Global.previewStatus['sessionName']):
+            origSheet = Global.previewStatus['indexSheetOrig' if self.name == INDEX_SHEET else 'sessionSheetOrig']
+            if not origSheet:
+                return False
+            if origSheet is not self:
+                return origSheet.has_updates()
+
+        if self.name in Global.transactSessions:
+            origSheet = Global.transactSessions[self.name]
+            if origSheet is not self:
+                return origSheet.has_updates()
+
+        return bool(self.dirtyKeys or any(self.actionsRequested) or self.modifiedHeaders or (self.modTime and self.modTime >= Global.cacheUpdateTime))
+
+    def dirty_count(self):
+        # Returns no. of inserted/modified rows pending update
+        return len(self.dirtyKeys)
+
+    def newVersion(self):
+        # Version numbers are unique across sheet objects (used to invalidate maps derived from sheet contents)
+        Global.sheetVersion += 1
+        self.version = Global.sheetVersion
+
     def modifiedSheet(self, modTime=None):
         self.modTime = sliauth.epoch_ms() if modTime is None else modTime
         self.accessTime = self.modTime
+        self.newVersion()
         schedule_update()
 
     def get_updates(self, row_limit=None):
@@ -1244,6 +1413,7 @@ class Sheet(object):
             key = row[self.keyCol-1] if self.keyCol else j+2+self.deletedRowCount
             if self.keyMap[key][1] or self.keyMap[key][2]:
                 self.keyMap[key][1:3] = [0, set()]
+        self.dirtyKeys.clear()
 
     def complete_update(self, updateRows, updateParams):
         # Update sheet status after remote update has completed
@@ -1268,6 +1438,7 @@ class Sheet(object):
                     # Row update completed for row not modified since update
                     # (Note: Rows that were not updated due request limits being reached will not be subject to this reset)
                     self.keyMap[key][1:3] = [0, set()]
+                    self.dirtyKeys.discard(key)
                 elif not self.keyCol:
                     # Non-keyed row has been inserted, but modified later
                     self.keyMap[key][1:3] = [0, set(range(1,self.nCols+1))]
@@ -1309,6 +1480,11 @@ def getCacheStatus():
     out += '  Average update time = %.2fs\n\n' % (Global.totalCacheResponseInterval/(1000*max(1,Global.totalCacheResponseCount)) )
     out += '  Average request bytes = %d\n\n' % (Global.totalCacheRequestBytes/max(1,Global.totalCacheResponseCount) )
     out += '  Average response bytes = %d\n\n' % (Global.totalCacheResponseBytes/max(1,Global.totalCacheResponseCount) )
+    out += '  Update window = %.1fs (%s-%ss), row limit = %s (%d-%d), latency = %.2fs, bytes/row = %d\n' % (flush_window(), Settings['min_wait_sec'], Settings['max_wait_sec'],
+                                               Global.flushRowLimit or 'none', PROXY_UPDATE_ROW_MIN, PROXY_UPDATE_ROW_MAX, Global.flushLatencySec, Global.flushRowBytes)
+    for decision in reversed(Global.flushDecisions):
+        out += '    %s: rows=%d, bytes=%d, latency=%.2fs, backlog=%d => window=%.1fs, row limit=%s (%s)\n' % tuple(decision)
+    out += '\n'
     curTime = sliauth.epoch_ms()
     sitePrefix = Settings['site_name']+'/' if Settings['site_name'] else ''
     keys = list( set(Sheet_cache.keys() + Lock_cache.keys()) )
@@ -1317,7 +1493,7 @@ def getCacheStatus():
         sheetStr = ''
         sheet = Sheet_cache.get(sheetName)
         if sheetName in Lock_cache:
-            if sheet and sheet.get_updates() is not None:
+            if sheet and sheet.has_updates():
                 sheetStr = sheetName+' (locking...)'
             else:
                 action = 'unlock'
@@ -1332,12 +1508,10 @@ def getCacheStatus():
             if sheet.modTime:
                 accessTime += '/modified:'+str(int((curTime-sheet.modTime)/1000.))+'s'
 
-            if Settings['debug']:
-                updates = sheet.get_updates(row_limit=PROXY_UPDATE_ROW_LIMIT)
-                if updates:
-                    updateStr = '['+','.join(sorted(updates[0].keys()))+']'
-                else:
-                    updateStr = '[no pending updates]'
+            if sheet.has_updates():
+                updateStr = '[%d modified rows pending]' % sheet.dirty_count()
+            elif Settings['debug']:
+                updateStr = '[no pending updates]'
         else:
             accessTime = '(not cached)'
 
@@ -1357,7 +1531,7 @@ def lockSheet(sheetName, lockType='user'):
         return False
     if sheetName not in Lock_cache and not isReadOnly(sheetName):
         Lock_cache[sheetName] = lockType
-    if sheetName in Sheet_cache and Sheet_cache[sheetName].get_updates() is not None:
+    if sheetName in Sheet_cache and Sheet_cache[sheetName].has_updates():
         return False
     return True
 
@@ -1365,7 +1539,7 @@ def unlockSheet(sheetName):
     # Unlock and refresh sheet (if no updates pending)
     if previewOrTransactionalSession(sheetName):
         return False
-    if sheetName in Sheet_cache and Sheet_cache[sheetName].get_updates() is not None:
+    if sheetName in Sheet_cache and Sheet_cache[sheetName].has_updates():
         return False
     delSheet(sheetName)
     return True
@@ -1387,7 +1561,7 @@ def refreshSheet(sheetName):
     sheet = Sheet_cache.get(sheetName)
     if not sheet:
         return True
-    if sheet.get_updates() is None:
+    if not sheet.has_updates():
         delSheet(sheetName)
     else:
         sheet.expire()
@@ -1426,7 +1600,7 @@ def get_locked():
     # Return list of locked sheet name (* if updates not yet send to Google sheets)
     locked = []
     for sheetName in Lock_cache:
-        if sheetName in Sheet_cache and Sheet_cache[sheetName].get_updates() is not None:
+        if sheetName in Sheet_cache and Sheet_cache[sheetName].has_updates():
             locked.append(sheetName+'*')
         else:
             locked.append(sheetName)
@@ -1545,9 +1719,62 @@ def updates_current():
             Global.shuttingDown = True
             IOLoop.current().add_callback(shutdown_loop)
 
+def flush_window():
+    # Current update batch window (sec), within configured bounds
+    return max(Settings['min_wait_sec'], min(Settings['max_wait_sec'], Global.flushWindowSec))
+
+def adapt_flush(latencySec, rowCount, nBytes, incomplete, backlog=0, error=''):
+    # Adapt update batch window and row limit, after each proxy update request
+    # backlog: no. of modified rows still pending after the request
+    # Row limit: grow while backlog remains and requests are fast; shrink for slow, large or failed requests
+    # Window: flush promptly when backlog remains; otherwise batch small updates for about one upstream latency
+    targetSec = PROXY_UPDATE_TARGET_FRAC * Settings['request_timeout']
+    rowLimit = Global.flushRowLimit
+    if error:
+        reason = 'error'
+        if rowLimit and error.lower().find('timeout') >= 0:
+            reason = 'timeout'
+            rowLimit = rowLimit // 2
+    else:
+        alpha = PROXY_UPDATE_SMOOTHING
+        Global.flushLatencySec = latencySec if not Global.flushLatencySec else (1-alpha)*Global.flushLatencySec + alpha*latencySec
+        if rowCount:
+            rowBytes = nBytes / float(rowCount)
+            Global.flushRowBytes = rowBytes if not Global.flushRowBytes else (1-alpha)*Global.flushRowBytes + alpha*rowBytes
+
+        reason = 'backlog' if incomplete else 'idle'
+        if rowLimit:
+            if latencySec > targetSec:
+                reason = 'slow'
+                rowLimit = int(rowLimit * targetSec / latencySec)
+            elif incomplete and latencySec < 0.5*targetSec:
+                rowLimit = 2 * rowLimit
+            if Global.flushRowBytes and rowLimit*Global.flushRowBytes > PROXY_UPDATE_MAX_BYTES:
+                reason = 'large'
+                rowLimit = int(PROXY_UPDATE_MAX_BYTES / Global.flushRowBytes)
+
+    if rowLimit:
+        Global.flushRowLimit = max(PROXY_UPDATE_ROW_MIN, min(PROXY_UPDATE_ROW_MAX, rowLimit))
+
+    if incomplete or error:
+        Global.flushWindowSec = 0
+    else:
+        fill = min(1.0, max(rowCount, backlog) / float(Global.flushRowLimit)) if Global.flushRowLimit else 0.0
+        Global.flushWindowSec = Global.flushLatencySec * (1.0 - fill)
+
+    Global.flushDecisions.append([sliauth.iso_date(nosubsec=True), rowCount, nBytes, latencySec, backlog, flush_window(), Global.flushRowLimit or 'none', reason])
+    if len(Global.flushDecisions) > PROXY_UPDATE_DECISIONS:
+        Global.flushDecisions.pop(0)
+
+    if Settings['debug']:
+        print("adapt_flush: rows=%d, bytes=%d, latency=%.2fs, incomplete=%s, backlog=%d, error=%s => window=%.1fs, row_limit=%s" % (rowCount, nBytes, latencySec, incomplete, backlog, bool(error), flush_window(), Global.flushRowLimit), file=sys.stderr)
+
 def update_remote_sheets(force=False, synchronous=False):
     # If force, do not enforce minimum time delay restriction
     # If synchronous, wait for update to complete before returning
+    if not synchronous:
+        # Scheduled update has fired
+        Global.cachePendingUpdate = None
     if synchronous and previewingSession():
         sheet_proxy_error('update_remote_sheets: Exit preview session %s before synchronous updates' % previewingSession())
         return
@@ -1567,8 +1794,10 @@ def update_remote_sheets_aux(force=False, synchronous=False):
         return
 
     curTime = sliauth.epoch_ms()
-    if not force and not synchronous and (curTime - Global.cacheResponseTime) < 1000*Settings['min_wait_sec']:
-        schedule_update(waitSec=curTime-Global.cacheResponseTime)
+    waitMs = 1000*flush_window() - (curTime - Global.cacheResponseTime)
+    if not force and not synchronous and waitMs > 0:
+        # Batch modifications until update window has elapsed
+        schedule_update(waitSec=waitMs/1000.)
         return
 
     specialMods = []
@@ -1576,7 +1805,7 @@ def update_remote_sheets_aux(force=False, synchronous=False):
     sheetUpdateInfo = {}
     for sheetName, sheet in Sheet_cache.items():
         # Check each cached sheet for updates
-        updates = sheet.get_updates(row_limit=PROXY_UPDATE_ROW_LIMIT)
+        updates = sheet.get_updates(row_limit=Global.flushRowLimit) if sheet.has_updates() else None
         if updates is None:
             previewSession = previewingSession()
             if curTime-sheet.accessTime > 1000*sheet.holdSec and sheetName not in Lock_cache and sheetName not in Global.transactSessions and (not previewSession or sheetName not in (INDEX_SHEET, previewSession)):
@@ -1659,6 +1888,10 @@ class ProxyUpdater(object):
         self.cacheRetryCount = 0
         self.cacheWaitTime = 0
 
+        # For adaptive scheduling
+        self.rowCount = sum(len(info[0]) for info in sheetUpdateInfo.values())
+        self.incompleteUpdate = any(info[1].get('incompleteUpdate') for info in sheetUpdateInfo.values())
+
     def update(self, curTime):
         Global.httpRequestId = self.requestId
         self.cacheRequestTime = curTime
@@ -1732,6 +1965,7 @@ class ProxyUpdater(object):
             self.cacheRetryCount += 1
             self.cacheWaitTime += retry_after
             Global.totalCacheRetryCount += 1
+            adapt_flush((sliauth.epoch_ms() - self.cacheRequestTime)/1000., self.rowCount, len(self.json_data), self.incompleteUpdate, error=errMsg)
 
             print("ProxyUpdater.handle_proxy_response_aux: %s Update ERROR (tries %d of %d; retry_after=%ss): %s" % (Settings['site_name'], self.cacheRetryCount, RETRY_MAX_COUNT, self.cacheWaitTime, errMsg), file=sys.stderr)
 
@@ -1776,6 +2010,9 @@ class ProxyUpdater(object):
                 # Refresh expired sheet
                 refreshNeeded.append(sheetName)
 
+        backlog = sum(sheet.dirty_count() for sheet in Sheet_cache.values())
+        adapt_flush((Global.cacheResponseTime - self.cacheRequestTime)/1000., self.rowCount, len(self.json_data), self.incompleteUpdate, backlog=backlog)
+
         for sheetName in respObj['info'].get('refreshSheets',[]):
             refreshNeeded.append(sheetName)
             refreshSheet(sheetName)
@@ -1793,7 +2030,7 @@ class ProxyUpdater(object):
         ##if Settings['debug']:
         ##    print("ProxyUpdater.handle_proxy_response_aux: UPDATED", sliauth.iso_date(nosubsec=True), file=sys.stderr)
 
-        next_cache_update(0 if (refreshNeeded or Global.suspended) else Settings['min_wait_sec'])
+        next_cache_update(0 if (refreshNeeded or Global.suspended) else flush_window())
 
 def next_cache_update(waitSec=0, resetError=False):
     if resetError:
@@ -2890,7 +3127,7 @@ def sheetAction(params, notrace=False):
                         timedSecLeft = timedSec - (curTime - sliauth.epoch_ms(initTime))/1000.
                     else:
                         timedSecLeft = timedSec
-                        IOLoop.current().call_later(timedSecLeft+TIMED_GRACE_SEC+5, submit_timed_session, userId, sheetName)
+                        schedule_timed_submit(userId, sheetName, timedSecLeft+TIMED_GRACE_SEC+5)
                     if timedSecLeft >= 1:
                         if not prevSubmitted:
                             returnInfo['timedSecLeft'] = int(timedSecLeft)
@@ -3284,24 +3521,68 @@ def recomputeUserScores(columnHeaders, rowValues, questions, sessionAttributes):
         return tallyScores(questions, savedSession.get('questionsAttempted'), savedSession.get('hintsUsed'), sessionAttributes.get('params'), sessionAttributes.get('remoteAnswers'))
     return None
 
-def submit_timed_session(userId, sessionName):
+def schedule_timed_submit(userId, sessionName, delaySec):
+    # Schedule submission of timed session for user after delaySec (rounded up to the next tick)
+    # (A single IOLoop timeout is maintained for the earliest deadline, rather than a timeout per user)
+    deadlineTick = int(math.ceil((time.time()+delaySec)/TIMED_TICK_SEC))
+    Global.timedDeadlineKeys[(sessionName, userId)] = deadlineTick
+    heapq.heappush(Global.timedDeadlines, [deadlineTick, sessionName, userId])
+    schedule_timed_timeout()
+
+def schedule_timed_timeout():
+    if not Global.timedDeadlines:
+        return
+    deadlineTick = Global.timedDeadlines[0][0]
+    if Global.timedTimeout:
+        if Global.timedTimeout[0] <= deadlineTick:
+            # Earlier (or same) deadline already scheduled
+            return
+        IOLoop.current().remove_timeout(Global.timedTimeout[1])
+    # (IOLoop.call_at uses the loop's clock, which may be monotonic rather than wall-clock time, so schedule relative to now)
+    Global.timedTimeout = [deadlineTick, IOLoop.current().call_later(max(0, deadlineTick*TIMED_TICK_SEC - time.time()), process_timed_deadlines)]
+
+def process_timed_deadlines():
+    # Submit all timed sessions with expired deadlines, batched by session
+    Global.timedTimeout = None
+    curTick = int(math.floor(time.time()/TIMED_TICK_SEC))
+    expired = defaultdict(list)
+    while Global.timedDeadlines and Global.timedDeadlines[0][0] <= curTick:
+        deadlineTick, sessionName, userId = heapq.heappop(Global.timedDeadlines)
+        if Global.timedDeadlineKeys.get((sessionName, userId)) != deadlineTick:
+            # Superseded deadline
+            continue
+        del Global.timedDeadlineKeys[(sessionName, userId)]
+        expired[sessionName].append(userId)
+
+    for sessionName, userIds in expired.items():
+        try:
+            submit_timed_sessions(sessionName, userIds)
+        except Exception, excp:
+            print('sdproxy: process_timed_deadlines ERROR %s %s: %s' % (sessionName, userIds, excp), file=sys.stderr)
+
+    schedule_timed_timeout()
+
+def submit_timed_sessions(sessionName, userIds):
     sessionSheet = getSheet(sessionName)
     if not sessionSheet:
         return
-    userRow = lookupRowIndex(userId, sessionSheet)
-    if not userRow:
-        return
     columnIndex = indexColumns(sessionSheet)
     submitTimestampCol = columnIndex.get('submitTimestamp')
-    submittedRange = sessionSheet.getRange(userRow, submitTimestampCol, 1, 1)
-    if submittedRange.getValues()[0][0]:
-        return
+    idRowIndex = indexRows(sessionSheet, columnIndex['id'])
+    submitDate = createDate()
+    for userId in userIds:
+        userRow = idRowIndex.get(userId)
+        if not userRow:
+            continue
+        submittedRange = sessionSheet.getRange(userRow, submitTimestampCol, 1, 1)
+        if submittedRange.getValues()[0][0]:
+            continue
 
-    # Submit session for user
-    submittedRange.setValues([[ createDate() ]])
+        # Submit session for user
+        submittedRange.setValues([[ submitDate ]])
 
-    if Settings['debug']:
-        print("DEBUG: submit_timed_session: SUBMITTED", userId, sessionName, file=sys.stderr)
+        if Settings['debug']:
+            print("DEBUG: submit_timed_session: SUBMITTED", userId, sessionName, file=sys.stderr)
 
 def adminPacedUpdate(sheetName, modSheet, numStickyRows, submitTimestamp):
     # Use test user submission time as due date for admin-paced sessions
@@ -3351,7 +3632,13 @@ def getRosterEntry(userId):
         return TESTUSER_ROSTER
     try:
         # Copy user info from roster
-        return lookupValues(userId, TESTUSER_ROSTER.keys(), ROSTER_SHEET, False, True)
+        rosterSheet = getSheet(ROSTER_SHEET)
+        if not rosterSheet:
+            raise Exception('Roster sheet not found')
+        rosterEntries = sheetMap(rosterSheet, 'rosterEntries', dict)
+        if userId not in rosterEntries:
+            rosterEntries[userId] = lookupValues(userId, TESTUSER_ROSTER.keys(), ROSTER_SHEET, False, True)
+        return rosterEntries[userId].copy()
     except Exception, err:
         if isSpecialUser(userId):
             return {'name': '#'+userId+', '+userId, 'id': userId}
@@ -3674,7 +3961,13 @@ def updateUserRow(sessionName, headers, updateObj, opts={}, notrace=False):
 def makeRosterMap(colName, lowercase=False, unique=False):
     # Return map of other IDs from colName to roster ID
     # If unique, raise exception for duplicated values in colName
-    colValues = lookupRoster(colName) or {}
+    rosterSheet = getSheet(ROSTER_SHEET)
+    if not rosterSheet:
+        return OrderedDict()
+    return OrderedDict(sheetMap(rosterSheet, ('rosterMap', colName, lowercase, unique), lambda: _makeRosterMap(colName, lowercase, unique)))
+
+def _makeRosterMap(colName, lowercase, unique):
+    colValues = lookupRoster(colName, shared=True) or {}
     rosterMap = OrderedDict()
     for userId, otherIds in colValues.items():
         if colName == 'name':
@@ -3984,17 +4277,12 @@ def deleteSlide(sessionName, slideNumber):
     return delete_qno
 
 
-def importUserAnswers(sessionName, userId, displayName='', answers={}, submitDate=None, source=''):
-    # answers = {1:{'response':, 'explain':},...}
-    # If source == "prefill", only row creation occurs
-    if Settings['debug']:
-        print("DEBUG:importUserAnswers", userId, displayName, sessionName, len(answers), submitDate, file=sys.stderr)
+def getImportEntries(sessionName, submitDate=None, source=''):
+    # Return (validated) session parameters for importing user answers
     if not getSheet(sessionName):
         raise Exception('Session '+sessionName+' not found')
-    sessionEntries = lookupValues(sessionName, ['dueDate', 'paceLevel', 'adminPaced', 'attributes'], INDEX_SHEET)
+    sessionEntries = lookupValues(sessionName, ['dueDate', 'gradeDate', 'paceLevel', 'adminPaced', 'scoreWeight', 'fieldsMin', 'questions', 'attributes'], INDEX_SHEET)
     dueDate = sessionEntries.get('dueDate')
-    paceLevel = sessionEntries.get('paceLevel')
-    adminPaced = sessionEntries.get('adminPaced')
     sessionAttributes = json.loads(sessionEntries['attributes'])
     timedSec = sessionAttributes['params'].get('timedSec')
     if timedSec and source == "prefill":
@@ -4007,14 +4295,20 @@ def importUserAnswers(sessionName, userId, displayName='', answers={}, submitDat
         # Check that it is a valid date
         createDate(submitDate)
 
-    create = source or 'import'
-    retval = getUserRow(sessionName, userId, displayName, {'admin': ADMINUSER_ID, 'import': '1', 'create': create, 'getheaders': '1'}, notrace=True)
-    if retval['result'] != 'success':
-	    raise Exception('Error in creating session for user '+userId+': '+retval.get('error'))
-    if source == "prefill":
-        return
-    headers = retval['headers']
-    rowValues = retval['value']
+    computeTotalScore = False
+    if parseNumber(sessionEntries.get('scoreWeight')):
+        # (See sheetAction)
+        if sessionAttributes['params']['features'].get('delay_answers') or sessionAttributes['params']['features'].get('remote_answers'):
+            computeTotalScore = sessionEntries.get('gradeDate')
+        else:
+            computeTotalScore = True
+
+    return {'paceLevel': sessionEntries.get('paceLevel'), 'adminPaced': sessionEntries.get('adminPaced'), 'dueDate': dueDate,
+            'fieldsMin': sessionEntries.get('fieldsMin'), 'questions': json.loads(sessionEntries['questions']),
+            'sessionAttributes': sessionAttributes, 'computeTotalScore': computeTotalScore, 'submitDate': submitDate}
+
+def setImportAnswers(userId, headers, rowValues, answers):
+    # Copy imported answers = {1:{'response':, 'explain':, 'grade':},...} to row values (including session_hidden)
     headerCols = dict((hdr, j+1) for j, hdr in enumerate(headers))
     sessionCol = headerCols['session_hidden']
     session = loadSession(rowValues[sessionCol-1])
@@ -4051,6 +4345,30 @@ def importUserAnswers(sessionName, userId, displayName='', answers={}, submitDat
             rowValues[headerCols[q_grade]-1] = answer['grade']
 
     rowValues[sessionCol-1] = sliauth.ordered_stringify(session)
+
+def importUserAnswers(sessionName, userId, displayName='', answers={}, submitDate=None, source=''):
+    # answers = {1:{'response':, 'explain':},...}
+    # If source == "prefill", only row creation occurs
+    # (For bulk imports, use importSessionAnswers)
+    if Settings['debug']:
+        print("DEBUG:importUserAnswers", userId, displayName, sessionName, len(answers), submitDate, file=sys.stderr)
+    importEntries = getImportEntries(sessionName, submitDate, source)
+    paceLevel = importEntries['paceLevel']
+    adminPaced = importEntries['adminPaced']
+    sessionAttributes = importEntries['sessionAttributes']
+    submitDate = importEntries['submitDate']
+
+    create = source or 'import'
+    retval = getUserRow(sessionName, userId, displayName, {'admin': ADMINUSER_ID, 'import': '1', 'create': create, 'getheaders': '1'}, notrace=True)
+    if retval['result'] != 'success':
+	    raise Exception('Error in creating session for user '+userId+': '+retval.get('error'))
+    if source == "prefill":
+        return
+    headers = retval['headers']
+    rowValues = retval['value']
+    headerCols = dict((hdr, j+1) for j, hdr in enumerate(headers))
+    setImportAnswers(userId, headers, rowValues, answers)
+
     for j, header in enumerate(headers):
         if header.endswith('Timestamp'):
             rowValues[j] = None             # Do not modify (most) timestamps
@@ -4083,6 +4401,166 @@ def importUserAnswers(sessionName, userId, displayName='', answers={}, submitDat
         if retval['result'] != 'success':
             raise Exception('Error in submitting imported session for user '+userId+': '+retval.get('error'))
 
+def importSessionAnswers(sessionName, userAnswers, submitDate=None, source='import'):
+    # Bulk import of user answers: userAnswers = [(userId, displayName, answers), ...]
+    # Session parameters are validated once, and all row values are computed (as for importUserAnswers) before
+    # the session sheet is modified. New rows are then inserted, and existing rows updated, as a single sheet
+    # modification (see Sheet.importRows), with totals recomputed once; i.e., no rows are imported on error
+    # If source == "prefill", only rows for new users are created
+    # Returns summary dict
+    startTime = time.time()
+    if Global.cacheUpdateError:
+        raise Exception('All sessions are frozen due to cache update error: '+Global.cacheUpdateError)
+    if not Settings['site_access'] and Settings['end_date'] and sliauth.epoch_ms() > sliauth.epoch_ms(Settings['end_date']):
+        raise Exception('Cannot modify expired site '+Settings['site_name'])
+    if transactionalSession(sessionName):
+        raise Exception('Cannot import when transacting session '+sessionName)
+
+    importEntries = getImportEntries(sessionName, submitDate, source)
+    paceLevel = importEntries['paceLevel']
+    adminPaced = importEntries['adminPaced']
+    sessionAttributes = importEntries['sessionAttributes']
+    questions = importEntries['questions']
+    submitDate = createDate(importEntries['submitDate']) if importEntries['submitDate'] else None
+    pacedSlides = sessionAttributes['params']['pacedSlides']
+    sessionTeam = sessionAttributes.get('sessionTeam')
+
+    modSheet = getSheet(sessionName)
+    headers = modSheet.getHeaders()
+    headerCols = dict((hdr, j+1) for j, hdr in enumerate(headers))
+    teamCol = headerCols.get('team')
+    scoresCol = headerCols.get('q_scores')
+    rowIndex = indexRows(modSheet, headerCols['id'], 2)
+    curDate = createDate()
+
+    summary = {'imported': 0, 'created': 0, 'submitted': 0, 'seconds': 0}
+    importedRows = []
+    testValues = None
+    teamSetup = False
+    userId = ''
+    try:
+        for userId, displayName, answers in userAnswers:
+            if userId in rowIndex:
+                if source == 'prefill':
+                    continue
+                rowValues = modSheet.getSheetValues(rowIndex[userId], 1, 1, len(headers))[0]
+                if rowValues[headerCols['submitTimestamp']-1]:
+                    raise Exception('Cannot re-submit session')
+            else:
+                # New row (see sheetAction)
+                if userId != TESTUSER_ID and paceLevel == ADMIN_PACE and not importEntries['dueDate'] and Global.accessCodeCallback:
+                    Global.accessCodeCallback('', userId, sessionName)
+                rowValues = createSessionRow(sessionName, importEntries['fieldsMin'], sessionAttributes['params'], questions,
+                                             userId, displayName, source=source or 'import', retakes=None)
+                rowValues = ['' if x is None else x for x in rowValues] + ['']*(len(headers)-len(rowValues))
+                rowValues[headerCols['initTimestamp']-1] = curDate
+                if teamCol and sessionTeam and sessionTeam['session'] not in ('_assign', '_generate'):
+                    if not teamSetup:
+                        setupErrMsg = setupSessionTeam(sessionName)
+                        if setupErrMsg:
+                            raise Exception(setupErrMsg)
+                        teamSetup = True
+                    rowValues[teamCol-1] = getUserTeam(sessionName, userId)
+                summary['created'] += 1
+
+            if source != 'prefill':
+                setImportAnswers(userId, headers, rowValues, answers)
+                if paceLevel == ADMIN_PACE and userId != TESTUSER_ID:
+                    rowValues[headerCols['lastSlide']-1] = adminPaced or pacedSlides
+                else:
+                    rowValues[headerCols['lastSlide']-1] = pacedSlides
+                if submitDate:
+                    rowValues[headerCols['submitTimestamp']-1] = submitDate
+                    summary['submitted'] += 1
+
+            rowValues[headerCols['Timestamp']-1] = curDate
+            for j, header in enumerate(headers):
+                if header.endswith('_share'):
+                    # Share value (see sheetAction)
+                    if j >= 1 and rowValues[j-1] and rowValues[j-1] != SKIP_ANSWER and headers[j-1].endswith('_response'):
+                        rowValues[j] = sliauth.digest_hex(normalizeText(rowValues[j-1]))
+                    elif j >= 2 and rowValues[j-1] and headers[j-1].endswith('_explain') and headers[j-2].endswith('_response'):
+                        rowValues[j] = sliauth.digest_hex(rowValues[j-1]+': '+normalizeText(rowValues[j-2]))
+                    else:
+                        rowValues[j] = ''
+            if TOTAL_COLUMN in headerCols:
+                # Recomputed by Sheet.importRows
+                rowValues[headerCols[TOTAL_COLUMN]-1] = ''
+            if scoresCol and importEntries['computeTotalScore']:
+                userScores = recomputeUserScores(headers, rowValues, questions, sessionAttributes)
+                if userScores:
+                    rowValues[scoresCol-1] = userScores.get('weightedCorrect', '')
+
+            importedRows.append(rowValues)
+            if userId == TESTUSER_ID:
+                testValues = rowValues
+            summary['imported'] += 1
+
+        userId = ''
+        modSheet.importRows(importedRows, sortCols=[headerCols['name'], headerCols['id']])
+    except Exception, excp:
+        raise Exception('Error in import%s (no rows imported): %s' % (' for user '+userId if userId else '', excp))
+
+    if testValues and adminPaced:
+        # Admin-paced test user row update (see sheetAction)
+        if testValues[headerCols['lastSlide']-1]:
+            setValue(sessionName, 'adminPaced', testValues[headerCols['lastSlide']-1], INDEX_SHEET)
+            if sessionAttributes.get('discussSlides'):
+                closeDiscussion(sessionName)
+        if submitDate and paceLevel == ADMIN_PACE:
+            adminPacedUpdate(sessionName, modSheet, 1, submitDate)
+
+    summary['seconds'] = time.time() - startTime
+    if Settings['debug']:
+        print("DEBUG:importSessionAnswers", sessionName, summary, file=sys.stderr)
+    return summary
+
+def prefillSession(sessionName, callback=None):
+    # Create session rows for all roster users without rows, as bulk imports (see importSessionAnswers)
+    # Rows are created in slices of PREFILL_SLICE_ROWS, each in a separate IOLoop callback (to avoid blocking the server)
+    # (Users who create their own rows while slices are pending are skipped)
+    # callback(summary, errMsg) is invoked after the last slice, or on error
+    # Returns no. of rows to be created
+    nameMap = getDisplayNames()
+    if not nameMap:
+        raise Exception('Session %s has no roster for prefill' % sessionName)
+    getImportEntries(sessionName, source='prefill')   # Validate session
+    prevIds = set(getRowMap(sessionName, 'id'))
+    userAnswers = [(userId, name, {}) for userId, name in nameMap.items() if name and not name.startswith('#') and userId not in prevIds]
+    userAnswers.sort()
+    Global.prefilledSessions.add(sessionName)
+
+    summary = {'imported': 0, 'created': 0, 'submitted': 0, 'seconds': 0}
+    def prefillSlice(offset):
+        try:
+            sliceSummary = importSessionAnswers(sessionName, userAnswers[offset:offset+PREFILL_SLICE_ROWS], source='prefill')
+        except Exception, excp:
+            if callback:
+                callback(summary, str(excp))
+            return
+        for key in summary:
+            summary[key] += sliceSummary[key]
+        if offset+PREFILL_SLICE_ROWS < len(userAnswers):
+            IOLoop.current().add_callback(prefillSlice, offset+PREFILL_SLICE_ROWS)
+        elif callback:
+            callback(summary, '')
+
+    IOLoop.current().add_callback(prefillSlice, 0)
+    return len(userAnswers)
+
+def getPrefillSessions(prefillSec):
+    # Return names of sessions to be released within prefillSec seconds that have not been prefilled
+    if not getSheet(INDEX_SHEET):
+        return []
+    curTime = sliauth.epoch_ms()
+    sessionNames = []
+    for sessionName, releaseDate in getRowMap(INDEX_SHEET, 'releaseDate').items():
+        if sessionName in Global.prefilledSessions or not isinstance(releaseDate, datetime.datetime):
+            continue
+        if curTime < sliauth.epoch_ms(releaseDate) <= curTime + 1000*prefillSec:
+            sessionNames.append(sessionName)
+    return sessionNames
+
 def importSheet(sheetName, headers, rows, overwrite=None):
     # Restore sheet from backup file
     ##if Settings['debug']:
@@ -4174,11 +4652,14 @@ def getRowMap(sheetName, colName, regular=False, optional=False, startRow=2):
     sheet = getSheet(sheetName)
     if not sheet:
         raise Exception('Sheet '+sheetName+' not found')
-    colIndex = indexColumns(sheet)
+    colIndex = sheetMap(sheet, 'colIndex', lambda: indexColumns(sheet))
     if colName not in colIndex:
         if optional:
             return None
         raise Exception('Column '+colName+' not found in sheet '+sheetName)
+    return sheetMap(sheet, ('rowMap', colName, regular, startRow), lambda: _makeRowMap(sheet, colIndex, colName, regular, startRow)).copy()
+
+def _makeRowMap(sheet, colIndex, colName, regular, startRow):
     nRows = sheet.getLastRow()-startRow+1
     rowMap = {}
     if nRows > 0:
@@ -4193,9 +4674,10 @@ def getRowMap(sheetName, colName, regular=False, optional=False, startRow=2):
             rowMap[rowId[0]] = vals[j][0]
     return rowMap
 
-def lookupRoster(field, userId=None, regular=False):
+def lookupRoster(field, userId=None, regular=False, shared=False):
     # If not userId, return all entries for field as a dict
     # if regular, only for names defined and not starting with #)
+    # If shared, return cached dict (which must not be modified)
     rosterSheet = getSheet(ROSTER_SHEET)
     if not rosterSheet:
         return None
@@ -4204,16 +4686,20 @@ def lookupRoster(field, userId=None, regular=False):
     if not headers or headers[:4] != MIN_HEADERS:
         raise Exception('CUSTOM:Error: Invalid headers in roster_slidoc; first four should be "'+', '.join(MIN_HEADERS)+'", but found "'+', '.join(headers or [])+'"')
 
-    colIndex = indexColumns(rosterSheet)
+    colIndex = sheetMap(rosterSheet, 'colIndex', lambda: indexColumns(rosterSheet))
     if not colIndex.get(field):
         return None
 
     if userId:
-        rowIndex = indexRows(rosterSheet, colIndex['id'], 2)
+        rowIndex = sheetMap(rosterSheet, 'rowIndex', lambda: indexRows(rosterSheet, colIndex['id'], 2))
         if not rowIndex.get(userId):
             return None
-        return lookupValues(userId, [field], ROSTER_SHEET, True)[0]
+        return rosterSheet.getSheetValues(rowIndex[userId], colIndex[field], 1, 1)[0][0]
+
+    fieldDict = sheetMap(rosterSheet, ('rosterField', field, regular), lambda: _makeRosterField(rosterSheet, field, regular))
+    return fieldDict if shared else OrderedDict(fieldDict)
 
+def _makeRosterField(rosterSheet, field, regular):
     idVals = getColumns('id', rosterSheet, 1, 2)
     names = getColumns('name', rosterSheet, 1, 2)
     fieldVals = getColumns(field, rosterSheet, 1, 2)
@@ -4224,6 +4710,24 @@ def lookupRoster(field, userId=None, regular=False):
         fieldDict[idVal] = fieldVals[j]
     return fieldDict
 
+def getRosterTeams():
+    # Return team->members mapping for teams assigned in roster
+    rosterSheet = getSheet(ROSTER_SHEET)
+    if not rosterSheet:
+        return {}
+    teamMembers = sheetMap(rosterSheet, 'rosterTeams', lambda: makeTeamMembers(lookupRoster(TEAM_HEADER, regular=True, shared=True) or {}))
+    return dict((teamName, memberIds[:]) for teamName, memberIds in teamMembers.items())
+
+def makeTeamMembers(userTeams):
+    members = {}
+    for temId in userTeams.keys():
+        teamName = userTeams[temId]
+        if teamName in members:
+            members[teamName].append(temId)
+        elif teamName:
+            members[teamName] = [temId]
+    return members
+
 NAME_RE = re.compile(r'[a-z][a-z-]*( +[a-z][a-z-]*)* *(,( *[a-z][a-z-]*)( +[a-z][a-z-]*)*)?$', re.IGNORECASE)
 def makeId(displayName, idVals):
     # Creates ids of the form: 'lastname-firstname@'
@@ -4536,6 +5040,18 @@ def indexRows(sheet, indexCol, startRow=2):
     return rowIndex
 
 
+def sheetMap(sheet, key, makeMap, keyVersion=None):
+    # Return map derived from sheet contents, cached until the sheet is modified or replaced
+    # (or until keyVersion changes, for maps that also depend upon non-sheet data; only latest version is retained)
+    # (Returned map is shared and must not be modified)
+    entry = Map_cache.get(sheet.name)
+    if not entry or entry[0] != sheet.version:
+        entry = [sheet.version, {}]
+        Map_cache[sheet.name] = entry
+    if key not in entry[1] or entry[1][key][0] != keyVersion:
+        entry[1][key] = (keyVersion, makeMap())
+    return entry[1][key][1]
+
 def getColumns(header, sheet, colCount=1, startRow=2):
     colIndex = indexColumns(sheet)
     if header not in colIndex:
@@ -4699,7 +5215,7 @@ def getDiscussStats(userId, sessionName=''):
                 continue
             discussStats = {}
             try:
-                discussState = json.loads(topVals[j])
+                discussState = viewDiscussState(temSessionName, topVals[j])
                 lastPostsAll = discussState['lastPost']
                 lastReadPostsAll = json.loads(userVals[j] or '{}')  if userVals  else {}
                 discussNums = lastPostsAll.keys()
@@ -4765,10 +5281,7 @@ def getDiscussionSeed(sessionName, questionNum, discussNum):
     responders = []
     for j in range(nRows):
         idValue = idValues[j][0]
-        postEntry = postEntries[j][0]
-        userPosts = splitPosts(postEntry)
-        for k in range(len(userPosts)):
-            postComps = parsePost(userPosts[k])
+        for postComps in indexedPosts(sessionName, discussNum, idValue, postEntries[j][0]):
             if postComps and postComps['state'].get(ANSWER_POST):
                 # Extract response and explanation
                 subrows.append([idValue, postComps['answer'], postComps['text']])
@@ -4777,7 +5290,8 @@ def getDiscussionSeed(sessionName, questionNum, discussNum):
     qprefix = 'q'+str(questionNum)+'_'
     return {'id': [x[0] for x in subrows], qprefix+'response': [x[1] for x in subrows], qprefix+'explain': [x[2] for x in subrows], 'responders': responders}
 
-def getDiscussState(sessionName, optional=False):
+def getDiscussState(sessionName, optional=False, readOnly=False):
+    # If readOnly, return shared parsed copy (which must not be modified)
     if sessionName == previewingSession():
         raise Exception('Cannot access discussions when previewing session %s' % sessionName)
 
@@ -4805,8 +5319,41 @@ def getDiscussState(sessionName, optional=False):
             return None
         raise Exception('Row with id '+DISCUSS_ID+' empty for session '+axsSession+' in sheet '+DISCUSS_SHEET)
 
+    if readOnly:
+        return viewDiscussState(sessionName, discussStateEntry)
     return json.loads(discussStateEntry)
 
+def viewDiscussState(sessionName, discussStateEntry):
+    # Return shared parsed discussion state, re-parsing only if the state entry has changed
+    entry = Discuss_state.get(sessionName)
+    if not entry or entry[0] != discussStateEntry:
+        entry = [discussStateEntry, json.loads(discussStateEntry)]
+        Discuss_state[sessionName] = entry
+    return entry[1]
+
+def clearDiscussIndex(sessionName):
+    for key in Discuss_index.keys():
+        if key[0] == sessionName:
+            del Discuss_index[key]
+    Discuss_state.pop(sessionName, None)
+
+def indexedPosts(sessionName, discussNum, userId, cellValue):
+    # Return list of parsed posts (see parsePost; None for unparseable posts) in user's discussion cell
+    # Posts are re-parsed only if the cell has changed; for appended posts (see appendPosts), only the new posts are parsed
+    # (Returned list and post components are shared and must not be modified)
+    userIndex = Discuss_index.setdefault((sessionName, int(discussNum)), {})
+    entry = userIndex.get(userId)
+    if entry and entry[0] == cellValue:
+        return entry[1]
+
+    prevValue = entry[0].rstrip() if entry else ''
+    if prevValue and cellValue.startswith(prevValue) and cellValue[len(prevValue):].startswith('\n\n\nPost:'):
+        parsedPosts = entry[1] + [parsePost(post) for post in splitPosts(cellValue[len(prevValue):])]
+    else:
+        parsedPosts = [parsePost(post) for post in splitPosts(cellValue)]
+    userIndex[userId] = [cellValue, parsedPosts]
+    return parsedPosts
+
 def setDiscussState(sessionName, discussState):
     if sessionName == previewingSession():
         raise Exception('Cannot access discussions when previewing session %s' % sessionName)
@@ -4854,7 +5401,12 @@ def postDiscussEntry(sessionName, discussNum, postTeam, userId, userName, prevTe
     postCount = lastPost[postTeam]
 
     newPost = makePost(postTeam, postCount, newText, answer=answer)
-    return appendPosts(prevText, newPost, postCount), newPost
+    newValue = appendPosts(prevText, newPost, postCount)
+    if userId:
+        # Update post index (parsing only the new post)
+        indexedPosts(sessionName, discussNum, userId, prevText)
+        indexedPosts(sessionName, discussNum, userId, newValue)
+    return newValue, newPost
 
 def closeDiscussion(sessionName, discussNum=0, reopen=False):
     if sessionName == previewingSession():
@@ -4913,7 +5465,6 @@ def flagPost(sessionName, discussNum, postTeam, postNumber, posterId, flaggerId,
 def deletePost(prevValue, colValue, userId, userName, adminUser, sessionName, discussNum):
     # Delete post
     newValue = prevValue
-    userPosts = splitPosts(prevValue)
     dcomps = colValue.split(':')
     if len(dcomps) != 3 or not dcomps[2].isdigit():
         raise Exception('Invalid delete post entry %s' % dcomps)
@@ -4930,13 +5481,20 @@ def deletePost(prevValue, colValue, userId, userName, adminUser, sessionName, di
         else:
             raise Exception('Cannot delete flagged post in session '+sessionName)
 
-    for j in range(len(userPosts)):
-        postComps = parsePost(userPosts[j])
-        if postComps['team'] == teamName and postComps['number'] == postNumber:
+    parsedPosts = indexedPosts(sessionName, discussNum, userId, prevValue)
+    for j in range(len(parsedPosts)):
+        postComps = parsedPosts[j]
+        if postComps and postComps['team'] == teamName and postComps['number'] == postNumber:
             # Delete post
+            userPosts = splitPosts(prevValue)
             userPosts[j] = makePost(postComps['team'], postComps['number'], postComps['text'], date=postComps['date'], state=postComps['state'], delete=True, noprefix=True)
             newValue = joinPosts(userPosts)
             userDiscussRange(sessionName, discussNum, userId, userName, increment='deleteCount')
+
+            # Update post index (re-parsing only the deleted post)
+            newPosts = parsedPosts[:]
+            newPosts[j] = parsePost(userPosts[j])
+            Discuss_index[(sessionName, int(discussNum))][userId] = [newValue, newPosts]
             break
     return newValue
 
@@ -5000,7 +5558,7 @@ def accessDiscussion(sessionName, discussNum, userId, userName, postTeam='', nor
         if not axsColumn:
             raise Exception('Column '+axsSession+' not found in sheet '+DISCUSS_SHEET)
 
-        discussState = getDiscussState(sessionName)
+        discussState = getDiscussState(sessionName, readOnly=True)
         lastPost = discussState['lastPost'].get(discussNumStr,{})
         teamLastPost = lastPost.get(postTeam, 0)
 
@@ -5098,7 +5656,7 @@ def getDiscussPosts(sessionName, discussNum, userId, name, postTeams=[], noread=
     else:
         teamNames = ['']
 
-    discussState = getDiscussState(sessionName)
+    discussState = getDiscussState(sessionName, readOnly=True)
     closedFlag = discussState['closed'].get(discussNumStr,0)
 
     if userId == TESTUSER_ID:
@@ -5137,13 +5695,11 @@ def getDiscussPosts(sessionName, discussNum, userId, name, postTeams=[], noread=
             continue
         flaggedIdPosts = discussState['flagged'].get(idValue,{})
         modIdValue, modNameValue = aliasDiscussUser(idValue, nameValue, sessionName, teamSettings, selfId=userId)
-        userPosts = splitPosts(colVals[j])
-        for k in range(len(userPosts)):
-            postComps = parsePost(userPosts[k])
+        for postComps in indexedPosts(sessionName, discussNum, idValue, colVals[j]):
             if postComps and postComps['team'] in postTeams:
                 teamName = postComps['team']
                 postNumber = postComps['number']
-                postState = postComps['state']
+                postState = postComps['state'].copy()
                 flagLabel = postLabel(discussNum, teamName, postNumber)
                 flaggerId = flaggedIdPosts.get(flagLabel)
                 if flaggerId:
@@ -5260,7 +5816,7 @@ def notifyDiscussUsers(sessionName, discussNum, teamName, postMsg, userId, userN
         if teamSettings and userId:
             userId, userName = aliasDiscussUser(userId, userName, sessionName, teamSettings)
 
-        discussState = getDiscussState(sessionName)
+        discussState = getDiscussState(sessionName, readOnly=True)
         closed = discussState['closed'].get(str(discussNum),0)
 
         Global.discussPostCallback(sessionName, discussNum, closed, teamIds, teamName, postMsg, userId, userName, newPost)
@@ -5274,20 +5830,10 @@ def createTeam(sessionName, fromSession, fromQuestion, alias='', count=None, min
     if fromSession.startswith('_'):
         if fromSession == '_roster':
             # Assigned teams from roster
-            userTeams = lookupRoster('team', regular=True)
-            userNames = lookupRoster('name')
+            members = getRosterTeams()
         else:
             # Assigned teams from response in current session
-            userTeams = getRowMap(sessionName, 'q'+str(fromQuestion)+'_response', regular=True)
-            userNames = getRowMap(sessionName, 'name', regular=True)
-
-        members = {}
-        for temId in userTeams.keys():
-            teamName = userTeams[temId]
-            if teamName in members:
-                members[teamName].append(temId)
-            elif teamName:
-                members[teamName] = [temId]
+            members = makeTeamMembers(getRowMap(sessionName, 'q'+str(fromQuestion)+'_response', regular=True))
         aliases = None
         explanations = None
         ranks = None
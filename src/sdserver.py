@@ -44,6 +44,8 @@ import io
 import json
 import logging
 import math
+import mimetypes
+import multiprocessing
 import random
 import subprocess
 import os.path
@@ -56,7 +58,12 @@ import urllib
 import uuid
 import zipfile
 
-from collections import defaultdict, OrderedDict, namedtuple
+from collections import defaultdict, deque, OrderedDict, namedtuple
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 import tornado.auth
 import tornado.autoreload
@@ -110,6 +117,7 @@ Options = {
     'insecure_cookie': False,
     'lock_proxy_url': '',
     'log_call': '',
+    'max_wait_sec': 10,
     'min_wait_sec': 0,
     'missing_choice': '*',
     'multisite': False,
@@ -117,6 +125,7 @@ Options = {
     'old_auth_key': '',
     'plugindata_dir': 'plugindata',
     'port': 8899,
+    'prefill_sec': 0,
     'private_port': 8900,
     'public_pages': False,
     'reload': False,
@@ -143,6 +152,8 @@ Options = {
     'web_dir': 'web',
     'timezone': '',
     'twitter_config': '',
+    'ws_compress': 0,
+    'ws_msgpack': False,
     'xsrf': False,
     }
 
@@ -242,11 +253,14 @@ Global.twitterSpecial = {}
 Global.twitterVerify = {}
 
 Global.previewModifiedCount = 0
+Global.staticFileCache = None
+Global.accessDecisions = {}
 
 PLUGINDATA_PATH = '_plugindata'
 PRIVATE_PATH    = '_private'
 RESTRICTED_PATH = '_restricted'
 RESOURCE_PATH = '_resource'
+ASSETS_PATH = '_assets'    # Fingerprinted resource files (in web_dir, shared by all sites)
 LIBRARIES_PATH = '_libraries'
 FILES_PATH = '_files'
 DOCS_PATH = '_docs'
@@ -266,6 +280,18 @@ BATCH_AGE = 60      # Age of batch cookies (sec)
 
 WS_TIMEOUT_SEC = 1200    # Aggressive websocket timeout OK, since clients can re-connect (with session versioning)
 EVENT_BUFFER_SEC = 3
+EVENT_BUFFER_MAX = 500   # Max. events buffered per connection (keyed events are coalesced; oldest events are dropped beyond this)
+TALLY_NOTIFY_SEC = 1     # Min. interval between live response tally notifications to admin users (for interactive sessions)
+TALLY_NUMBER_BINS = 10   # No. of histogram bins in response tally for numeric questions
+TALLY_TOP_WORDS = 20     # No. of most frequent words in response tally for text questions
+REBUILD_WORKERS = 4      # Max. no. of worker processes for site rebuilds (one per session type)
+REBUILD_JOB_HISTORY = 10 # No. of completed rebuild jobs retained for status display
+PREFILL_CHECK_SEC = 60   # Interval for checking sessions to be prefilled before release (see prefill_sec option)
+STATIC_CACHE_MAX_BYTES = 64*1024*1024  # Max. total size of hot static files cached in memory (see StaticFileCache)
+STATIC_CACHE_FILE_BYTES = 4*1024*1024  # Max. size of a single cached static file
+STATIC_CACHE_CHECK_SEC = 5   # Min. interval for checking modification of cached static files
+ACCESS_CACHE_SEC = 15        # Max. age of memoized static file access decisions (see AuthStaticFileHandler)
+ACCESS_CACHE_MAX = 10000     # Max. no. of memoized access decisions
 
 BACKUP_VERSION_FILE = '_version.txt'
 
@@ -436,6 +462,155 @@ def http_sync_post(url, params_dict=None):
         result = {'result': 'error', 'error': 'Error in http_sync_post: result='+str(result)+': '+str(excp)}
     return result
 
+def rebuild_worker(conn, compileArgsList):
+    # Compile session type in worker process (see RebuildJob)
+    # Proxy requests are relayed through pipe, to be handled by the server process
+    site_prefix = '/'+Options['site_name'] if Options['site_name'] else ''
+    def relay_post(url, params_dict=None):
+        if url == site_prefix+'/_proxy':
+            conn.send(['proxy', params_dict])
+            return conn.recv()
+        return http_sync_post(url, params_dict)
+
+    for compileArgs in compileArgsList:
+        filePaths = compileArgs['filePaths']
+        try:
+            fileHandles = [None for fpath in filePaths] if compileArgs['indexOnly'] else [open(fpath) for fpath in filePaths]
+            retval = slidoc.process_input(fileHandles, filePaths, compileArgs['configOpts'], default_args_dict=compileArgs['defaultOpts'],
+                                          images_zipdict={}, nb_links=compileArgs['nb_links'], http_post_func=relay_post,
+                                          restricted_sessions_re=sliauth.RESTRICTED_SESSIONS_RE, return_messages=True,
+                                          extra_attributes=compileArgs['extra_attributes'])
+            msgs = retval.get('messages', []) if retval else []
+        except Exception, excp:
+            if Options['debug']:
+                import traceback
+                traceback.print_exc()
+            msgs = ['Error in compile: '+(excp.message or str(excp))]
+        conn.send(['compiled', compileArgs['uploadType'], compileArgs['indexOnly'], msgs])
+    conn.send(['done'])
+
+class RebuildJob(object):
+    # Site rebuild, with each session type compiled (and re-indexed) in a separate worker process,
+    # up to REBUILD_WORKERS at a time. Top level is compiled after all session types.
+    # Proxy requests from workers are handled by sdproxy in the server process, so the IOLoop is not blocked.
+    # Connections for sessions of each type are locked (and reloaded) only after that type has been compiled.
+    # Session modifications (preview/upload/edit/compile/delete) are not permitted while a job is active.
+    _jobs = OrderedDict()
+    _jobCount = 0
+
+    @classmethod
+    def getJob(cls, jobId):
+        return cls._jobs.get(jobId)
+
+    @classmethod
+    def activeJob(cls):
+        for job in cls._jobs.values():
+            if not job.endTime:
+                return job
+        return None
+
+    def __init__(self, typeArgs, topArgsFunc, sessionNames={}):
+        # typeArgs: [(uploadType, [compileArgs, ...]), ...] (see ActionHandler.compile)
+        # topArgsFunc: returns compileArgs for top level (after session types have been compiled)
+        # sessionNames: {uploadType: [sessionName, ...]} for locking connections after each type is compiled
+        RebuildJob._jobCount += 1
+        self.jobId = RebuildJob._jobCount
+        self.uploadTypes = [utype for utype, compileArgsList in typeArgs]
+        self.pending = list(typeArgs)
+        self.topArgsFunc = topArgsFunc
+        self.sessionNames = sessionNames
+        self.workers = {}     # fd -> [uploadType, process, conn]
+        self.buildMsgs = {}   # uploadType -> messages
+        self.indMsgs = {}     # uploadType -> messages
+        self.startTime = time.time()
+        self.endTime = None
+
+        RebuildJob._jobs[self.jobId] = self
+        completedIds = [jobId for jobId, job in RebuildJob._jobs.items() if job.endTime]
+        for jobId in completedIds[:-REBUILD_JOB_HISTORY]:
+            del RebuildJob._jobs[jobId]
+
+        self.startWorkers()
+
+    def startWorkers(self):
+        while self.pending and len(self.workers) < REBUILD_WORKERS:
+            uploadType, compileArgsList = self.pending.pop(0)
+            parentConn, childConn = multiprocessing.Pipe()
+            proc = multiprocessing.Process(target=rebuild_worker, args=(childConn, compileArgsList))
+            proc.daemon = True
+            proc.start()
+            childConn.close()
+            self.workers[parentConn.fileno()] = [uploadType, proc, parentConn]
+            IOLoop.current().add_handler(parentConn.fileno(), self.handleWorker, IOLoop.READ)
+
+        if not self.pending and not self.workers:
+            if self.topArgsFunc:
+                # Compile top level, after all session types
+                try:
+                    topArgs = self.topArgsFunc()
+                    self.topArgsFunc = None
+                    self.pending.append( (TOP_LEVEL, [topArgs]) )
+                    self.startWorkers()
+                except Exception, excp:
+                    self.topArgsFunc = None
+                    self.buildMsgs[TOP_LEVEL] = ['Error in compile: '+str(excp)]
+                    self.complete()
+            else:
+                self.complete()
+
+    def handleWorker(self, fd, events):
+        uploadType, proc, conn = self.workers[fd]
+        try:
+            while conn.poll():
+                msg = conn.recv()
+                if msg[0] == 'proxy':
+                    conn.send(sdproxy.sheetAction(msg[1]))
+                elif msg[0] == 'compiled':
+                    clearStaticCaches()
+                    if msg[2]:
+                        self.indMsgs[msg[1]] = msg[3]
+                    else:
+                        self.buildMsgs[msg[1]] = msg[3]
+                        # Session files for type have been rewritten; reload any connections
+                        for sessionName in self.sessionNames.get(msg[1], []):
+                            WSHandler.lockSessionConnections(sessionName, 'Site rebuilt. Reload page', reload=True)
+                elif msg[0] == 'done':
+                    self.endWorker(fd)
+                    return
+        except Exception, excp:
+            # Worker failure
+            print >> sys.stderr, 'sdserver.RebuildJob: ERROR in rebuilding %s: %s' % (uploadType, excp)
+            self.buildMsgs.setdefault(uploadType, []).append('Error in rebuild: '+str(excp))
+            self.endWorker(fd)
+
+    def endWorker(self, fd):
+        uploadType, proc, conn = self.workers.pop(fd)
+        IOLoop.current().remove_handler(fd)
+        conn.close()
+        proc.join()
+        self.startWorkers()
+
+    def complete(self):
+        self.endTime = time.time()
+        if Options['debug']:
+            print >> sys.stderr, 'sdserver.RebuildJob: completed job %d in %.1fs' % (self.jobId, self.endTime-self.startTime)
+
+    def getMessages(self):
+        # Return (buildMsgs, indMsgs), merged in session type order
+        buildMsgs = dict(self.buildMsgs)
+        indMsgs = []
+        for utype in self.uploadTypes:
+            msgs = self.indMsgs.get(utype)
+            if msgs:
+                indMsgs += msgs + ['']
+        return buildMsgs, indMsgs
+
+    def getStatus(self):
+        completed = len([utype for utype in self.uploadTypes+[TOP_LEVEL] if utype in self.buildMsgs or utype in self.indMsgs])
+        activeTypes = [utype for utype, proc, conn in self.workers.values()]
+        return 'Rebuild job %d: %d of %d session types compiled in %ds (compiling: %s)' % (self.jobId, completed, len(self.uploadTypes)+1,
+                                                                                        (self.endTime or time.time())-self.startTime, ', '.join(sorted(activeTypes)) or 'none')
+
 def discussStats(userId, sessionName=''):
     nameMap = sdproxy.getDisplayNames()
     stats = sdproxy.getDiscussStats(userId, sessionName)
@@ -506,6 +681,12 @@ class UserIdMixin(object):
             if imatch:
                 return imatch.group(2)
 
+        for encoding, ext in slidoc.PRECOMPRESSED_EXTS:
+            if path.endswith('.html'+ext):
+                # Precompressed copy has same access as HTML file
+                path = path[:-len(ext)]
+                break
+
         if not special and not path.endswith('.html'):
             return None
         basename = path.split('/')[-1]
@@ -1328,6 +1509,14 @@ class ActionHandler(BaseHandler):
         if Options['libraries_dir']:
             configOpts.update(libraries_url='/'+LIBRARIES_PATH)
 
+        if Options['web_dir'] and not configOpts.get('unbundle') and not configOpts.get('dry_run'):
+            # Reference shared fingerprinted JS/CSS files, rather than inlining them in each session file
+            configOpts.update(unbundle='/'+ASSETS_PATH, asset_dir=os.path.join(Options['web_dir'], ASSETS_PATH))
+
+        if not configOpts.get('dry_run'):
+            # Compressed copies of output files (served by static file handlers)
+            configOpts.update(precompress=True)
+
         return configOpts, defaultOpts
 
     def get(self, subpath, inner=None):
@@ -1672,16 +1861,19 @@ class ActionHandler(BaseHandler):
             self.write('<a href="%s">Dashboard</a><br>' % dash_url)
             self.write('<pre>')
             self.write(sdproxy.getCacheStatus())
+            self.write('\n'+WSHandler.getEncodingStatus())
             curTime = time.time()
             wsConnections = WSHandler.get_connections()
             sorted(wsConnections)
             wsInfo = []
             for path, user, connections in wsConnections:
-                wsInfo += [(path, user, math.floor(curTime-ws.msgTime), ws.clientVersion) for ws in connections]
+                wsInfo += [(path, user, math.floor(curTime-ws.msgTime), ws.clientVersion, len(ws.eventBuffer), ws.eventBuffer.dropped) for ws in connections]
             sorted(wsInfo)
+            self.write('\nEvent buffers: max %d events/connection (keyed events coalesced, oldest events dropped); coalesced=%d, dropped=%d\n' %
+                       (EVENT_BUFFER_MAX, EventBuffer.totalCoalesced, EventBuffer.totalDropped))
             self.write('\nConnections:\n')
             for x in wsInfo:
-                self.write("  %s: %s (idle: %ds, v%s)\n" % x)
+                self.write("  %s: %s (idle: %ds, v%s, buffered: %d, dropped: %d)\n" % x)
             self.write('</pre>')
 
         elif action == '_twitter':
@@ -1845,20 +2037,27 @@ class ActionHandler(BaseHandler):
                 uploadType, sessionNumber, src_path, web_path, web_images = self.getUploadType(subsubpath)
 
             if action == '_republish':
-                buildMsgs = self.rebuild(uploadType, make='' if republishForce else 'all', log_dict=True)
-                # Re-index after complete rebuild
-                indMsgs = self.rebuild(uploadType, indexOnly=True)
-            else:
-                buildMsgs = {}
-                indMsgs = self.rebuild(uploadType, indexOnly=True)
+                # Rebuild and re-index in worker processes (returning immediately)
+                job = self.startRebuild(uploadType, make='' if republishForce else 'all')
+                self.redirect(site_prefix+'/_rebuildstatus/'+str(job.jobId))
+                return
 
-            if action == '_republish' and (1 or any(buildMsgs.values()) or any(indMsgs)):
-                self.displaySessions(buildMsgs, indMsgs, msg='Completed republishing')
-            elif action == '_reindex' and indMsgs and any(indMsgs):
+            indMsgs = self.rebuild(uploadType, indexOnly=True)
+            if indMsgs and any(indMsgs):
                 self.displayMessage(['Error in %s:' % action] + indMsgs)
             else:
                 self.redirect("/"+Options['site_name']+"/index.html" if Options['site_number'] else "/index.html")
 
+        elif action == '_rebuildstatus':
+            job = RebuildJob.getJob(int(subsubpath))
+            if not job:
+                raise tornado.web.HTTPError(404, log_message='CUSTOM:Rebuild job %s not found' % subsubpath)
+            if job.endTime:
+                buildMsgs, indMsgs = job.getMessages()
+                self.displaySessions(buildMsgs, indMsgs, msg='Completed republishing (%ds)' % (job.endTime-job.startTime))
+            else:
+                self.displayMessage(job.getStatus()+'\n', back_url=site_prefix+'/_rebuildstatus/'+str(job.jobId))
+
         elif action == '_delete':
             reset = bool(self.get_argument('reset',''))
             errMsgs = self.deleteSession(subsubpath, reset=reset)
@@ -1891,16 +2090,10 @@ class ActionHandler(BaseHandler):
         elif action == '_prefill':
             if sdproxy.getRowMap(sessionName, 'Timestamp', regular=True):
                 raise tornado.web.HTTPError(403, log_message='CUSTOM:Error: Session %s already filled' % sessionName)
-            nameMap = sdproxy.getDisplayNames()
-            if not nameMap:
+            if not sdproxy.getDisplayNames():
                 raise tornado.web.HTTPError(403, log_message='CUSTOM:Error: Session %s has no roster for prefill' % sessionName)
-            count = 0
-            for userId, name in nameMap.items():
-                if not name or name.startswith('#'):
-                    continue
-                count += 1
-                sdproxy.importUserAnswers(sessionName, userId, name, source='prefill')
-            self.displayMessage('Prefilled session '+sessionName+' with '+str(count)+' users')
+            count = sdproxy.prefillSession(sessionName, callback=functools.partial(prefill_done, sessionName))
+            self.displayMessage('Prefilling session '+sessionName+' with '+str(count)+' users (in background)')
 
         elif action == '_refresh':
             if subsubpath:
@@ -2059,6 +2252,7 @@ class ActionHandler(BaseHandler):
     def deleteSession(self, sessionName, reset=False):
         if Options['debug']:
             print >> sys.stderr, 'DEBUG: deleteSession', Options['site_name'], sessionName, reset
+        self.checkRebuildJob()
         user = sdproxy.ADMINUSER_ID
         userToken = gen_proxy_auth_token(user, sdproxy.ADMIN_ROLE, prefixed=True)
         args = {'sheet': sessionName, 'delsheet': '1', 'admin': user, 'token': userToken}
@@ -2081,6 +2275,10 @@ class ActionHandler(BaseHandler):
             if os.path.exists(web_path):
                 os.remove(web_path)
 
+            for sibling_path in [slidoc.index_sidecar_path(web_path)] + [web_path+ext for _, ext in slidoc.PRECOMPRESSED_EXTS]:
+                if os.path.exists(sibling_path):
+                    os.remove(sibling_path)
+
             if os.path.isdir(web_images):
                 shutil.rmtree(web_images)
 
@@ -2093,6 +2291,9 @@ class ActionHandler(BaseHandler):
             ind_path = os.path.join(os.path.dirname(web_path), 'index.html')
             if os.path.exists(ind_path):
                 os.remove(ind_path)
+            for sibling_path in [slidoc.index_sidecar_path(ind_path)] + [ind_path+ext for _, ext in slidoc.PRECOMPRESSED_EXTS]:
+                if os.path.exists(sibling_path):
+                    os.remove(sibling_path)
             errMsgs = self.rebuild(indexOnly=True)
 
         if errMsgs and any(errMsgs):
@@ -2502,6 +2703,7 @@ class ActionHandler(BaseHandler):
                     rowDict[header] = self.get_argument(header, '')
                 try:
                     oldValues = sdproxy.editRosterValues(rowDict, overwrite=edit)
+                    clearAccessDecisions(sdproxy.ROSTER_SHEET)
                     if not oldValues:
                         self.displayMessage('Roster entry %s for user %s' % ('edited' if edit else 'added', rowDict.get('name')),
                                             back_url=site_prefix+'/_roster')
@@ -2647,9 +2849,10 @@ class ActionHandler(BaseHandler):
                         importParams = dict(importKey=importKey, keyColName=keyColName, skipKeys=skipKeys)
                         importParams = updateImportParams(Options['import_params'], importParams)
 
-                    missed, errors = importAnswers(sessionName, fname, uploadedFile, importParams, submitDate=submitDate)
+                    missed, errors, summary = importAnswers(sessionName, fname, uploadedFile, importParams, submitDate=submitDate)
                     if not missed and not errors:
-                        self.displayMessage('Imported answers from '+fname)
+                        self.displayMessage('Imported answers from %s (%d users, %d new rows, %d submitted, %.1f sec)' %
+                                            (fname, summary['imported'], summary['created'], summary['submitted'], summary['seconds']))
                     else:
                         errMsg = ''
                         if missed:
@@ -2821,6 +3024,7 @@ class ActionHandler(BaseHandler):
         # Return null string on success or error message
         if self.previewActive():
             raise Exception('Already previewing session')
+        self.checkRebuildJob()
 
         if Options['debug']:
             print >> sys.stderr, 'sdserver.uploadSession:', uploadType, sessionNumber, fname1, len(fbody1 or ''), fname2, len(fbody2 or ''), modify, modimages, deleteSlideNum
@@ -2959,12 +3163,14 @@ class ActionHandler(BaseHandler):
             self.previewState['new_image_number'] = md_params.get('new_image_number', 0)
             self.previewState['HTML'] = retval['out_html']
             self.previewState['TOC'] = retval['toc_html']
+            self.previewState['index_sidecar'] = retval.get('index_sidecar')
             self.previewState['messages'] = retval['messages']
             self.previewState['type'] = uploadType
             self.previewState['number'] = sessionNumber
             self.previewState['name'] = sessionName
             self.previewState['label'] = getSessionLabel(sessionName, uploadType)
             self.previewState['src_dir'] = src_dir       # Parent directory of session file
+            clearStaticCaches()
             self.previewState['web_dir'] = web_dir       # Parent directory of session file
             self.previewState['image_dir'] = image_dir
             self.previewState['image_zipbytes'] = io.BytesIO(images_zipdata) if images_zipdata else None
@@ -2993,6 +3199,7 @@ class ActionHandler(BaseHandler):
             return temMsg
 
     def createUnmodifiedPreview(self, sessionName, slideId=''):
+        self.checkRebuildJob()
         uploadType, sessionNumber, src_path, web_path, web_images = self.getUploadType(sessionName)
 
         if self.previewState:
@@ -3018,9 +3225,11 @@ class ActionHandler(BaseHandler):
         if sessionName == 'index' and uploadType != TOP_LEVEL:
             self.previewState['TOC'] = sessionHTML
             self.previewState['HTML'] = ''
+            self.previewState['index_sidecar'] = None
         else:
             self.previewState['TOC'] = ''
             self.previewState['HTML'] = sessionHTML
+            self.previewState['index_sidecar'] = slidoc.read_index_sidecar(web_path)
 
         self.previewState['md'] = ''
         self.previewState['md_defaults'] = ''
@@ -3032,6 +3241,7 @@ class ActionHandler(BaseHandler):
         self.previewState['name'] = sessionName
         self.previewState['label'] = getSessionLabel(sessionName, uploadType)
         self.previewState['src_dir'] = os.path.dirname(src_path)
+        clearStaticCaches()
         self.previewState['web_dir'] = os.path.dirname(web_path)
         self.previewState['image_dir'] = ''
         self.previewState['image_zipbytes'] = None
@@ -3061,9 +3271,12 @@ class ActionHandler(BaseHandler):
         WSHandler.sendEvent(previewPath, '', userRole, False, True, [userId, 1, 'ReloadPage', [slideNumber]])
 
     def compile(self, uploadType, src_path='', contentText='', images_zipdata='', dest_dir='', image_dir='', indexOnly=False,
-                make='', extraOpts={}):
+                make='', extraOpts={}, deferred=False):
         # If src_path, compile single .md file, returning output
         # Else, compile all files of that type, updating index etc.
+        # If deferred, return arguments for compiling all files in a worker process (see rebuild_worker)
+        if not deferred:
+            self.checkRebuildJob()
         images_zipdict = {}
         if src_path:
             sessionName = os.path.splitext(os.path.basename(src_path))[0]
@@ -3105,6 +3318,11 @@ class ActionHandler(BaseHandler):
                         if os.path.exists( os.path.join(notebooks_dir, nb_name) ):
                             _, nb_links[sname] = self.viewer_link(NOTEBOOKS_PATH + '/' + nb_name)
 
+        extra_attributes = {'privateSession': 1 if SiteProps.private_prefix(uploadType) else 0}
+        if deferred:
+            return {'uploadType': uploadType, 'filePaths': filePaths, 'indexOnly': indexOnly, 'configOpts': configOpts,
+                    'defaultOpts': defaultOpts, 'nb_links': nb_links, 'extra_attributes': extra_attributes}
+
         if src_path:
             fileHandles = [io.BytesIO(contentText) if fpath == src_path else None for fpath in filePaths]
         elif indexOnly:
@@ -3118,7 +3336,6 @@ class ActionHandler(BaseHandler):
         return_html = bool(src_path)
 
         try:
-            extra_attributes = {'privateSession': 1 if SiteProps.private_prefix(uploadType) else 0}
             retval = slidoc.process_input(fileHandles, filePaths, configOpts, default_args_dict=defaultOpts, return_html=return_html,
                                           images_zipdict=images_zipdict, nb_links=nb_links, http_post_func=http_sync_post,
                                           restricted_sessions_re=sliauth.RESTRICTED_SESSIONS_RE, return_messages=True,
@@ -3136,6 +3353,7 @@ class ActionHandler(BaseHandler):
             return retval
         else:
             # Normal return
+            clearStaticCaches()
             return {'messages': retval.get('messages', []) if retval else []}
 
     def rebuild(self, uploadType='', indexOnly=False, make='', log_dict=False):
@@ -3166,6 +3384,39 @@ class ActionHandler(BaseHandler):
 
         return msg_dict if log_dict else msg_list
 
+    def checkRebuildJob(self):
+        # Session files may not be modified while a rebuild job is active
+        job = RebuildJob.activeJob()
+        if job:
+            raise tornado.web.HTTPError(403, log_message='CUSTOM:Rebuild job %d in progress; retry after it completes' % job.jobId)
+
+    def startRebuild(self, uploadType='', make=''):
+        # Start rebuild (and re-index) job for session type (or all types, if null), returning RebuildJob
+        # Only connections for sessions of the rebuilt types are locked (by the job, after each type is compiled)
+        self.checkRebuildJob()
+        if self.previewActive():
+            raise tornado.web.HTTPError(403, log_message='CUSTOM:Cannot rebuild while previewing session '+self.previewActive())
+
+        if uploadType:
+            utypes = [uploadType] if uploadType != TOP_LEVEL else []
+        else:
+            utypes = self.get_session_names()
+
+        sessionNames = {}
+        for utype in utypes + [TOP_LEVEL]:
+            sessionNames[utype] = [os.path.splitext(os.path.basename(fpath))[0] for fpath in self.get_md_list(utype)]
+
+        if Options['debug'] :
+            print >> sys.stderr, 'sdserver.startRebuild:', make, utypes
+        typeArgs = []
+        for utype in utypes:
+            dest_dir = self.site_web_dir+SiteProps.private_prefix(utype)+'/'+utype
+            typeArgs.append( (utype, [self.compile(utype, dest_dir=dest_dir, make=make, deferred=True),
+                                      self.compile(utype, dest_dir=dest_dir, indexOnly=True, deferred=True)]) )
+
+        topArgsFunc = functools.partial(self.compile, TOP_LEVEL, dest_dir=self.site_web_dir, indexOnly=False, make='', deferred=True)
+        return RebuildJob(typeArgs, topArgsFunc, sessionNames)
+
 
     def imageUpload(self, sessionName, imageFile, fname, fbody, autonumber=None):
         if Options['debug']:
@@ -3349,10 +3600,15 @@ class ActionHandler(BaseHandler):
             if sessionName != 'index' or uploadType == TOP_LEVEL:
                 with open(web_dir+'/'+sessionName+'.html', 'w') as f:
                     f.write(self.previewState['HTML'])
+                slidoc.write_precompressed(web_dir+'/'+sessionName+'.html')
+                if self.previewState['index_sidecar']:
+                    # Index-only rebuild will use sidecar, rather than re-parsing HTML
+                    slidoc.write_index_sidecar(web_dir+'/'+sessionName+'.html', self.previewState['index_sidecar'])
 
             if self.previewState['TOC'] and (sessionName != 'index' or uploadType != TOP_LEVEL):
                 with open(web_dir+'/index.html', 'w') as f:
                     f.write(self.previewState['TOC'])
+                slidoc.write_precompressed(web_dir+'/index.html')
 
             if self.previewState['image_zipfile']:
                 self.extractFolder(self.previewState['image_zipfile'], web_dir, self.previewState['image_dir'],
@@ -3474,6 +3730,7 @@ class ActionHandler(BaseHandler):
             else:
                 sdproxy.revertPreview(saved=saved_version)
         self.previewState.clear()
+        clearStaticCaches()
 
     def extract_slides(self, src_path, web_path):
         try:
@@ -3502,6 +3759,7 @@ class ActionHandler(BaseHandler):
         if Options['debug']:
             print >> sys.stderr, 'ActionHandler:editSession: session=%s, type=%s, start=%s, startPreview=%s, update=%s, modify=%s, ntext=%s, from=%s:%s, slide=%s, new=%s, del=%s' % (sessionName, sessionType, start, startPreview, update, modify, len(sessionText), fromSession, fromSite, slideNumber, newNumber, deleteSlide)
 
+        self.checkRebuildJob()
         sessionLabel = sessionName
         temSessionName = sessionType+'00' if sessionName == 'index' and sessionType else sessionName
         uploadType, sessionNumber, src_path, web_path, web_images = self.getUploadType(temSessionName)
@@ -3742,7 +4000,7 @@ class ActionHandler(BaseHandler):
             raise Exception('Error in submitting session '+sessionName+': '+retObj.get('error',''))
         for j in range(20):
             sessionSheet = sdproxy.getSheet(sessionName)
-            if sessionSheet and sessionSheet.get_updates() is not None:
+            if sessionSheet and sessionSheet.has_updates():
                 print >> sys.stderr, 'ActionHandler:submitSession.SLEEP', j
                 yield tornado.gen.sleep(1)
 
@@ -4473,6 +4731,7 @@ class ProxyHandler(BaseHandler):
         else:
             retObj = sdproxy.sheetAction(args)
 
+        clearAccessDecisions(args.get('sheet',''))
         self.set_header('Content-Type', mimeType)
         self.write(jsonPrefix+json.dumps(retObj, default=sliauth.json_default)+jsonSuffix)
 
@@ -4481,28 +4740,196 @@ class ConnectionList(list):
         list.__init__(self, *args)
         self.sd_role = None
 
+class EventMessage(object):
+    # Event shared by all recipient connections (serialized only once for each encoding)
+    def __init__(self, sendList):
+        # sendEvent: source, role, evName, evArg1, ...
+        self.sendList = sendList
+        self.msgs = {}
+
+    def serialize(self, encoding='json'):
+        if encoding not in self.msgs:
+            # Message: source, role, evName, [args]
+            sendList = self.sendList
+            self.msgs[encoding] = WSHandler.encodeMessage([0, 'event', [sendList[0], sendList[1], sendList[2], sendList[3:]] ], encoding)
+        return self.msgs[encoding]
+
+class EventBuffer(object):
+    # Events buffered for a connection: deque of [event, key] entries, with entries for keyed events indexed by key
+    # Keyed event overwrites (coalesces with) any buffered event with the same key, retaining its position
+    # If buffer is full, oldest event is dropped
+    totalCoalesced = 0
+    totalDropped = 0
+
+    def __init__(self, maxlen=EVENT_BUFFER_MAX):
+        self.maxlen = maxlen
+        self.entries = deque()
+        self.keyed = {}
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def append(self, event, key=None):
+        if key is not None:
+            entry = self.keyed.get(key)
+            if entry:
+                entry[0] = event
+                EventBuffer.totalCoalesced += 1
+                return
+        if len(self.entries) >= self.maxlen:
+            self.popleft()
+            self.dropped += 1
+            EventBuffer.totalDropped += 1
+        entry = [event, key]
+        self.entries.append(entry)
+        if key is not None:
+            self.keyed[key] = entry
+
+    def popleft(self):
+        event, key = self.entries.popleft()
+        if key is not None:
+            del self.keyed[key]
+        return event
+
+class ResponseTally(object):
+    # Live tally of interactive responses for a question, updated as each response arrives
+    # Counts: choice letters (choice/multichoice), numeric values (number), or words (text)
+    def __init__(self, qtype):
+        self.qtype = qtype
+        self.responses = {}              # userId -> tallied items for latest response
+        self.counts = defaultdict(int)   # item -> count
+
+    def tallyItems(self, response):
+        if self.qtype in ('choice', 'multichoice'):
+            return list(set(response))
+        elif self.qtype == 'number':
+            value = sdproxy.parseNumber(response)
+            return [] if value is None else [value]
+        else:
+            return list(set(re.findall(r'\w+', response.lower())))
+
+    def update(self, userId, response):
+        # Replace any previous response from user
+        for item in self.responses.get(userId, []):
+            self.counts[item] -= 1
+            if not self.counts[item]:
+                del self.counts[item]
+        items = self.tallyItems(response)
+        self.responses[userId] = items
+        for item in items:
+            self.counts[item] += 1
+
+    def snapshot(self):
+        snap = {'qtype': self.qtype, 'responders': len(self.responses)}
+        if self.qtype in ('choice', 'multichoice'):
+            snap['choices'] = dict(self.counts)
+        elif self.qtype == 'number':
+            bins = [0]*TALLY_NUMBER_BINS
+            minValue = min(self.counts) if self.counts else 0
+            maxValue = max(self.counts) if self.counts else 0
+            binWidth = float(maxValue - minValue) / TALLY_NUMBER_BINS
+            for value, count in self.counts.items():
+                bins[min(int((value-minValue)/binWidth), TALLY_NUMBER_BINS-1) if binWidth else 0] += count
+            snap['histogram'] = {'min': minValue, 'max': maxValue, 'bins': bins}
+        else:
+            snap['words'] = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))[:TALLY_TOP_WORDS]
+        return snap
+
 class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
     _connections = defaultdict(functools.partial(defaultdict,ConnectionList))
+    _sessionPaths = defaultdict(set)   # Index of connection paths by session name: sessionName -> set(paths)
+    _pathRoles = defaultdict(functools.partial(defaultdict,set))  # Index of connected users by role: path -> role -> set(userIds)
+    _bufferedConnections = set()    # Connections with buffered events (flushed periodically)
+    _immediateConnections = set()   # Connections with immediate events (flushed after current request)
+    _immediateFlushPending = False
+    _eventFlusher = None
+    _encodingStats = defaultdict(lambda: [0, 0, 0.0])  # Measured message encoding: encoding -> [count, bytes, seconds]
     _interactiveSession = (None, None, None, None)
     _interactiveErrors = {}
+    _responseTally = None       # Live tally of responses for interactive question
+    _tallyNotifyPending = False
     _sessionVersions = {}
 
     @classmethod
     def get_connections(cls, sessionName=''):
         # Return dict((user, connections_list)) if sessionName
         # else return list of tuples [ (path, user, connections) ]
+        if sessionName:
+            paths = cls._sessionPaths.get(sessionName)
+            if not paths:
+                return {}
+            if len(paths) == 1:
+                return cls._connections.get(list(paths)[0], {})
+            # Merge connections for multiple paths to same session
+            sessionDict = {}
+            for path in paths:
+                for user, connections in cls._connections.get(path,{}).items():
+                    if user not in sessionDict:
+                        sessionDict[user] = ConnectionList()
+                        sessionDict[user].sd_role = connections.sd_role
+                    sessionDict[user].extend(connections)
+            return sessionDict
+
         lst = []
         for path, path_dict in cls._connections.items():
-            if sessionName:
-                if cls.get_path_base(path, special=True) == sessionName:
-                    return path_dict
-            else:
-                for user, connections in path_dict.items():
-                    lst.append( (path, user, connections) )
-        if sessionName:
-            return {}
+            for user, connections in path_dict.items():
+                lst.append( (path, user, connections) )
+        return lst
+
+    @classmethod
+    def encodeMessage(cls, envelope, encoding='json'):
+        # Encode message envelope [callback_index, method, args] as JSON text or as MessagePack binary
+        startTime = time.time()
+        if encoding == 'msgpack':
+            # Python 2 str values are packed as MessagePack strings (not bin), as with JSON
+            msg = msgpack.packb(envelope, default=sliauth.json_default, use_bin_type=False)
         else:
-            return lst
+            msg = json.dumps(envelope, default=sliauth.json_default)
+        stats = cls._encodingStats[encoding]
+        stats[0] += 1
+        stats[1] += len(msg)
+        stats[2] += time.time() - startTime
+        return msg
+
+    @classmethod
+    def getEncodingStatus(cls):
+        out = 'WebSocket messages (compression level: %s, msgpack: %s):\n' % (Options['ws_compress'] or 'none', 'allowed' if Options['ws_msgpack'] and msgpack else 'disabled')
+        for encoding, stats in sorted(cls._encodingStats.items()):
+            count, nbytes, seconds = stats
+            out += '  %s: count=%d, average bytes=%d, average encode time=%.1fus\n' % (encoding, count, nbytes/max(1,count), 1.0e6*seconds/max(1,count))
+        return out
+
+    @classmethod
+    def get_role_users(cls, path, role):
+        # Return set of ids of users with connections for path with role (must not be modified)
+        return cls._pathRoles.get(path,{}).get(role) or set()
+
+    @classmethod
+    def indexConnection(cls, connection):
+        # Add connected user to session/role index (when first connection for path/user is opened)
+        path, userId = connection.pathUser
+        pathSession = cls.get_path_base(path, special=True)
+        if pathSession:
+            cls._sessionPaths[pathSession].add(path)
+        cls._pathRoles[path][cls._connections[path][userId].sd_role].add(userId)
+
+    @classmethod
+    def unindexConnection(cls, connection, role):
+        # Remove connected user from session/role index (when last connection for path/user is closed)
+        path, userId = connection.pathUser
+        roleUsers = cls._pathRoles.get(path,{}).get(role)
+        if roleUsers is not None:
+            roleUsers.discard(userId)
+            if not roleUsers:
+                del cls._pathRoles[path][role]
+        if path not in cls._connections:
+            cls._pathRoles.pop(path, None)
+            pathSession = cls.get_path_base(path, special=True)
+            if pathSession and pathSession in cls._sessionPaths:
+                cls._sessionPaths[pathSession].discard(path)
+                if not cls._sessionPaths[pathSession]:
+                    del cls._sessionPaths[pathSession]
 
     @classmethod
     def getInteractiveSession(cls):
@@ -4526,6 +4953,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 return
             cls._interactiveSession = (connection, path, slideId, questionAttrs)
             cls._interactiveErrors = {}
+            cls._responseTally = ResponseTally(questionAttrs['qtype']) if questionAttrs else None
             if rollbackOption:
                 sdproxy.startTransactSession(basePath)
 
@@ -4534,6 +4962,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 return
             cls._interactiveSession = (None, '', '', None)
             cls._interactiveErrors = {}
+            cls._responseTally = None
             if sdproxy.transactionalSession(interactiveSession):
                 if action == 'rollback':
                     sdproxy.rollbackTransactSession(interactiveSession)
@@ -4560,7 +4989,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             if connection is excludeConnection:
                 continue
             connection.locked = lock_msg
-            connection.write_message_safe(json.dumps([0, 'lock', [connection.locked, reload] ]))
+            connection.write_message_safe([0, 'lock', [connection.locked, reload] ])
 
     @classmethod
     def lockSessionConnections(cls, sessionName, lock_msg, reload=False):
@@ -4571,7 +5000,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
         for userId, connections in cls.get_connections(sessionName).items():
             for connection in connections:
                 connection.locked = lock_msg
-                connection.write_message_safe(json.dumps([0, 'lock', [connection.locked, reload]] ))
+                connection.write_message_safe([0, 'lock', [connection.locked, reload]] )
         if Options['debug']:
             print >> sys.stderr, 'DEBUG: lockSessionConnections', 'DONE'
 
@@ -4580,7 +5009,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
         for path, user, connections in  cls.get_connections():
             for connection in connections:
                 connection.locked = lock_msg
-                connection.write_message_safe(json.dumps([0, 'lock', [connection.locked, reload]] ))
+                connection.write_message_safe([0, 'lock', [connection.locked, reload]] )
 
     @classmethod
     def getSessionVersion(cls, sessionName, update=False):
@@ -4624,13 +5053,8 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 print >> sys.stderr, 'sdserver.processMessage:', msg
             return msg if allStatus else ''
 
-        session_connections = cls._connections.get(path)
-        admin_found = ''
-        if session_connections:
-            for connId, connections in session_connections.items():
-                if connections.sd_role == sdproxy.ADMIN_ROLE:
-                    admin_found = connId
-                    break
+        session_connections = cls._connections.get(path) or {}
+        admin_found = bool(cls.get_role_users(path, sdproxy.ADMIN_ROLE))
 
         if not admin_found:
             cls._interactiveSession = (None, None, None, None)
@@ -4736,7 +5160,23 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             for teamModifiedId in teamModifiedIds:
                 cls.lockConnections(path, teamModifiedId, 'Team member responded. Reload page', reload=True)
 
+        if cls._responseTally:
+            cls._responseTally.update(fromUser, response)
+            if not cls._tallyNotifyPending:
+                # Throttle tally notifications
+                cls._tallyNotifyPending = True
+                IOLoop.current().call_later(TALLY_NOTIFY_SEC, cls.tallyNotify)
+
         return ''
+
+    @classmethod
+    def tallyNotify(cls):
+        # Send snapshot of live response tally to admin users immediately (already throttled to TALLY_NOTIFY_SEC; buffering would delay it to EVENT_BUFFER_SEC)
+        cls._tallyNotifyPending = False
+        conn, path, slideId, questionAttrs = cls._interactiveSession
+        if not cls._responseTally or not path or not questionAttrs:
+            return
+        cls.sendEvent(path, '', sdproxy.ADMIN_ROLE, False, True, ['', -1, 'Share.tallyNotify.%d' % sliauth.get_slide_number(slideId), [questionAttrs['qnumber'], cls._responseTally.snapshot()]])
             
     @classmethod
     def sendEvent(cls, path, fromUser, fromRole, toNormal, toAdmin, args):
@@ -4754,9 +5194,23 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
         ##if Options['debug'] and not evName.startswith('Timer.clockTick'):
         ##    print >> sys.stderr, 'sdserver.sendEvent: event', path, fromUser, fromRole, toNormal, toAdmin, toUsers, evType, evName
-        pathConnections = cls._connections[path]
-        for connId, connections in pathConnections.items():
-            adminSender = fromRole == sdproxy.ADMIN_ROLE
+        # Event [source, role, name, arg1, arg2, ...] (serialized once for all connections)
+        sendList = [fromUser, fromRole, evName] + evArgs
+        event = EventMessage(sendList)
+        # If evType > 0, only the latest occurrence of an event type with same evType name+arguments is buffered
+        evKey = json.dumps(sendList[2:evType+2], default=sliauth.json_default, sort_keys=True) if evType > 0 else None
+        pathConnections = cls._connections.get(path)
+        if not pathConnections:
+            return
+        adminSender = fromRole == sdproxy.ADMIN_ROLE
+        if not toNormal and (adminSender or not evName.startswith('Discuss.activeNotify.')):
+            # Only admin users can receive event
+            connIds = list(cls.get_role_users(path, sdproxy.ADMIN_ROLE))
+        else:
+            connIds = pathConnections.keys()
+
+        for connId in connIds:
+            connections = pathConnections[connId]
             adminDestination = connections.sd_role == sdproxy.ADMIN_ROLE
             if fromUser and connId == fromUser:
                 # Do not send to self
@@ -4776,24 +5230,33 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 if not adminDestination and not evName.startswith('Discuss.activeNotify.'):
                     continue
 
-            # Event [source, role, name, arg1, arg2, ...]
-            sendList = [fromUser, fromRole, evName] + evArgs
             for conn in connections:
-                if evType > 0:
-                    # If evType > 0, only the latest occurrence of an event type with same evType name+arguments is buffered
-                    buffered = False
-                    for j in range(len(conn.eventBuffer)):
-                        if conn.eventBuffer[j][2:evType+2] == sendList[2:evType+2]:
-                            conn.eventBuffer[j] = sendList
-                            buffered = True
-                            break
-                    if not buffered:
-                        conn.eventBuffer.append(sendList)
+                conn.eventBuffer.append(event, evKey)
+                if evType == -1:
+                    cls._immediateConnections.add(conn)
                 else:
-                    # evType <= 0
-                    conn.eventBuffer.append(sendList)
-                    if evType == -1:
-                        conn.flushEventBuffer()
+                    cls._bufferedConnections.add(conn)
+
+        if cls._immediateConnections and not cls._immediateFlushPending:
+            cls._immediateFlushPending = True
+            IOLoop.current().add_callback(cls.flushImmediateEvents)
+
+    @classmethod
+    def flushImmediateEvents(cls):
+        # Batched flush of connections with immediate events
+        cls._immediateFlushPending = False
+        connections = list(cls._immediateConnections)
+        cls._immediateConnections.clear()
+        for conn in connections:
+            conn.flushEventBuffer()
+
+    @classmethod
+    def flushBufferedEvents(cls):
+        # Periodic flush of all connections with buffered events
+        connections = list(cls._bufferedConnections)
+        cls._bufferedConnections.clear()
+        for conn in connections:
+            conn.flushEventBuffer()
 
     @classmethod
     def teamNotify(cls, sessionName, teamIds, teamName):
@@ -4812,8 +5275,16 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
         cls.sendEvent(sessionPath[1:], userId, sdproxy.ADMIN_ROLE, True, True, [teamIds, -1, 'Discuss.postNotify', [discussNum, closed, postMsg, userName, teamName, discussPost]])
 
+    def get_compression_options(self):
+        # Negotiate permessage-deflate compression, if enabled
+        if not Options['ws_compress']:
+            return None
+        return {'compression_level': Options['ws_compress']}
+
     def open(self, path=''):
         try:
+            # Compact binary encoding of message envelopes, if requested by client (and allowed)
+            self.wsEncoding = 'msgpack' if (self.get_argument('encoding','') == 'msgpack' and Options['ws_msgpack'] and msgpack) else 'json'
             self.clientVersion = self.get_argument('version','')
             self.msgTime = time.time()
             self.locked = ''
@@ -4843,6 +5314,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             connectionList = self._connections[self.pathUser[0]][self.pathUser[1]]
             if not connectionList:
                 connectionList.sd_role = self.userRole
+                self.indexConnection(self)
             connectionList.append(self)
             self.pluginInstances = {}
             self.awaitBinary = None
@@ -4852,9 +5324,10 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             if not self.userId:
                 self.close()
 
-            self.eventBuffer = []
-            self.eventFlusher = PeriodicCallback(self.flushEventBuffer, EVENT_BUFFER_SEC*1000)
-            self.eventFlusher.start()
+            self.eventBuffer = EventBuffer()
+            if not WSHandler._eventFlusher:
+                WSHandler._eventFlusher = PeriodicCallback(WSHandler.flushBufferedEvents, EVENT_BUFFER_SEC*1000)
+                WSHandler._eventFlusher.start()
 
             interactSessionName, interactSlideId, _ = self.getInteractiveSession()
             if not self.sessionName or self.sessionName != interactSessionName:
@@ -4867,7 +5340,8 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
             sessionParams['nextSession'] = nextSession(self.sessionName)
             sessionParams['prevSession'] = nextSession(self.sessionName, back=True)
-            self.write_message_safe(json.dumps([0, 'session_setup', [self.sessionVersion, sessionParams] ]))
+            sessionParams['encoding'] = self.wsEncoding
+            self.write_message_safe([0, 'session_setup', [self.sessionVersion, sessionParams] ])
 
             if joined and self.userRole != sdproxy.ADMIN_ROLE:
                 WSHandler.sendEvent(self.pathUser[0], self.pathUser[1], sdproxy.ADMIN_ROLE, False, True, ['', -1, 'ActiveUsers', [self.pathUser[1], activeUsers]])
@@ -4880,14 +5354,16 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
         ##if Options['debug']:
         ##    print >> sys.stderr, "DEBUG: WSon_close", getattr(self, 'pathUser', 'NOT OPENED')
         try:
-            if self.eventFlusher:
-                self.eventFlusher.stop()
-                self.eventFlusher = None
-            self._connections[self.pathUser[0]][self.pathUser[1]].remove(self)
-            if not self._connections[self.pathUser[0]][self.pathUser[1]]:
+            self._bufferedConnections.discard(self)
+            self._immediateConnections.discard(self)
+            connectionList = self._connections[self.pathUser[0]][self.pathUser[1]]
+            connectionList.remove(self)
+            if not connectionList:
                 del self._connections[self.pathUser[0]][self.pathUser[1]]
             if not self._connections[self.pathUser[0]]:
                 del self._connections[self.pathUser[0]]
+            if not connectionList:
+                self.unindexConnection(self, connectionList.sd_role)
 
             if self._interactiveSession[0] is self:
                 # Disable interactivity associated with this connection
@@ -4902,19 +5378,19 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             pass
 
     def write_message_safe(self, msg):
+        # msg: message envelope list (encoded for connection) or already encoded message
         try:
-            self.write_message(msg)
+            if isinstance(msg, list):
+                msg = self.encodeMessage(msg, self.wsEncoding)
+            self.write_message(msg, binary=(self.wsEncoding == 'msgpack'))
         except Exception, excp:
             if Options['debug']:
                 print >> sys.stderr, 'DEBUG: write_message_safe: Error in write_message', self.pathUser, self.locked, str(excp)
 
     def flushEventBuffer(self):
         while self.eventBuffer:
-            # sendEvent: source, role, evName, evArg1, ...
-            sendList = self.eventBuffer.pop(0)
-            # Message: source, role, evName, [args]
-            msg = [0, 'event', [sendList[0], sendList[1], sendList[2], sendList[3:]] ]
-            self.write_message_safe(json.dumps(msg, default=sliauth.json_default))
+            event = self.eventBuffer.popleft()
+            self.write_message_safe(event.serialize(self.wsEncoding))
 
     def _close_on_timeout(self):
         if self.ws_connection:
@@ -4951,11 +5427,9 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
     def on_message_aux(self, message):
         binaryContent = None
-        if isinstance(message, bytes):
+        packedMessage = None
+        if isinstance(message, bytes) and self.awaitBinary:
             # Binary message (treat as additional argument for last text message)
-            if not self.awaitBinary:
-                # Not waiting for binary message ignore
-                return None
             binaryContent = message
             message = self.awaitBinary   # Restore buffered text message
             self.awaitBinary = None
@@ -4965,6 +5439,13 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
             print >> sys.stderr, 'sdserver: Discarded upload message due to lack of data: '+self.awaitBinary[:40]+'...'
             self.awaitBinary = None
 
+        elif isinstance(message, bytes):
+            if self.wsEncoding != 'msgpack':
+                # Not waiting for binary message; ignore
+                return None
+            # MessagePack envelope (with any binary upload content as final argument)
+            packedMessage = message
+
         self.msgTime = time.time()
         if self.timeout:
             IOLoop.current().remove_timeout(self.timeout)
@@ -4972,9 +5453,12 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
         callback_index = None
         try:
-            obj = json.loads(message)
+            if packedMessage is not None:
+                obj = msgpack.unpackb(packedMessage, raw=False)
+            else:
+                obj = json.loads(message)
             if obj[0] and obj[0] != self.sessionVersion:
-                self.write_message_safe(json.dumps([0, 'close', ['Outdated version of session: %s vs %s' % (obj[0], self.sessionVersion), 'Outdated version of session. Reload page'] ]))
+                self.write_message_safe([0, 'close', ['Outdated version of session: %s vs %s' % (obj[0], self.sessionVersion), 'Outdated version of session. Reload page'] ])
                 return
 
             callback_index = obj[1]
@@ -5002,6 +5486,8 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
 
                 modify_user_auth(args, self.pathUser[1])
                 retObj = sdproxy.sheetAction(args)
+                if args.get('write'):
+                    clearAccessDecisions(args.get('sheet',''))
 
                 teamModifiedIds = retObj.get('info', {}).get('teamModifiedIds')
                 if teamModifiedIds:
@@ -5079,13 +5565,17 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 if pluginMethodName.startswith('_upload'):
                     # plugin._upload*(arg1, ..., content=None)
                     print >> sys.stderr, 'sdserver: %s._upload...' % pluginName, args, not binaryContent
-                    if not binaryContent:
+                    if packedMessage is not None:
+                        # Binary content already included as final argument
+                        pass
+                    elif not binaryContent:
                         # Buffer text message and wait for final binary argument
                         self.awaitBinary = message
                         return None
-                    # Append binary data as final argument
-                    args.append(binaryContent)
-                    binaryContent = None
+                    else:
+                        # Append binary data as final argument
+                        args.append(binaryContent)
+                        binaryContent = None
                     if Options['dry_run'] and not Options['dry_run_file_modify']:
                         raise Exception('Cannot upload files during dry run without file modify option')
 
@@ -5106,7 +5596,7 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 raise Exception('User %s accessing invalid WS method %s for session %s' % (self.pathUser[1], method, self.sessionName))
 
             if callback_index:
-                return json.dumps([callback_index, '', retObj], default=sliauth.json_default)
+                return [callback_index, '', retObj]
         except Exception, err:
             if Options['debug']:
                 import traceback
@@ -5114,7 +5604,11 @@ class WSHandler(tornado.websocket.WebSocketHandler, UserIdMixin):
                 ##raise Exception('Error in response: '+err.message)
             if callback_index:
                 retObj = {"result":"error", "error": err.message, "value": None, "messages": ""}
-                return json.dumps([callback_index, '', retObj], default=sliauth.json_default)
+                return [callback_index, '', retObj]
+            elif packedMessage is not None:
+                # Undecodable MessagePack envelope (no callback index available)
+                print >> sys.stderr, 'sdserver: Error in decoding MessagePack message: '+str(err)
+                return [0, 'error', ['Error in decoding MessagePack message: '+str(err)]]
 
 class PluginManager(object):
     _managers = {}
@@ -5246,13 +5740,187 @@ class CachedStaticFileHandler(tornado.web.StaticFileHandler):
         self.set_header('Server', SERVER_NAME)
         self.set_header('Cache-Control', 'public, max-age=900')
     
+def clearStaticCaches():
+    # Clear cached static files and access decisions (when files are rebuilt/uploaded, or preview state changes)
+    if Global.staticFileCache:
+        Global.staticFileCache.clear()
+    Global.accessDecisions.clear()
+
+def clearAccessDecisions(sheetName):
+    # Clear memoized access decisions after modification of a sheet that they depend upon (roster, release dates etc.)
+    if sheetName in (sdproxy.INDEX_SHEET, sdproxy.ROSTER_SHEET, sdproxy.SETTINGS_SHEET):
+        Global.accessDecisions.clear()
+
+class StaticFileCache(object):
+    # Bounded (least recently used) in-memory cache of hot static files, with any current precompressed copies
+    # Entries are revalidated (using file modification time) at most every STATIC_CACHE_CHECK_SEC
+    def __init__(self, maxBytes=STATIC_CACHE_MAX_BYTES, maxFileBytes=STATIC_CACHE_FILE_BYTES):
+        self.maxBytes = maxBytes
+        self.maxFileBytes = maxFileBytes
+        self.clear()
+
+    def clear(self):
+        self.entries = OrderedDict()  # {abs_path: entry}
+        self.contents = {}            # {served_path: content}
+        self.totalBytes = 0
+
+    def get(self, absPath):
+        # Return entry for file, or None (without disk access, if recently validated)
+        entry = self.entries.get(absPath)
+        if not entry:
+            return None
+        curTime = time.time()
+        if curTime - entry['checked'] > STATIC_CACHE_CHECK_SEC:
+            try:
+                stat = os.stat(absPath)
+            except Exception:
+                stat = None
+            if not stat or (stat.st_mtime, stat.st_size) != (entry['mtime'], entry['size']):
+                self.remove(absPath)
+                return None
+            entry['checked'] = curTime
+        # Most recently used
+        del self.entries[absPath]
+        self.entries[absPath] = entry
+        return entry
+
+    def load(self, absPath):
+        # Load file and current precompressed copies, returning entry (or None, if file is too large)
+        stat = os.stat(absPath)
+        if stat.st_size > self.maxFileBytes:
+            return None
+        with open(absPath, 'rb') as f:
+            content = f.read()
+        variants = []   # [(encoding, served_path)], in order of preference
+        contents = {}
+        for encoding, ext in slidoc.PRECOMPRESSED_EXTS:
+            # Ignore stale compressed copy (e.g., if file was modified without re-compressing)
+            if os.path.exists(absPath+ext) and os.path.getmtime(absPath+ext) >= stat.st_mtime:
+                with open(absPath+ext, 'rb') as f:
+                    contents[absPath+ext] = f.read()
+                variants.append( (encoding, absPath+ext) )
+        variants.append( ('', absPath) )
+        contents[absPath] = content
+
+        entry = {'checked': time.time(), 'mtime': stat.st_mtime, 'size': stat.st_size,
+                 'modified': datetime.datetime.utcfromtimestamp(int(stat.st_mtime)),
+                 'digest': sliauth.digest_hex(content), 'variants': variants,
+                 'bytes': sum(len(x) for x in contents.values())}
+        self.remove(absPath)
+        self.entries[absPath] = entry
+        self.contents.update(contents)
+        self.totalBytes += entry['bytes']
+        while self.totalBytes > self.maxBytes and len(self.entries) > 1:
+            self.remove(next(iter(self.entries)))
+        return entry
+
+    def remove(self, absPath):
+        entry = self.entries.pop(absPath, None)
+        if entry:
+            for encoding, servedPath in entry['variants']:
+                self.contents.pop(servedPath, None)
+            self.totalBytes -= entry['bytes']
+
+class PrecompressedStaticMixin(object):
+    # Serve precompressed copy of static file (see slidoc.write_precompressed), if current and accepted by client
+    # ETag is derived from the content digest of the uncompressed file (recomputed only if file is modified)
+    # Hot files are served from memory (see StaticFileCache), without re-reading or re-stating them
+    _content_digests = {}   # {abs_path: (mtime, size, digest)}
+
+    def validate_absolute_path(self, root, absolute_path):
+        self.content_path = absolute_path
+        self.content_encoding = ''
+        self.cache_entry = None
+        accepted = set(x.split(';')[0].strip() for x in self.request.headers.get('Accept-Encoding', '').split(','))
+        cache = Global.staticFileCache if not self.request.headers.get('Range') else None
+
+        # Cached path must still be checked for containment within root (no disk access)
+        entry = cache.get(absolute_path) if cache and absolute_path.startswith(os.path.abspath(root)+os.path.sep) else None
+        if not entry:
+            abs_path = super(PrecompressedStaticMixin, self).validate_absolute_path(root, absolute_path)
+            self.content_path = abs_path
+            if not abs_path or self.request.headers.get('Range'):
+                return abs_path
+            if cache and abs_path == absolute_path and os.path.isfile(abs_path):
+                entry = cache.load(abs_path)
+
+        if entry:
+            self.cache_entry = entry
+            for encoding, servedPath in entry['variants']:
+                if not encoding or encoding in accepted:
+                    break
+        else:
+            encoding, servedPath = '', abs_path
+            mtime = os.path.getmtime(abs_path)
+            for tem_encoding, ext in slidoc.PRECOMPRESSED_EXTS:
+                # Ignore stale compressed copy (e.g., if file was modified without re-compressing)
+                if tem_encoding in accepted and os.path.exists(abs_path+ext) and os.path.getmtime(abs_path+ext) >= mtime:
+                    encoding, servedPath = tem_encoding, abs_path+ext
+                    break
+
+        if encoding:
+            self.content_encoding = encoding
+            self.set_header('Content-Encoding', encoding)
+        return servedPath
+
+    def get_modified_time(self):
+        if self.cache_entry:
+            return self.cache_entry['modified']
+        return super(PrecompressedStaticMixin, self).get_modified_time()
+
+    def get_content_size(self):
+        if self.cache_entry:
+            return len(Global.staticFileCache.contents[self.absolute_path])
+        return super(PrecompressedStaticMixin, self).get_content_size()
+
+    def get_content(self, abspath, start=None, end=None):
+        # Instance method (called by get), serving from memory only if the cache entry was validated for this request
+        # (e.g., Range requests bypass the cache, and must be read from disk to match the size from disk)
+        content = Global.staticFileCache.contents.get(abspath) if self.cache_entry else None
+        if content is None:
+            return tornado.web.StaticFileHandler.get_content(abspath, start, end)
+        return content[start:end]
+
+    @classmethod
+    def get_content_version(cls, abspath):
+        # Class method, which cannot use the (instance) get_content method
+        return tornado.web.StaticFileHandler.get_content_version(abspath)
+
+    def compute_etag(self):
+        if self.cache_entry:
+            return '"%s%s"' % (self.cache_entry['digest'], '-'+self.content_encoding if self.content_encoding else '')
+        stat = os.stat(self.content_path)
+        entry = self._content_digests.get(self.content_path)
+        if not entry or entry[:2] != (stat.st_mtime, stat.st_size):
+            with open(self.content_path, 'rb') as f:
+                entry = (stat.st_mtime, stat.st_size, sliauth.digest_hex(f.read()))
+            self._content_digests[self.content_path] = entry
+        return '"%s%s"' % (entry[2], '-'+self.content_encoding if self.content_encoding else '')
+
+    def get_content_type(self):
+        if self.content_encoding:
+            # Type of uncompressed content
+            return mimetypes.guess_type(self.content_path)[0] or 'application/octet-stream'
+        return super(PrecompressedStaticMixin, self).get_content_type()
+
+    def set_extra_headers(self, path):
+        super(PrecompressedStaticMixin, self).set_extra_headers(path)
+        self.set_header('Vary', 'Accept-Encoding')
+
+class ImmutableStaticFileHandler(PrecompressedStaticMixin, tornado.web.StaticFileHandler):
+    def set_extra_headers(self, path):
+        # Fingerprinted static files, i.e., content never changes for path (no site cookies are set)
+        super(ImmutableStaticFileHandler, self).set_extra_headers(path)
+        self.set_header('Server', SERVER_NAME)
+        self.set_header('Cache-Control', 'public, max-age=31536000, immutable')
+
 class UncachedStaticFileHandler(tornado.web.StaticFileHandler):
     def set_extra_headers(self, path):
         # Force validation of cache (no site cookies are set)
         self.set_header('Server', SERVER_NAME)
         self.set_header('Cache-Control', 'no-cache, must-revalidate, max-age=0')
 
-class SiteStaticFileHandler(UncachedStaticFileHandler, SiteMixin):
+class SiteStaticFileHandler(PrecompressedStaticMixin, UncachedStaticFileHandler, SiteMixin):
     def set_extra_headers(self, path):
         super(SiteStaticFileHandler, self).set_extra_headers(path)
         # Set site cookies
@@ -5269,6 +5937,25 @@ class SiteStaticFileHandler(UncachedStaticFileHandler, SiteMixin):
 
 class AuthStaticFileHandler(SiteStaticFileHandler, UserIdMixin):
     def get_current_user(self):
+        # Successful access decisions are memoized for hot files, keyed by (verified) raw cookie values and path
+        # Memoized decisions are cleared when files are rebuilt, preview state changes, or the roster/index/settings sheets
+        # are modified through the server (see clearAccessDecisions). Other changes (e.g., updates made directly to the
+        # upstream sheets, or site settings) take effect within ACCESS_CACHE_SEC. While a decision is memoized,
+        # updateAccessCode is also not invoked for that user and path.
+        accessKey = (self.get_cookie(USER_COOKIE_SECURE), self.get_cookie(USER_COOKIE), self.request.path, bool(self.is_web_view()))
+        decision = Global.accessDecisions.get(accessKey)
+        if decision and decision[0] > time.time():
+            return decision[1]
+
+        userId = self.check_static_access()
+        if userId and ('/'+RESTRICTED_PATH) not in self.request.path:
+            # (Access to restricted files may depend upon query)
+            if len(Global.accessDecisions) >= ACCESS_CACHE_MAX:
+                Global.accessDecisions.clear()
+            Global.accessDecisions[accessKey] = (time.time()+ACCESS_CACHE_SEC, userId)
+        return userId
+
+    def check_static_access(self):
         # Return None only to request login; else raise HTTPError do deny access (to avoid looping)
         sessionName = self.get_path_base(self.request.path, handle_image=True)
         filename = self.get_path_base(self.request.path, special=True)
@@ -5277,6 +5964,14 @@ class AuthStaticFileHandler(SiteStaticFileHandler, UserIdMixin):
             # Failsafe - no direct web access to *.md files
             raise tornado.web.HTTPError(404)
 
+        if any(self.request.path.endswith('.html'+ext) for encoding, ext in slidoc.PRECOMPRESSED_EXTS):
+            # Precompressed copies are only served via content negotiation for the *.html path
+            raise tornado.web.HTTPError(404)
+
+        if self.request.path.endswith(slidoc.INDEX_SIDECAR_EXT) or self.request.path.endswith('/'+slidoc.BUILD_MANIFEST):
+            # Failsafe - no direct web access to build metadata (index sidecars and build manifests)
+            raise tornado.web.HTTPError(404)
+
         userId = self.get_id_from_cookie() or None
         cookieData = self.get_id_from_cookie(data=True) or {}
         batchMode = cookieData.get('batch')
@@ -5769,6 +6464,7 @@ class PlainHTTPHandler(tornado.web.RequestHandler):
 
 def createApplication():
     pathPrefix = '/'+Options['site_name'] if Options['site_number'] else ''
+    Global.staticFileCache = StaticFileCache()
         
     home_handlers = [
                      (pathPrefix+r"/", HomeHandler)
@@ -5784,6 +6480,8 @@ def createApplication():
             home_handlers += [ (r"/(_(site_settings))", SiteActionHandler) ]
 
         home_handlers += [ (r"/"+RESOURCE_PATH+"/(.*)", UncachedStaticFileHandler, {'path': os.path.join(scriptdir,'templates')}) ]
+        if Options['web_dir']:
+            home_handlers += [ (r"/"+ASSETS_PATH+"/(.*)", ImmutableStaticFileHandler, {'path': os.path.join(Options['web_dir'], ASSETS_PATH)}) ]
         home_handlers += [ (r"/"+ACME_PATH+"/(.*)", UncachedStaticFileHandler, {'path': 'acme-web/'+ACME_PATH}) ]
         if Options['libraries_dir']:
             home_handlers += [ (r"/"+LIBRARIES_PATH+"/(.*)", CachedStaticFileHandler, {'path': Options['libraries_dir']}) ]
@@ -5927,6 +6625,7 @@ def createApplication():
                       r"/(_release/[-\w.]+)",
                       r"/(_reloadpreview)",
                       r"/(_remoteupload/[-\w.]+)",
+                      r"/(_rebuildstatus/\d+)",
                       r"/(_republish/[-\w.]+)",
                       r"/(_reset_cache_updates)",
                       r"/(_responders/[-\w.]+)",
@@ -6040,6 +6739,7 @@ def restoreSheet(sheetName, filepath, csvfile, overwrite=None):
             raise Exception('No rows in CSV file %s for sheet %s' % (filepath, sheetName))
 
         sdproxy.importSheet(sheetName, rows[0], rows[1:], overwrite=overwrite)
+        clearAccessDecisions(sheetName)
         return ''
 
     except Exception, excp:
@@ -6155,6 +6855,7 @@ def importRoster(filepath, csvfile, overwrite=False, lastname_col='', firstname_
                     rosterRows[j][1] = rosterRows[j][1][:-endLen]
 
         sdproxy.createRoster(rosterHeaders, rosterRows, overwrite=overwrite)
+        clearAccessDecisions(sdproxy.ROSTER_SHEET)
         return ''
 
     except Exception, excp:
@@ -6178,6 +6879,7 @@ def updateImportParams(paramStr, prevParams={'importKey':'', 'keyColName':'', 's
 def importAnswers(sessionName, filepath, csvfile, importParams, submitDate=''):
     missed = []
     errors = []
+    summary = {}
 
     if importParams['skipKeys']:
         skipKeySet = set(x.strip() for x in importParams['skipKeys'].split(';') if x.strip())
@@ -6297,6 +6999,8 @@ def importAnswers(sessionName, filepath, csvfile, importParams, submitDate=''):
         if not idRows:
             raise Exception('No valid import keys in CSV file')
 
+        # Parse all answers before importing
+        userAnswers = []
         for userId, row in idRows:
             answers = {}
             formSwitch = 0
@@ -6323,20 +7027,20 @@ def importAnswers(sessionName, filepath, csvfile, importParams, submitDate=''):
                     answers[qnumber]['explain'] = explain
 
             displayName = nameMap[userId] or 'Unknown, Name'
-            try:
-                sdproxy.importUserAnswers(sessionName, userId, displayName, answers=answers, submitDate=submitDate, source='import')
-            except Exception, excp:
-                errors.append('Error in import for user '+str(userId)+': '+str(excp))
-                missed.append(userId)
-                missed.append('... and others')
-                break
+            userAnswers.append( (userId, displayName, answers) )
+
+        try:
+            summary = sdproxy.importSessionAnswers(sessionName, userAnswers, submitDate=submitDate, source='import')
+        except Exception, excp:
+            errors.append(str(excp))
+            missed = [userId for userId, row in idRows]
     except Exception, excp:
         if Options['debug']:
             import traceback
             traceback.print_exc()
         errors = [ 'Error in importAnswers: '+str(excp)] + errors
 
-    return missed, errors
+    return missed, errors, summary
 
 def sendPrivateRequest(relay_address, path='/', proto='http'):
     if Options['debug']:
@@ -7131,6 +7835,30 @@ def periodic_backup():
         renew_ssl()
     print >> sys.stderr, Options['site_name'] or 'ROOT', 'Ending periodic backup', sliauth.iso_date(nosubsec=True)
 
+def periodic_prefill():
+    # Prefill session rows ahead of release date (rather than creating them when users first open the session)
+    if sdproxy.Global.suspended:
+        return
+    try:
+        sessionNames = sdproxy.getPrefillSessions(Options['prefill_sec'])
+    except Exception, excp:
+        print >> sys.stderr, 'periodic_prefill: ERROR', excp
+        return
+    for sessionName in sessionNames:
+        try:
+            sdproxy.prefillSession(sessionName, callback=functools.partial(prefill_done, sessionName))
+        except Exception, excp:
+            # Do not retry (e.g., no roster)
+            sdproxy.Global.prefilledSessions.add(sessionName)
+            print >> sys.stderr, 'periodic_prefill: ERROR in prefilling session %s: %s' % (sessionName, excp)
+
+def prefill_done(sessionName, summary, errMsg):
+    # Callback after all rows for session are prefilled (in IOLoop slices), or on error (not retried, e.g., timed session)
+    if errMsg:
+        print >> sys.stderr, 'prefill_done: ERROR in prefilling session %s (%d rows created): %s' % (sessionName, summary['created'], errMsg)
+    else:
+        print >> sys.stderr, Options['site_name'] or 'ROOT', 'Prefilled session %s: %s' % (sessionName, summary)
+
 def update_session_settings(site_settings):
     # For single or secondary server (NOT CURRENTLY USED)
 
@@ -7170,6 +7898,10 @@ def site_server_setup():
     sdproxy.initProxy(gradebookActive=('gradebook' in SiteProps.get_site_menu()),
                       accessCodeCallback=checkAccessCode, teamSetupCallback=WSHandler.teamNotify, discussPostCallback=WSHandler.postNotify)
 
+    if Options['prefill_sec'] and Options['auth_type'] != 'none':
+        Global.prefill = PeriodicCallback(periodic_prefill, PREFILL_CHECK_SEC*1000.0)
+        Global.prefill.start()
+
     bak_dir = getBakDir(Options['site_name'])
     if bak_dir:
         restoreSite(bak_dir)
@@ -7265,6 +7997,7 @@ def main():
     define("import_params", default=Options['import_params'], help="KEY;KEYCOL;SKIP_KEY1,... parameters for importing answers")
     define("insecure_cookie", default=False, help="Insecure cookies (for direct PDF printing)")
     define("lock_proxy_url", default="", help="Proxy URL to lock sheet(s), e.g., http://example.com")
+    define("max_wait_sec", default=Options["max_wait_sec"], help="Maximum time (sec) to batch Google Sheet updates (adaptive, default: 10)")
     define("min_wait_sec", default=0, help="Minimum time (sec) between Google Sheet updates")
     define("missing_choice", default=Options['missing_choice'], help="Missing choice value (default: *)")
     define("multisite", default=False, help="Enable multiple sites")
@@ -7273,6 +8006,7 @@ def main():
     define("old_auth_key", default='', help="Old auth_key (for key migration)")
     define("plugindata_dir", default=Options["plugindata_dir"], help="Path to plugin data files directory")
     define("plugins", default="", help="List of plugin paths (comma separated)")
+    define("prefill_sec", default=Options["prefill_sec"], help="Prefill session rows for roster users this many seconds before release date (default: 0, disabled)", type=int)
     define("private_port", default=Options["private_port"], help="Base private port for multiproxy)")
     define("public_pages", default=Options["public_pages"], help="Public pages (no login required for home page etc., except for _private/_restricted)")
     define("reload", default=False, help="Enable autoreload mode (for updates)")
@@ -7301,6 +8035,8 @@ def main():
     define("web_dir", default=Options["web_dir"], help="Path to web files directory")
     define("timezone", default=Options["timezone"], help="Local timezone for date/time values, e.g., US/Central")
     define("twitter_config", default="", help="Twitter stream access info: username,consumer_key,consumer_secret,access_key,access_secret;...")
+    define("ws_compress", default=Options["ws_compress"], help="WebSocket permessage-deflate compression level, 1-9 (default: 0, disabled)", type=int)
+    define("ws_msgpack", default=Options["ws_msgpack"], help="Allow MessagePack encoding of WebSocket messages, if requested by client (requires msgpack module)")
     define("xsrf", default=False, help="XSRF cookies for security")
 
     define("port", default=Options['port'], help="Web server port", type=int)
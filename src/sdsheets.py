@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+
+"""
+sdsheets: Local stand-in for the Google Sheets web app (scripts/slidoc_sheets.js)
+
+Implements the subset of the REST protocol used by sdproxy (downloadSheet, ProxyUpdater, delSheet)
+and sliauth (uploadSettings, read_sheet), so that the proxy can be exercised, load-tested and benchmarked
+offline on a single machine. Sheets are held in memory (optionally loaded from a backup directory of CSV files).
+
+Supported requests (GET or POST, form-encoded; admin token required):
+    settings=...                       Upload site settings
+    proxy=1&get=1&all=1                Return all sheet values
+    proxy=1&createsheet=1              Create sheet (with optional rows)
+    proxy=1&allupdates=1&data=...      Apply proxy cache updates (inserts, deletions, partial rows),
+                                       returning refreshSheets/updateErrors (responses cached by requestid)
+    delsheet=1                         Delete sheet, related sheets and session index entry
+    actions=...                        No recomputation; returns refreshSheets for the actions
+
+Admin URLs:
+    /_stats                  Return request/update counters as JSON
+    /_reset                  Reset counters (and all sheets, if ?clear=1)
+
+Artificial upstream behavior (reproducible for a given --seed):
+    latency:      Base response latency (sec)
+    jitter:       Uniform random variation of latency (+/- sec)
+    fail_rate:    Fraction of requests failing with an error, before any updates are applied
+    lost_rate:    Fraction of update requests applied, but with response lost (HTTP 503; retry returns cached response)
+    hang_rate:    Fraction of requests that respond only after hang_sec (to trigger proxy request_timeout)
+
+Usage:
+    sdsheets.py --auth_key=testkey --port=8081 [--load_dir=backup_dir] [--latency=0.5 --fail_rate=0.05 ...]
+    sdserver.py --auth_key=testkey --gsheet_url=http://localhost:8081/_sheets ...
+
+"""
+
+from __future__ import print_function
+
+import csv
+import glob
+import json
+import os
+import random
+import sys
+import time
+
+import tornado.gen
+import tornado.locks
+import tornado.web
+
+from tornado.ioloop import IOLoop
+
+import sliauth
+
+INDEX_SHEET = 'sessions_slidoc'
+ROSTER_SHEET = 'roster_slidoc'
+SETTINGS_SHEET = 'settings_slidoc'
+GRADES_SHEET = 'grades_slidoc'
+DISCUSS_SHEET = 'discuss_slidoc'
+
+RELATED_SHEETS = ['answers', 'correct', 'discuss', 'stats']
+
+ADMIN_ROLE = 'admin'
+GRADER_ROLE = 'grader'
+
+Options = {
+    'auth_key': 'testkey',
+    'debug': False,
+    'fail_rate': 0.0,
+    'hang_rate': 0.0,
+    'hang_sec': 120,
+    'jitter': 0.0,
+    'latency': 0.0,
+    'load_dir': '',
+    'lost_rate': 0.0,
+    'port': 8081,
+    'seed': None,
+    'version': '',        # Script version reported to proxy (default: sliauth.get_version())
+    }
+
+class Dummy():
+    pass
+
+Global = Dummy()
+Global.random = random.Random()
+Global.lock = None
+
+Sheets = {}         # Sheet name -> list of rows (header row first)
+Settings = {}       # Site settings
+Stats = {}          # Counters
+
+def timeColumn(header):
+    return header[-4:].lower() in ('date', 'time') or header.endswith('Timestamp')
+
+def resetStats():
+    Stats.clear()
+    Stats.update({'start_time': time.time(), 'requests': 0, 'errors': 0, 'failed': 0, 'lost': 0, 'hung': 0, 'cached': 0,
+                  'gets': 0, 'updates': 0, 'update_sheets': 0, 'inserted_rows': 0, 'deleted_rows': 0, 'updated_rows': 0,
+                  'request_bytes': 0, 'response_bytes': 0, 'busy_sec': 0.0})
+
+def loadSheets(dirpath):
+    # Load sheets from backup directory (CSV values are loaded as strings)
+    for fpath in sorted(glob.glob(os.path.join(dirpath, '*.csv'))):
+        sheetName = os.path.splitext(os.path.basename(fpath))[0]
+        with open(fpath, 'rb') as f:
+            rows = [row for row in csv.reader(f, delimiter=',')]
+        if not rows:
+            continue
+        nCols = len(rows[0])
+        Sheets[sheetName] = [ (row + ['']*nCols)[:nCols] for row in rows ]
+        if sheetName == SETTINGS_SHEET:
+            Settings.update(sliauth.get_settings(rows[1:]))
+    print('sdsheets: Loaded %d sheets from %s' % (len(Sheets), dirpath), file=sys.stderr)
+
+def validateAdminToken(params):
+    # Returns admin role or raises exception (see validation in slidoc_sheets.js)
+    authToken = params.get('token', '')
+    if not params.get('admin'):
+        raise Exception('Error::Only admin access supported by sdsheets')
+    comps = authToken.split(':')    # effectiveId:userid:role:sites:hmac
+    if len(comps) != 5:
+        raise Exception('Error:INVALID_TOKEN:Invalid auth token format')
+    if sliauth.gen_hmac_token(Options['auth_key'], ':'+':'.join(comps[1:4])) != comps[4]:
+        raise Exception('Error:INVALID_TOKEN:Invalid authentication token')
+    if comps[2] not in (ADMIN_ROLE, GRADER_ROLE):
+        raise Exception('Error:INVALID_TOKEN:Invalid token admin role: '+comps[2])
+    return comps[2]
+
+def actionRefreshSheets(actions, sheetName):
+    # Sheets that would be refreshed by the actions (no recomputation is performed)
+    refreshSheets = []
+    for action in actions.split(','):
+        action = action.strip().lstrip('*')
+        if action == 'answer_stats':
+            refreshSheets += [sheetName+'_answers', sheetName+'_stats']
+        elif action == 'correct':
+            refreshSheets += [sheetName+'_correct']
+        elif action == 'gradebook':
+            raise Exception('Error:NOGRADEUPDATE:Gradebook not updated by sdsheets for session '+sheetName)
+        elif action:
+            raise Exception('Error:ACTION:Invalid action '+action+' for session '+sheetName)
+    return refreshSheets
+
+def deleteSheet(sheetName):
+    if sheetName.endswith('_slidoc') and sheetName != ROSTER_SHEET:
+        raise Exception('Error:DELSHEET:Cannot delete special sheet '+sheetName)
+    indexRows = Sheets.get(INDEX_SHEET)
+    if indexRows and 'id' in indexRows[0]:
+        idCol = indexRows[0].index('id')
+        Sheets[INDEX_SHEET] = [row for j, row in enumerate(indexRows) if not j or row[idCol] != sheetName]
+    for name in [sheetName] + [sheetName+'_'+suffix for suffix in RELATED_SHEETS]:
+        Sheets.pop(name, None)
+
+def updateSheet(sheetName, updateParams, headers, lastRow, allKeys, insertNames, updateCols, insertRows, updateRows, create):
+    # Apply single sheet update from proxy (see handleProxyUpdates in slidoc_sheets.js)
+    rows = Sheets.get(sheetName)
+    if rows is None:
+        if not create:
+            raise Exception("Error:PROXY_MISSING_SHEET:Sheet not found: '"+sheetName+"'")
+        rows = [headers[:]]
+
+    if updateParams.get('modifiedHeaders'):
+        nCols = len(headers)
+        rows = [headers[:]] + [ (row + ['']*nCols)[:nCols] for row in rows[1:] ]
+    else:
+        if len(headers) != len(rows[0]):
+            raise Exception("Error:PROXY_HEADER_COUNT:Number of headers does not equal that present in sheet '"+sheetName+"'; delete it or edit headers.")
+        for m, header in enumerate(headers):
+            if header != rows[0][m]:
+                raise Exception("Error:PROXY_HEADER_NAMES:Column header mismatch: Expected "+header+" but found "+rows[0][m]+" in sheet '"+sheetName+"'")
+
+    if allKeys is None:
+        # Non-keyed sheet: trim excess rows from start, update modified rows, and append inserted rows
+        excess = len(rows) + len(insertNames) - lastRow
+        if excess > 0:
+            del rows[1:1+excess]
+            Stats['deleted_rows'] += excess
+        for rowNums, rowCols, rowSel in updateRows:
+            if rowCols:
+                raise Exception('Error::Update must include all columns for non-keyed sheet '+sheetName)
+            if len(rowNums) != len(rowSel):
+                raise Exception('Error:PROXY_UPDATE_NUMS:No. of ids %d differs from no. of rows %d for sheet %s' % (len(rowNums), len(rowSel), sheetName))
+            for rowNum, row in zip(rowNums, rowSel):
+                if rowNum < 2 or rowNum > len(rows):
+                    raise Exception('Error:PROXY_UPDATE_NUMS:Invalid row number %d for sheet %s' % (rowNum, sheetName))
+                rows[rowNum-1] = row[:]
+                Stats['updated_rows'] += 1
+        rows += [row[:] for row in insertRows]
+        Stats['inserted_rows'] += len(insertRows)
+        Sheets[sheetName] = rows
+        return
+
+    # Keyed sheet
+    idCol = 1 + headers.index('id')
+    stickyRows = 1
+    while stickyRows < len(rows) and not rows[stickyRows][idCol-1]:
+        stickyRows += 1
+
+    keyRows = dict( (row[idCol-1], row) for row in rows[stickyRows:] )
+    for insertName, insertRow in zip(insertNames, insertRows):
+        # Inserted rows overwrite any pre-existing rows with the same key
+        keyRows[insertName[1]] = insertRow[:]
+
+    newRows = []
+    for key in allKeys:
+        # Rows not yet inserted (for incomplete updates) will be inserted by subsequent updates
+        if key in keyRows:
+            newRows.append(keyRows[key])
+    Stats['inserted_rows'] += len(insertRows)
+    Stats['deleted_rows'] += max(0, len(keyRows) - len(newRows))
+
+    rowIndex = dict( (row[idCol-1], row) for row in newRows )
+    for rowIds, rowCols, rowSel in updateRows:
+        if len(rowIds) != len(rowSel):
+            raise Exception('Error:PROXY_PARTIAL_IDS:No. of ids %d differs from no. of rows %d' % (len(rowIds), len(rowSel)))
+        if not rowCols and len(rowIds) > 1:
+            raise Exception('Error:PROXY_PARTIAL_UPDATE:Unable to update multiple ids from %s in sheet %s' % (rowIds[0], sheetName))
+        for rowId, rowValues in zip(rowIds, rowSel):
+            row = rowIndex.get(rowId)
+            if row is None:
+                raise Exception('Error:PROXY_UPDATE_ERROR: Inconsistency error: row id %s not found!' % rowId)
+            if rowCols:
+                for colNum, value in zip(rowCols, rowValues):
+                    if colNum == idCol and value != row[idCol-1]:
+                        raise Exception('Error:PROXY_PARTIAL_UPDATE: New id %s differs from old id %s in sheet %s' % (value, row[idCol-1], sheetName))
+                    row[colNum-1] = value
+            else:
+                row[:] = rowValues
+            Stats['updated_rows'] += 1
+
+    Sheets[sheetName] = rows[:stickyRows] + newRows
+
+def handleProxyUpdates(data, create):
+    refreshSheets = []
+    updateErrors = []
+    for modVals in data:
+        sheetName, updateParams = modVals[0], modVals[1]
+        try:
+            updateSheet(*(modVals + [create]))
+            Stats['update_sheets'] += 1
+            if updateParams.get('actions'):
+                try:
+                    refreshSheets += actionRefreshSheets(updateParams['actions'], sheetName)
+                except Exception, err:
+                    updateErrors.append([sheetName, 'Error:ACTION:Failed proxy action(s) %s for sheet %s: %s' % (updateParams['actions'], sheetName, err), '', ''])
+        except Exception, err:
+            updateErrors.append([sheetName, str(err), '', 'updateSheetDebug: sheet='+sheetName])
+    return [refreshSheets, updateErrors]
+
+def sheetAction(params):
+    # Returns a JSON object (see sheetAction in slidoc_sheets.js)
+    returnValues = None
+    returnInfo = {'version': Options['version'] or sliauth.get_version()}
+    try:
+        validateAdminToken(params)
+        sheetName = params.get('sheet', '')
+        returnInfo['sheet'] = sheetName
+        proxy = params.get('proxy', '')
+
+        if params.get('settings'):
+            Settings.update(json.loads(params['settings']))
+            returnValues = []
+            returnInfo['sessionsAvailable'] = INDEX_SHEET in Sheets
+
+        elif params.get('actions'):
+            returnValues = []
+            returnInfo['refreshSheets'] = actionRefreshSheets(params['actions'], sheetName)
+
+        elif proxy and params.get('get') and params.get('all'):
+            Stats['gets'] += 1
+            returnValues = [row[:] for row in Sheets.get(sheetName, [])]
+
+        elif proxy and params.get('createsheet'):
+            headers = json.loads(params['headers']) if params.get('headers') else None
+            if not headers:
+                raise Exception('Error:CREATESHEET:Must specify headers for sheet '+sheetName)
+            if sheetName in Sheets and not params.get('overwrite'):
+                raise Exception('Error:CREATESHEET:Sheet %s already present' % sheetName)
+            Sheets[sheetName] = [headers] + (json.loads(params['rows']) if params.get('rows') else [])
+            returnValues = []
+
+        elif proxy and params.get('allupdates') and params.get('requestid') and Settings.get('proxy_update_cache') and Settings['proxy_update_cache'][0] == params['requestid']:
+            # Proxy update request already handled; return cached response
+            Stats['cached'] += 1
+            returnValues = []
+            returnInfo['cachedResponse'] = Settings['proxy_update_cache'][0]
+            returnInfo['refreshSheets'] = Settings['proxy_update_cache'][1]
+            returnInfo['updateErrors'] = Settings['proxy_update_cache'][2]
+
+        elif proxy and params.get('allupdates'):
+            Stats['updates'] += 1
+            returnValues = []
+            refreshSheets, updateErrors = handleProxyUpdates(json.loads(params['data']), params.get('create'))
+            returnInfo['refreshSheets'] = refreshSheets
+            returnInfo['updateErrors'] = updateErrors
+            Settings['proxy_update_cache'] = [params.get('requestid', ''), refreshSheets, updateErrors]
+            Settings['proxy_mod_time'] = sliauth.create_date()
+
+        elif params.get('delsheet'):
+            deleteSheet(sheetName)
+            returnValues = []
+
+        else:
+            raise Exception('Error::Request not supported by sdsheets: '+','.join(sorted(params.keys())))
+
+        return {'result': 'success', 'value': returnValues, 'headers': None, 'info': returnInfo, 'messages': ''}
+
+    except Exception, err:
+        if Options['debug']:
+            import traceback
+            traceback.print_exc()
+        Stats['errors'] += 1
+        return {'result': 'error', 'error': str(err), 'errtrace': '', 'value': None, 'info': returnInfo, 'messages': ''}
+
+
+class SheetsHandler(tornado.web.RequestHandler):
+    @tornado.gen.coroutine
+    def get(self, subpath=''):
+        yield self.handleRequest()
+
+    @tornado.gen.coroutine
+    def post(self, subpath=''):
+        yield self.handleRequest()
+
+    @tornado.gen.coroutine
+    def handleRequest(self):
+        params = dict( (arg_name, self.get_argument(arg_name)) for arg_name in self.request.arguments )
+        Stats['requests'] += 1
+        Stats['request_bytes'] += len(self.request.body or '')
+
+        # Requests are serialized (like the public lock in slidoc_sheets.js)
+        with (yield Global.lock.acquire()):
+            delay = max(0, Options['latency'] + Global.random.uniform(-1, 1)*Options['jitter'])
+            hang = Global.random.random() < Options['hang_rate']
+            fail = Global.random.random() < Options['fail_rate']
+            lost = Global.random.random() < Options['lost_rate']
+            if hang:
+                Stats['hung'] += 1
+                delay = Options['hang_sec']
+            if delay:
+                yield tornado.gen.sleep(delay)
+            Stats['busy_sec'] += delay
+
+            if fail:
+                Stats['failed'] += 1
+                retObj = {'result': 'error', 'error': 'Error:SDSHEETS:Simulated upstream failure', 'value': None, 'info': {}}
+            else:
+                retObj = sheetAction(params)
+
+        if lost and not fail and params.get('allupdates'):
+            Stats['lost'] += 1
+            raise tornado.web.HTTPError(503, log_message='CUSTOM:Simulated lost response')
+
+        body = json.dumps(retObj, default=sliauth.json_default)
+        Stats['response_bytes'] += len(body)
+        self.set_header('Content-Type', 'application/json')
+        self.write(body)
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    def get(self, action):
+        if action == 'reset':
+            resetStats()
+            if self.get_argument('clear', ''):
+                Sheets.clear()
+                Settings.clear()
+        retObj = Stats.copy()
+        retObj['elapsed_sec'] = time.time() - Stats['start_time']
+        retObj['sheets'] = dict( (name, len(rows)-1) for name, rows in Sheets.items() )
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps(retObj, sort_keys=True))
+
+
+def createApplication():
+    handlers = [ (r"/_(stats|reset)", StatsHandler),
+                 (r"/(.*)", SheetsHandler) ]
+    return tornado.web.Application(handlers, debug=Options['debug'])
+
+def start_server(port=None):
+    # Setup server (caller starts IOLoop)
+    Global.random.seed(Options['seed'])
+    Global.lock = tornado.locks.Lock()
+    resetStats()
+    if Options['load_dir']:
+        loadSheets(Options['load_dir'])
+    app = createApplication()
+    app.listen(port or Options['port'], address='localhost')
+    return app
+
+def main():
+    from tornado.options import define, options, parse_command_line
+
+    define("auth_key", default=Options['auth_key'], help="Site authentication key (must match sdserver)")
+    define("debug", default=False, help="Debug mode")
+    define("fail_rate", default=Options['fail_rate'], help="Fraction of requests failing with an error")
+    define("hang_rate", default=Options['hang_rate'], help="Fraction of requests that hang for hang_sec")
+    define("hang_sec", default=Options['hang_sec'], help="Hang duration (sec)")
+    define("jitter", default=Options['jitter'], help="Random latency variation (+/- sec)")
+    define("latency", default=Options['latency'], help="Base response latency (sec)")
+    define("load_dir", default=Options['load_dir'], help="Backup directory with sheet CSV files to load")
+    define("lost_rate", default=Options['lost_rate'], help="Fraction of update requests with lost response")
+    define("port", default=Options['port'], help="Port to listen on", type=int)
+    define("seed", default=0, help="Random seed", type=int)
+    define("version", default=Options['version'], help="Script version reported to proxy")
+    parse_command_line()
+
+    for key in Options:
+        Options[key] = getattr(options, key)
+
+    start_server()
+    print('sdsheets: Listening on port %s (latency=%ss, jitter=%ss, fail=%s, lost=%s, hang=%s)' % (Options['port'], Options['latency'], Options['jitter'],
+                                                 Options['fail_rate'], Options['lost_rate'], Options['hang_rate']), file=sys.stderr)
+    IOLoop.current().start()
+
+if __name__ == '__main__':
+    main()
@@ -20,14 +20,20 @@ from __future__ import print_function
 import argparse
 import BaseHTTPServer
 import base64
+import copy
 import datetime
+import gzip
 import io
+import itertools
+import multiprocessing
 import os
 import random
 import re
 import shlex
+import shutil
 import subprocess
 import sys
+import tempfile
 import time
 import urllib
 import urllib2
@@ -51,6 +57,10 @@ try:
 except ImportError:
     HtmlFormatter = None
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 from xml.etree import ElementTree
 
@@ -686,13 +696,14 @@ class MarkdownWithMath(mistune.Markdown):
 
         self.inline.setup(self.block.def_links, self.block.def_footnotes)
 
-        out = self.renderer.placeholder()
+        # Accumulate output pieces (repeated unicode concatenation copies the whole output for each token)
+        out = [self.renderer.placeholder()]
         while self.pop():
             tok = self.tok()
             if not isinstance(tok, unicode):
                 tok = tok.decode('utf-8')
-            out += tok
-        return out
+            out.append(tok)
+        return ''.join(out)
 
     def output_block_math(self):
         return self.renderer.block_math(self.token['text'])
@@ -751,10 +762,154 @@ class MarkdownWithMath(mistune.Markdown):
     def output_pause(self):
         return self.renderer.pause(self.token['text'])
 
+class SlideRenderCache(object):
+    """Rendered output and renderer state at slide boundaries from previous rendering of a file (for incremental re-rendering)"""
+    exclude_attrs = set(['options', 'images_zipfile', 'content_zip', 'content_zip_bytes'])
+    global_attrs = ['primary_tags', 'sec_tags', 'primary_qtags', 'sec_qtags', 'questions', 'concept_questions',
+                    'ref_tracker', 'ref_counter', 'chapter_ref_counter', 'dup_ref_tracker']
+    inline_attrs = ['footnote_index', '_in_link', '_in_footnote']
+
+    def __init__(self, env):
+        self.env = env
+        self.links = None
+        self.tokens = []
+        self.out = u''
+        self.states = {}           # Top-level token position (following hrule) -> (output length, state)
+        self.final_state = None
+        self.rendered_slides = 0   # Slides rendered (for last rendering)
+        self.reused_slides = 0     # Slides reused from cache (for last rendering)
+
+    @classmethod
+    def get_global_state(cls):
+        return copy.deepcopy(dict((attr, getattr(Global, attr)) for attr in cls.global_attrs))
+
+    @classmethod
+    def get_state(cls, md_parser_obj):
+        # Returns copy of renderer, inline lexer, and global state
+        state = {'renderer': dict((attr, value) for attr, value in md_parser_obj.renderer.__dict__.items() if attr not in cls.exclude_attrs),
+                 'inline': dict((attr, getattr(md_parser_obj.inline, attr)) for attr in cls.inline_attrs),
+                 'global': dict((attr, getattr(Global, attr)) for attr in cls.global_attrs),
+                 'footnotes': md_parser_obj.footnotes}
+        return copy.deepcopy(state)
+
+    @classmethod
+    def set_state(cls, md_parser_obj, state):
+        # Restore copy of state (so that cached state is not modified by further rendering)
+        state = copy.deepcopy(state)
+        md_parser_obj.renderer.__dict__.update(state['renderer'])
+        md_parser_obj.inline.__dict__.update(state['inline'])
+        for attr, value in state['global'].items():
+            setattr(Global, attr, value)
+        md_parser_obj.footnotes = state['footnotes']
+
 class MarkdownWithSlidoc(MarkdownWithMath):
     def __init__(self, renderer, **kwargs):
         super(MarkdownWithSlidoc, self).__init__(renderer, **kwargs)
         self.incremental_block_quote = 'incremental_slides' in self.renderer.options['config'].features and 'no_incremental_list' not in self.renderer.options['config'].features
+        self.render_cache = None   # Set by render()
+
+    def output(self, text, rules=None):
+        if not self.render_cache:
+            return super(MarkdownWithSlidoc, self).output(text, rules)
+
+        # Incremental rendering: only re-render slides with tokens that differ from the previous rendering,
+        # splicing in previous output for the unchanged slides before them (restoring the renderer state at the slide boundary)
+        # and after them (if the renderer state at the slide boundary is unchanged, e.g., same slide/question numbering)
+        cache = self.render_cache
+        tokens = list(self.block(text, rules))
+        # (Snapshot link/footnote definitions before rendering, because rendering numbers the footnotes)
+        links = copy.deepcopy([self.block.def_links, self.block.def_footnotes])
+        prev_tokens = cache.tokens if cache.links == links else []
+        ntokens = len(tokens)
+        nprev = len(prev_tokens)
+
+        # Top-level token positions following hrule (slide boundaries)
+        boundaries = []
+        depth = 0
+        for j, token in enumerate(tokens):
+            if token['type'].endswith('_start'):
+                depth += 1
+            elif token['type'].endswith('_end'):
+                depth -= 1
+            elif token['type'] == 'hrule' and not depth:
+                boundaries.append(j+1)
+
+        # Common leading and trailing tokens
+        nprefix = 0
+        while nprefix < min(ntokens, nprev) and tokens[nprefix] == prev_tokens[nprefix]:
+            nprefix += 1
+        nsuffix = 0
+        while nsuffix < min(ntokens, nprev)-nprefix and tokens[ntokens-1-nsuffix] == prev_tokens[nprev-1-nsuffix]:
+            nsuffix += 1
+
+        # Cached states for unchanged leading slides remain valid
+        states = dict((pos, value) for pos, value in cache.states.items() if pos <= nprefix) if prev_tokens else {}
+        start = max([0] + [pos for pos in boundaries if pos <= nprefix])
+        end = min([pos for pos in boundaries if pos > start and pos >= ntokens-nsuffix] or [None])
+        prev_end = None if end is None else end-ntokens+nprev
+
+        self.tokens = tokens[::-1]
+        self.inline.setup(self.block.def_links, self.block.def_footnotes)
+
+        out = [self.renderer.placeholder()]   # Output pieces
+        out_len = 0
+        final_state = None
+        first_slide = 1
+        last_slide = None
+        if nprefix == ntokens == nprev and cache.final_state:
+            # Unchanged tokens
+            out = [cache.out]
+            states = cache.states
+            final_state = cache.final_state
+            SlideRenderCache.set_state(self, final_state)
+            last_slide = 0
+            self.tokens = []
+        elif states:
+            # Restore state at start of last unchanged slide with cached state
+            resume = max(states)
+            out = [cache.out[:states[resume][0]]]
+            out_len = states[resume][0]
+            SlideRenderCache.set_state(self, states[resume][1])
+            first_slide = self.renderer.slide_number
+            self.tokens = self.tokens[:ntokens-resume]
+
+        while self.pop():
+            tok = self.tok()
+            if not isinstance(tok, unicode):
+                tok = tok.decode('utf-8')
+            out.append(tok)
+            out_len += len(tok)
+            pos = ntokens - len(self.tokens)
+            if (pos != start and pos != end) or pos in states:
+                continue
+            state = SlideRenderCache.get_state(self)
+            states[pos] = (out_len, state)
+            if pos == end and prev_end in cache.states and state == cache.states[prev_end][1]:
+                # Unchanged state following modified slides; splice in previous output (and cached states) for remaining slides
+                last_slide = self.renderer.slide_number - 1
+                offset = out_len - cache.states[prev_end][0]
+                for prev_pos, (prev_len, prev_state) in cache.states.items():
+                    if prev_pos > prev_end:
+                        states[prev_pos+ntokens-nprev] = (prev_len+offset, prev_state)
+                out.append(cache.out[cache.states[prev_end][0]:])
+                final_state = cache.final_state
+                SlideRenderCache.set_state(self, final_state)
+                break
+
+        if final_state is None:
+            final_state = SlideRenderCache.get_state(self)
+        if last_slide is None:
+            last_slide = self.renderer.slide_number
+        cache.rendered_slides = last_slide - first_slide + 1 if last_slide else 0
+        cache.reused_slides = self.renderer.slide_number - cache.rendered_slides
+
+        out = ''.join(out)
+        cache.links = links
+        cache.tokens = tokens
+        cache.out = out
+        cache.states = states
+        cache.final_state = final_state
+        return out
 
     def output_block_quote(self):
         if self.incremental_block_quote:
@@ -764,16 +919,17 @@ class MarkdownWithSlidoc(MarkdownWithMath):
             self.renderer.list_incremental(False)
         return retval
 
-    def render(self, text, index_id='', qindex_id=''):
+    def render(self, text, index_id='', qindex_id='', render_cache=None):
         self.renderer.index_id = index_id
         self.renderer.qindex_id = qindex_id
+        self.render_cache = render_cache
         html = super(MarkdownWithSlidoc, self).render(text)
         self.renderer.close_zip(text)
 
         if not self.renderer.global_plugin_refs.issubset(self.renderer.plugin_embeds):
             abort("    ****PLUGIN-ERROR: %s: Missing global plugins %s ." % (self.options["filename"], list(self.renderer.global_plugin_refs.difference(self.renderer.plugin_embeds))))
 
-        first_slide_pre = '<span id="%s-attrs" class="slidoc-attrs" style="display: none;">%s</span>\n' % (self.renderer.first_id, base64.b64encode(json.dumps(self.renderer.questions)))
+        first_slide_pre = '<span id="%s-attrs" class="slidoc-attrs" style="display: none;">%s</span>\n' % (self.renderer.first_id, base64.b64encode(json.dumps(self.renderer.questions, sort_keys=True)))
 
         if self.renderer.options['config'].pace:
             first_slide_pre += SlidocRenderer.remarks_template
@@ -914,6 +1070,7 @@ class SlidocRenderer(MathRenderer):
         self.file_header = ''
         self.header_list = []
         self.concept_warnings = []
+        self.concept_warning_tags = []
         self.hide_end = None
         self.hint_end = None
         self.notes_end = None
@@ -2727,6 +2884,7 @@ class SlidocRenderer(MathRenderer):
                     # If assessment document, do not warn about lack of concept coverage
                     if tag not in Global.primary_tags and tag not in Global.sec_tags and 'assessment' not in self.options['config'].features:
                         self.concept_warnings.append("TAGS-WARNING: %s: '%s' not covered before '%s'" % (self.options["filename"], tag, self.cur_header or ('slide%02d' % self.slide_number)) )
+                        self.concept_warning_tags.append(tag)
                         message("        "+self.concept_warnings[-1])
 
                 add_to_index(Global.primary_qtags, Global.sec_qtags, p_tags, s_tags, self.options["filename"], self.get_slide_id(), self.cur_header, qconcepts=self.qconcepts)
@@ -2886,6 +3044,23 @@ HTML_COMMENT_RE =  re.compile(r'^\s*<!--.*-->\s*\n?$')
 SLIDE_BREAK_RE  =  re.compile(r'^ {0,3}(----* *|Slide:|#[^#].*|##[^#].*)\n?$')
 HRULE_BREAK_RE  =  re.compile(r'(\S *\n)( {0,3}----* *(\n|$))')
     
+RENDER_CACHE_FILES = 4   # Number of files with cached slide rendering state (for incremental re-rendering of previews)
+Render_cache = OrderedDict()
+
+def get_render_cache(filename, config, filenumber, filedir, plugin_defs, index_id, qindex_id, images_zipdata):
+    # Return SlideRenderCache for file (new cache, if rendering environment has changed)
+    config_opts = json.dumps(vars(config), sort_keys=True, default=lambda x: sorted(x) if isinstance(x, set) else type(x).__name__)
+    env = [config_opts, filenumber, plugin_defs, index_id, qindex_id, sliauth.digest_hex(images_zipdata) if images_zipdata else '',
+           SlideRenderCache.get_global_state()]
+    key = filedir + '/' + filename
+    render_cache = Render_cache.pop(key, None)
+    if not render_cache or render_cache.env != env:
+        render_cache = SlideRenderCache(env)
+    Render_cache[key] = render_cache
+    while len(Render_cache) > RENDER_CACHE_FILES:
+        Render_cache.popitem(last=False)
+    return render_cache
+
 def md2html(source, filename, config, filenumber=1, filedir='', plugin_defs={}, prev_file='', next_file='', index_id='', qindex_id='',
             zip_content=False, images_zipdata=None):
     """Convert a markdown string to HTML using mistune, returning (first_header, file_toc, renderer, md_params, html, zipped_content_images)"""
@@ -2894,7 +3069,14 @@ def md2html(source, filename, config, filenumber=1, filedir='', plugin_defs={},
     renderer = SlidocRenderer(escape=False, filename=filename, config=config, filenumber=filenumber, filedir=filedir, plugin_defs=plugin_defs,
                               images_zipdata=images_zipdata, zip_content=zip_content)
     md_parser_obj = MarkdownWithSlidoc(renderer=renderer)
-    content_html = md_parser_obj.render(source, index_id=index_id, qindex_id=qindex_id)
+
+    render_cache = None
+    if config.preview_mode and not zip_content:
+        # Only re-render modified slides when previewing edits
+        render_cache = get_render_cache(filename, config, filenumber, filedir, plugin_defs, index_id, qindex_id, images_zipdata)
+    content_html = md_parser_obj.render(source, index_id=index_id, qindex_id=qindex_id, render_cache=render_cache)
+    if render_cache and config.debug:
+        message('RENDER-CACHE: %s: re-rendered %d slides, reused %d slides' % (filename, render_cache.rendered_slides, render_cache.reused_slides))
 
     if renderer.retry_questions and config.pace < QUESTION_PACE :
         message('RETRY-WARNING: retry=... answer option only works with pace >= %d' % (QUESTION_PACE,))
@@ -3380,9 +3562,8 @@ def extract_slides(src_path, web_path):
         raise Exception('Error in reading module source text %s: %s' % (src_path, excp))
 
     try:
-        with open(web_path) as f:
-            sessionIndex = read_index(f, path=web_path)
-            sessionIndexParams = sessionIndex[0][-1]
+        sessionIndex = read_output_index(web_path)
+        sessionIndexParams = sessionIndex[0][-1]
     except Exception, excp:
         raise Exception('Error in reading module published HTML %s: %s' % (web_path, excp))
 
@@ -3469,6 +3650,53 @@ def read_index(fhandle, entry_count=6, path=''):
 
     return index_entries
 
+def index_sidecar_path(html_path):
+    return os.path.splitext(html_path)[0] + INDEX_SIDECAR_EXT
+
+def make_index_sidecar(index_head, fname=''):
+    # Return sidecar dict with index entries from header comment (as returned by read_index)
+    return {'index': read_index(io.BytesIO(md2md.stringify(index_head)), path=fname)}
+
+def write_index_sidecar(html_path, sidecar):
+    # Write JSON index sidecar for HTML output file (should be written after the HTML file)
+    md2md.write_file(index_sidecar_path(html_path), json.dumps(sidecar, sort_keys=True))
+
+def read_index_sidecar(html_path):
+    # Return sidecar dict for HTML output file, or None if sidecar is missing, invalid, or older than HTML file
+    sidecar_path = index_sidecar_path(html_path)
+    try:
+        if not os.path.exists(sidecar_path) or os.path.getmtime(sidecar_path) < os.path.getmtime(html_path):
+            return None
+        with open(sidecar_path) as f:
+            sidecar = json.load(f)
+    except Exception, excp:
+        message('INDEX-WARNING: Error in reading index sidecar %s: %s' % (sidecar_path, excp))
+        return None
+
+    # Convert to same string types as read_index
+    index_entries = []
+    for entry in sidecar['index']:
+        tem_list = []
+        for value in entry:
+            if isinstance(value, dict):
+                for key, subvalue in value.items():
+                    if isinstance(subvalue, unicode):
+                        value[key] = subvalue.encode('ascii', 'replace')
+            elif isinstance(value, unicode):
+                value = value.encode('utf8')
+            tem_list.append(value)
+        index_entries.append(tem_list)
+    sidecar['index'] = index_entries
+    return sidecar
+
+def read_output_index(html_path):
+    # Return index entries for HTML output file, from sidecar if current (without reading HTML file)
+    sidecar = read_index_sidecar(html_path)
+    if sidecar is not None:
+        return sidecar['index']
+    with open(html_path) as f:
+        return read_index(f, path=html_path)
+
 def get_topnav(opts, server_url, fnames=[], site_name='', separate=False, cur_dir='', split_char=''):
     site_prefix = '/' if server_url else ''
     if site_name:
@@ -3554,6 +3782,121 @@ def render_topnav(topnav_list, server_url, filepath='', site_name=''):
 
 scriptdir = os.path.dirname(os.path.realpath(__file__))
 
+Template_names = ('doc_include.css', 'wcloud.css', 'doc_custom.css',
+                  'doc_include.js', 'wcloud.js', 'doc_google.js', 'md5.js', 'sha256.js', 'doc_test.js',
+                  'doc_include.html', 'doc_template.html', 'reveal_template.html')
+
+File_cache = {}      # {abspath: (mtime, content)} for template, CSS and plugin files (see read_cached_file)
+Resource_cache = {}  # {(css, unbundle, asset_dir): (sources, css_html, js_html)} (see get_resource_bundle)
+
+def read_cached_file(path):
+    # Return file content, re-reading file only if its modification time has changed
+    abspath = os.path.abspath(path)
+    mtime = os.path.getmtime(abspath)
+    entry = File_cache.get(abspath)
+    if not entry or entry[0] != mtime:
+        entry = (mtime, md2md.read_file(abspath))
+        File_cache[abspath] = entry
+    return entry[1]
+
+def get_templates():
+    return dict((tname, read_cached_file(scriptdir+'/templates/'+tname)) for tname in Template_names)
+
+def write_asset(filename, content, asset_dir):
+    # Write fingerprinted (content-hashed) copy of resource file to asset_dir, if not already present
+    # Returns asset file name
+    name, ext = os.path.splitext(filename)
+    asset_name = '%s-%s%s' % (name, sliauth.digest_hex(content), ext)
+    asset_path = os.path.join(asset_dir, asset_name)
+    if not os.path.exists(asset_path):
+        if not os.path.exists(asset_dir):
+            os.makedirs(asset_dir)
+        # Write to temporary file and rename (asset directory may be shared by concurrent compiles)
+        tem_path = '%s.%d.tmp' % (asset_path, os.getpid())
+        md2md.write_file(tem_path, content)
+        write_precompressed(tem_path)
+        for _, ext in PRECOMPRESSED_EXTS:
+            if os.path.exists(tem_path+ext):
+                os.rename(tem_path+ext, asset_path+ext)
+        os.rename(tem_path, asset_path)
+    return asset_name
+
+def insert_resource(filename, templates, unbundle='', asset_dir=''):
+    # If asset_dir is specified, unbundled resource files are fingerprinted, i.e., may be cached indefinitely
+    if unbundle and asset_dir:
+        filename = write_asset(filename, templates[filename], asset_dir)
+
+    if filename.endswith('.js'):
+        return ('<script src="%s/%s"></script>\n' % (unbundle, filename)) if unbundle else ('\n<script>\n%s</script>\n' % templates[filename])
+
+    if filename.endswith('.css'):
+        return ('<link rel="stylesheet" type="text/css" href="%s/%s">\n' % (unbundle, filename)) if unbundle else ('\n<style>\n%s</style>\n' % templates[filename])
+    raise Exception('Invalid filename for insert_resource: '+filename)
+
+def get_resource_bundle(css, unbundle, templates, asset_dir=''):
+    # Return (css_html, js_html) resources for HTML head
+    # (cached for css/unbundle/asset_dir options, until template or CSS files are modified)
+    css_text = ''
+    if css and not css.startswith('http:') and not css.startswith('https:'):
+        css_text = read_cached_file(css)
+
+    # Cached file contents are re-read (as new objects) only if modified
+    sources = [templates[tname] for tname in ('doc_custom.css', 'doc_include.css', 'wcloud.css', 'doc_include.js', 'wcloud.js')] + [css_text]
+    cached = Resource_cache.get((css, unbundle, asset_dir))
+    if cached and all(x is y for x, y in zip(cached[0], sources)) and (not asset_dir or os.path.exists(asset_dir)):
+        return cached[1:]
+
+    if css_text:
+        css_html = '<style>\n' + css_text + '</style>\n'
+    elif css:
+        css_html = '<link rel="stylesheet" type="text/css" href="%s">\n' % css
+    else:
+        css_html = insert_resource('doc_custom.css', templates, unbundle, asset_dir)
+
+    # External CSS replaces doc_custom.css, but not doc_include.css
+    css_html += insert_resource('doc_include.css', templates, unbundle, asset_dir)
+    if HtmlFormatter:
+        css_html += '\n<style>\n' + HtmlFormatter().get_style_defs('.highlight') + '\n</style>\n'
+    css_html += insert_resource('wcloud.css', templates, unbundle, asset_dir)
+
+    js_html = insert_resource('doc_include.js', templates, unbundle, asset_dir) + insert_resource('wcloud.js', templates, unbundle, asset_dir)
+    Resource_cache[(css, unbundle, asset_dir)] = (sources, css_html, js_html)
+    return css_html, js_html
+
+BUILD_MANIFEST = '_slidoc_build.json'   # Build manifest file in dest_dir (used to skip unchanged files in make mode)
+Build_exclude_opts = set(['backup_dir', 'dest_dir', 'jobs', 'make', 'toc_header', 'verbose'])
+
+def build_config_digest(config_dict, default_args_dict):
+    # Return digest of effective options for build manifest
+    opts = {}
+    for prefix, args_dict in (('default:', default_args_dict), ('', config_dict)):
+        for key, value in args_dict.items():
+            if key not in Build_exclude_opts:
+                opts[prefix+key] = sorted(value) if isinstance(value, set) else value
+    return sliauth.digest_hex(json.dumps(opts, sort_keys=True, default=str))
+
+def build_template_digest(css_path=''):
+    # Return digest of template files (and any local CSS file) for build manifest
+    contents = []
+    template_dir = scriptdir+'/templates'
+    for tname in sorted(os.listdir(template_dir)):
+        contents += [tname, read_cached_file(template_dir+'/'+tname)]
+    if css_path and not css_path.startswith('http:') and not css_path.startswith('https:'):
+        contents += [css_path, read_cached_file(css_path)]
+    return sliauth.digest_hex('\n'.join(contents))
+
+def read_build_manifest(dest_dir):
+    # Return manifest {fname: {'src_digest':, 'config_digest':, 'template_digest':}}
+    manifest_path = dest_dir+BUILD_MANIFEST
+    if not os.path.exists(manifest_path):
+        return {}
+    try:
+        with open(manifest_path) as f:
+            return json.load(f)
+    except Exception, excp:
+        message('BUILD-WARNING: Ignoring invalid build manifest %s: %s' % (manifest_path, excp))
+        return {}
+
 class GlobalState(object):
     def __init__(self, http_post_func=None, return_html=False, error_exit=False):
         self.http_post = http_post_func or sliauth.http_post
@@ -3575,6 +3918,191 @@ class GlobalState(object):
 
         self.dup_ref_tracker = set()
 
+class KeyRecorder(object):
+    # Mixin to record keys used to access global state when rendering a file in a worker process
+    # (to validate the rendering against the global state from prior files; see merge_rendered_file)
+    def __init__(self, *args, **kwargs):
+        super(KeyRecorder, self).__init__(*args, **kwargs)
+        self.lookups = []
+
+    def __contains__(self, key):
+        self.lookups.append(('contains', key))
+        return super(KeyRecorder, self).__contains__(key)
+
+    def __getitem__(self, key):
+        self.lookups.append(('get', key))
+        return super(KeyRecorder, self).__getitem__(key)
+
+    def __setitem__(self, key, value):
+        self.lookups.append(('set', key))
+        super(KeyRecorder, self).__setitem__(key, value)
+
+    def get(self, key, default=None):
+        self.lookups.append(('get', key))
+        return super(KeyRecorder, self).get(key, default)
+
+    def add(self, key):
+        self.lookups.append(('set', key))
+        super(KeyRecorder, self).add(key)
+
+class RecordingDict(KeyRecorder, dict):
+    pass
+
+class RecordingDefaultDict(KeyRecorder, defaultdict):
+    pass
+
+class RecordingSet(KeyRecorder, set):
+    pass
+
+Render_global_attrs = ['primary_tags', 'sec_tags', 'primary_qtags', 'sec_qtags', 'questions', 'concept_questions',
+                       'ref_tracker', 'ref_counter', 'chapter_ref_counter', 'dup_ref_tracker']
+
+def render_file(render_args):
+    # Render file in worker process (for parallel compilation)
+    # Returns (md2html return value, global state, lookups, messages), or None on error (file is then rendered serially)
+    global Global, message
+    md_text, md2html_args, return_html = render_args
+    Global = GlobalState(return_html=return_html)
+    Global.ref_tracker = RecordingDict()
+    Global.ref_counter = RecordingDefaultDict(int)
+    Global.dup_ref_tracker = RecordingSet()
+    Global.all_tags = RecordingDict()
+
+    messages = []
+    message = lambda *args: messages.append(args)
+    try:
+        retval = md2html(md_text, **md2html_args)
+    except (Exception, SystemExit), excp:
+        return None
+
+    renderer = retval[2]
+    renderer.images_zipfile = None
+    renderer.content_zip = None
+    renderer.content_zip_bytes = None
+    state = {}
+    for attr in Render_global_attrs:
+        value = getattr(Global, attr)
+        if isinstance(value, KeyRecorder):
+            value = set(value) if isinstance(value, set) else defaultdict(value.default_factory, value) if isinstance(value, defaultdict) else dict(value)
+        state[attr] = value
+    lookups = dict((attr, getattr(Global, attr).lookups) for attr in ('ref_tracker', 'ref_counter', 'dup_ref_tracker', 'all_tags'))
+    return retval, state, lookups, messages
+
+def merge_rendered_file(rendered):
+    # Merge global state from file rendered in worker process (see render_file) into global state from prior files
+    # Returns md2html return value, or None (without merging) if the rendering depended upon global state from prior files
+    # (e.g., cross-file references), i.e., if output could differ from serial rendering
+    retval, state, lookups, messages = rendered
+    for attr in ('ref_tracker', 'ref_counter', 'dup_ref_tracker'):
+        # Lookup of key present in prior global state, before the key is defined by the file itself
+        prior = getattr(Global, attr)
+        defined = set()
+        for op, key in lookups[attr]:
+            if op == 'set':
+                defined.add(key)
+            elif key not in defined and key in prior:
+                return None
+
+    # Concepts covered by prior files do not generate coverage warnings
+    renderer = retval[2]
+    concept_warnings = []
+    concept_warning_tags = []
+    covered_warnings = set()
+    for warning, tag in zip(renderer.concept_warnings, renderer.concept_warning_tags):
+        if tag in Global.primary_tags or tag in Global.sec_tags:
+            covered_warnings.add("        "+warning)
+        else:
+            concept_warnings.append(warning)
+            concept_warning_tags.append(tag)
+    renderer.concept_warnings = concept_warnings
+    renderer.concept_warning_tags = concept_warning_tags
+
+    for args in messages:
+        if len(args) != 1 or args[0] not in covered_warnings:
+            message(*args)
+
+    Global.ref_tracker.update(state['ref_tracker'])
+    Global.ref_counter.update(state['ref_counter'])
+    Global.dup_ref_tracker.update(state['dup_ref_tracker'])
+    Global.chapter_ref_counter = state['chapter_ref_counter']
+    for attr in ('primary_tags', 'sec_tags', 'primary_qtags', 'sec_qtags'):
+        for tag, tag_refs in state[attr].items():
+            getattr(Global, attr)[tag].update(tag_refs)
+    Global.questions.update(state['questions'])
+    for concept_id, concept_questions in state['concept_questions'].items():
+        Global.concept_questions[concept_id].extend(concept_questions)
+
+    # Replay tag case tracking (see add_to_index)
+    for op, tag in lookups['all_tags']:
+        if op == 'contains' and tag not in Global.all_tags:
+            Global.all_tags[tag.lower()] = tag
+    return retval
+
+def get_file_config(fhandle, fname, config, default_args_dict, base_plugin_defs, gd_hmac_key, nfiles):
+    # Return (file_config, file_plugin_defs) for input file
+    file_plugin_defs = base_plugin_defs.copy()
+    if not config.separate:
+        return config, file_plugin_defs
+
+    # Merge file config with command line
+    file_config = parse_merge_args(sliauth.read_header_opts(fhandle)[0], fname, Conf_parser, vars(config), default_args_dict=default_args_dict, verbose=config.verbose)
+    if config.preview_port:
+        if file_config.gsheet_url:
+            file_config.gsheet_url = ''
+
+    if file_config.plugins:
+        # Plugins with same name will override earlier plugins
+        plugin_paths = file_config.plugins.split(',')
+        for plugin_path in plugin_paths:
+            plugin_name, file_plugin_defs[plugin_name] = parse_plugin( read_cached_file(plugin_path.strip()) )
+
+    file_config.features = file_config.features or set()
+    if 'grade_response' in file_config.features and gd_hmac_key is None:
+        # No grading without google sheet
+        file_config.features.remove('grade_response')
+    if nfiles == 1:
+        file_config.strip.add('chapters')
+
+    ##if 'slides_only' in file_config.features and config.printable:
+    ##    file_config.features.remove('slides_only')
+    ##    message('slides_only feature suppressed by --printable option')
+
+    if 'keep_extras' in file_config.features and config.gsheet_url:
+        abort('PACE-ERROR: --features=keep_extras incompatible with --gsheet_url')
+
+    if file_config.retakes and file_config.timed:
+        abort('PACE-ERROR: --retakes=... incompatible with --timed=...')
+
+    if file_config.show_correct and file_config.show_correct not in ('after_answering', 'after_submitting', 'after_grading', 'always'):
+        abort('SHOW-ERROR: Must have --show_correct=after_answering OR after_submitting OR after_grading (found %s)' % file_config.show_correct)
+
+    if not file_config.show_correct:
+        if file_config.pace >= QUESTION_PACE:
+            file_config.show_correct = 'after_answering'
+        elif file_config.pace:
+            if gd_hmac_key is None:
+                file_config.show_correct = 'after_answering'
+            elif 'assessment' in file_config.features:
+                file_config.show_correct = 'after_grading'
+            else:
+                file_config.show_correct = 'after_submitting'
+
+    return file_config, file_plugin_defs
+
+def read_md_text(fhandle):
+    # Return preprocessed Markdown text from input file
+    md_text = fhandle.read()
+    fhandle.close()
+
+    # Preprocess line breaks, tabs etc.
+    md_text = preprocess(md_text)
+    loc = md2md.find_non_ascii(md_text)
+    if loc:
+        message('ASCII-WARNING: Possible non-ascii character at position %d could create problems: %s' % (loc, repr(md_text[max(0,loc-10):loc+15])) )
+
+    # Strip annotations (may also break slide editing)
+    return re.sub(r"(^|\n) {0,3}[Aa]nnotation:(.*?)(\n|$)", '', md_text)
+
 Global = None
 
 def abort(msg):
@@ -3659,20 +4187,20 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
 
     libraries_params = {'libraries_link': (config.libraries_url or LIBRARIES_URL)+''}
 
-    def insert_resource(filename):
-        if filename.endswith('.js'):
-            return ('<script src="%s/%s"></script>\n' % (config.unbundle, filename)) if config.unbundle else ('\n<script>\n%s</script>\n' % templates[filename])
-
-        if filename.endswith('.css'):
-            return ('<link rel="stylesheet" type="text/css" href="%s/%s">\n' % (config.unbundle, filename)) if config.unbundle else ('\n<style>\n%s</style>\n' % templates[filename])
-        raise Exception('Invalid filename for insert_resource: '+filename)
-
     start_date_obj = None
     if config.start_date:
         start_date_obj = sliauth.parse_date(config.start_date)
         if not start_date_obj:
             abort('DATE-ERROR: Invalid site start date: %s' % config.start_date)
 
+    build_manifest = None
+    if config.dest_dir and not config.dry_run and not return_html:
+        # Build manifest, to skip files with unchanged source, options and templates (independent of modification times)
+        build_manifest = read_build_manifest(dest_dir)
+        build_digests = {'config_digest': build_config_digest(config_dict, default_args_dict),
+                         'template_digest': build_template_digest(config.css)}
+    src_digests = {}
+
     orig_fnames = []
     orig_outpaths = []
     orig_flinks = []
@@ -3709,6 +4237,10 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
         if not input_files[j]:
             continue
 
+        if build_manifest is not None:
+            src_digests[fname] = sliauth.digest_hex(input_files[j].read())
+            input_files[j].seek(0)
+
         if start_date_obj:
             # Only process files with a release date after the minimum required release date
             tem_config = parse_merge_args(sliauth.read_header_opts(input_files[j])[0], fname, Conf_parser, {})
@@ -3726,10 +4258,14 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
             # Not make mode or force single file make; process file
             fnumbers.append(fnumber)
         elif config.make == 'all':
-            # Process only accessible and modified input files (if updated using web interface, inpath and outpath may have nearly same mod times)
+            # Process only input files whose source, options, or templates have changed since last build
             # (Always process return_html or index.md file)
-            if return_html or fname == 'index' or not (os.path.exists(outpath) and os.path.getmtime(outpath) >= os.path.getmtime(inpath)):
+            if return_html or fname == 'index' or build_manifest is None or not os.path.exists(outpath):
                 fnumbers.append(fnumber)
+            else:
+                build_entry = build_manifest.get(fname) or {}
+                if build_entry.get('src_digest') != src_digests[fname] or any(build_entry.get(key) != value for key, value in build_digests.items()):
+                    fnumbers.append(fnumber)
 
 
 
@@ -3816,29 +4352,13 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
     if 'strip' in default_args_dict:
         default_args_dict['strip'] = md2md.make_arg_set(default_args_dict['strip'], Strip_all)
 
-    templates = {}
-    for tname in ('doc_include.css', 'wcloud.css', 'doc_custom.css',
-                  'doc_include.js', 'wcloud.js', 'doc_google.js', 'md5.js', 'sha256.js', 'doc_test.js',
-                  'doc_include.html', 'doc_template.html', 'reveal_template.html'):
-        templates[tname] = md2md.read_file(scriptdir+'/templates/'+tname)
-
-    if config.css.startswith('http:') or config.css.startswith('https:'):
-        css_html = '<link rel="stylesheet" type="text/css" href="%s">\n' % config.css
-    elif config.css:
-        css_html = '<style>\n' + md2md.read_file(config.css) + '</style>\n'
-    else:
-        css_html = insert_resource('doc_custom.css')
-
-    # External CSS replaces doc_custom.css, but not doc_include.css
-    css_html += insert_resource('doc_include.css')
-    if HtmlFormatter:
-        css_html += '\n<style>\n' + HtmlFormatter().get_style_defs('.highlight') + '\n</style>\n'
-    css_html += insert_resource('wcloud.css')
+    templates = get_templates()
+    css_html, js_html = get_resource_bundle(config.css, config.unbundle, templates, config.asset_dir)
     test_params = []
     add_scripts = ''
 
     if config.test_script:
-        add_scripts += insert_resource('doc_test.js')
+        add_scripts += insert_resource('doc_test.js', templates, config.unbundle, config.asset_dir)
         if not config.test_script.isdigit():
             for comp in config.test_script.split(','):
                 script, _, user_id = comp.partition('/')
@@ -3860,12 +4380,12 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 test_params.append([label, query, proxy_query])
 
     if gd_hmac_key is not None:
-        add_scripts += (Google_docs_js % js_params) + insert_resource('doc_google.js')
+        add_scripts += (Google_docs_js % js_params) + insert_resource('doc_google.js', templates, config.unbundle, config.asset_dir)
         if config.google_login:
             add_scripts += '<script src="https://apis.google.com/js/client.js?onload=onGoogleAPILoad"></script>\n'
         if gd_hmac_key:
-            add_scripts += insert_resource('md5.js')
-            add_scripts += insert_resource('sha256.js')
+            add_scripts += insert_resource('md5.js', templates, config.unbundle, config.asset_dir)
+            add_scripts += insert_resource('sha256.js', templates, config.unbundle, config.asset_dir)
     answer_elements = {}
     for suffix in SlidocRenderer.content_suffixes:
         answer_elements[suffix] = 0;
@@ -3883,7 +4403,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
         topnav_list = get_topnav(config.topnav, config.server_url, fnames=orig_fnames, site_name=config.site_name, separate=config.separate)
     js_params['topnavList'] = topnav_list
 
-    head_html = font_css(config.fontsize) + css_html + insert_resource('doc_include.js') + insert_resource('wcloud.js')
+    head_html = font_css(config.fontsize) + css_html + js_html
     if combined_file:
         head_html += add_scripts
     body_prefix = templates['doc_include.html']
@@ -3897,7 +4417,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
 
     base_plugin_defs = {}
     for plugin_path in plugin_paths:
-        plugin_name, base_plugin_defs[plugin_name] = parse_plugin( md2md.read_file(plugin_path.strip()) )
+        plugin_name, base_plugin_defs[plugin_name] = parse_plugin( read_cached_file(plugin_path.strip()) )
 
     comb_plugin_defs = {}
     comb_plugin_loads = set()
@@ -3943,7 +4463,8 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
 
     all_concept_warnings = []
     outfile_buffer = []
-    combined_html = []
+    combined_prefix = []
+    combined_html = HtmlSpool() if combined_file and not return_html else []
     if combined_file:
         combined_html.append( '<div id="slidoc-sidebar-right-container" class="slidoc-sidebar-right-container">\n' )
         combined_html.append( '<div id="slidoc-sidebar-right-wrapper" class="slidoc-sidebar-right-wrapper">\n' )
@@ -3956,6 +4477,32 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
     paced_files = set()
     admin_due_date = {}
     out_index = {}
+    out_sidecars = {}
+
+    file_configs = {}
+    file_texts = {}
+    render_pool = None
+    render_results = None
+    if config.jobs and config.jobs > 1 and len(fnumbers) > 1 and not return_html and not config.preview_port:
+        # Parallel compilation: render files in worker processes, with global state (index, references) merged in file order below
+        # (Files whose rendering depends upon prior files are re-rendered serially, so that output is identical to serial compilation)
+        render_jobs = []
+        for fnumber in fnumbers:
+            fname = orig_fnames[fnumber-1]
+            file_config, file_plugin_defs = get_file_config(input_files[fnumber-1], fname, config, default_args_dict, base_plugin_defs, gd_hmac_key, nfiles)
+            file_configs[fnumber] = (file_config, file_plugin_defs)
+            file_texts[fnumber] = read_md_text(input_files[fnumber-1])
+            md2html_args = dict(filename=fname, config=file_config, filenumber=fnumber,
+                                filedir=os.path.dirname(os.path.realpath(input_paths[fnumber-1])), plugin_defs=file_plugin_defs,
+                                prev_file='' if fnumber == 1 else orig_flinks[fnumber-2],
+                                next_file='' if fnumber == nfiles else orig_flinks[fnumber],
+                                index_id=index_id, qindex_id=qindex_id, zip_content=config.preview_port,
+                                images_zipdata=images_zipdict.get(fname))
+            render_jobs.append( (file_texts[fnumber], md2html_args, return_html) )
+        render_pool = multiprocessing.Pool(min(config.jobs, len(render_jobs)))
+        render_results = render_pool.imap(render_file, render_jobs)
+        render_pool.close()
+
     for j, fnumber in enumerate(fnumbers):
         fhandle = input_files[fnumber-1]
         fname = orig_fnames[fnumber-1]
@@ -3964,58 +4511,12 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
         release_date_str = ''
         due_date_str = ''
         vote_date_str = ''
-        file_plugin_defs = base_plugin_defs.copy()
-        if not config.separate:
-            file_config = config
-        else:
+        file_config, file_plugin_defs = file_configs.get(fnumber) or get_file_config(fhandle, fname, config, default_args_dict, base_plugin_defs, gd_hmac_key, nfiles)
+        if config.separate:
             # Separate files (may also be paced)
-
-            # Merge file config with command line
-            file_config = parse_merge_args(sliauth.read_header_opts(fhandle)[0], fname, Conf_parser, vars(config), default_args_dict=default_args_dict, verbose=config.verbose)
-            if config.preview_port:
-                if file_config.gsheet_url:
-                    file_config.gsheet_url = ''
-
-            if file_config.plugins:
-                # Plugins with same name will override earlier plugins
-                plugin_paths = file_config.plugins.split(',')
-                for plugin_path in plugin_paths:
-                    plugin_name, file_plugin_defs[plugin_name] = parse_plugin( md2md.read_file(plugin_path.strip()) )
-
-            file_config.features = file_config.features or set()
-            if 'grade_response' in file_config.features and gd_hmac_key is None:
-                # No grading without google sheet
-                file_config.features.remove('grade_response')
-            if nfiles == 1:
-                file_config.strip.add('chapters')
-
-            ##if 'slides_only' in file_config.features and config.printable:
-            ##    file_config.features.remove('slides_only')
-            ##    message('slides_only feature suppressed by --printable option')
-
-            if 'keep_extras' in file_config.features and config.gsheet_url:
-                abort('PACE-ERROR: --features=keep_extras incompatible with --gsheet_url')
-
-            if file_config.retakes and file_config.timed:
-                abort('PACE-ERROR: --retakes=... incompatible with --timed=...')
-
-            if file_config.show_correct and file_config.show_correct not in ('after_answering', 'after_submitting', 'after_grading', 'always'):
-                abort('SHOW-ERROR: Must have --show_correct=after_answering OR after_submitting OR after_grading (found %s)' % file_config.show_correct)
-
-            if not file_config.show_correct:
-                if file_config.pace >= QUESTION_PACE:
-                    file_config.show_correct = 'after_answering'
-                elif file_config.pace:
-                    if gd_hmac_key is None:
-                        file_config.show_correct = 'after_answering'
-                    elif 'assessment' in file_config.features:
-                        file_config.show_correct = 'after_grading'
-                    else:
-                        file_config.show_correct = 'after_submitting'
-
             file_config_vars = vars(file_config)
             settings_list = []
-            exclude = set(['anonymous', 'auth_key', 'backup_dir', 'config', 'copy_source', 'create_toc', 'dest_dir', 'dry_run', 'google_login', 'gsheet_url', 'make', 'modify_sessions', 'notebook', 'overwrite', 'preview_port', 'proxy_url', 'server_url', 'split_name', 'test_script', 'toc_header', 'topnav', 'verbose', 'file', 'separate', 'toc', 'index', 'qindex'])
+            exclude = set(['anonymous', 'auth_key', 'backup_dir', 'config', 'copy_source', 'create_toc', 'dest_dir', 'dry_run', 'google_login', 'gsheet_url', 'jobs', 'make', 'modify_sessions', 'notebook', 'overwrite', 'preview_port', 'proxy_url', 'server_url', 'split_name', 'test_script', 'toc_header', 'topnav', 'verbose', 'file', 'separate', 'toc', 'index', 'qindex'])
             arg_names = file_config_vars.keys()
             arg_names.sort()
             for name in arg_names:
@@ -4134,17 +4635,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
             
         filepath = input_paths[fnumber-1]
         filedir = os.path.dirname(os.path.realpath(filepath))
-        md_text = fhandle.read()
-        fhandle.close()
-
-        # Preprocess line breaks, tabs etc.
-        md_text = preprocess(md_text)
-        loc = md2md.find_non_ascii(md_text)
-        if loc:
-            message('ASCII-WARNING: Possible non-ascii character at position %d could create problems: %s' % (loc, repr(md_text[max(0,loc-10):loc+15])) )
-
-        # Strip annotations (may also break slide editing)
-        md_text = re.sub(r"(^|\n) {0,3}[Aa]nnotation:(.*?)(\n|$)", '', md_text)
+        md_text = file_texts.pop(fnumber) if fnumber in file_texts else read_md_text(fhandle)
 
         files_url = '/_files'
         if config.site_name:
@@ -4159,10 +4650,17 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
         next_file = '' if fnumber == nfiles else orig_flinks[fnumber]
 
         # zipped_md containing will only be created if any images are present (and will also include the original (preprocessed) md_text as content.md)
-        fheader, file_toc, renderer, md_params, md_html, zipped_md = md2html(md_text, filename=fname, config=file_config, filenumber=fnumber,
-                                                        filedir=filedir, plugin_defs=file_plugin_defs, prev_file=prev_file, next_file=next_file,
-                                                        index_id=index_id, qindex_id=qindex_id, zip_content=config.preview_port,
-                                                        images_zipdata=images_zipdict.get(fname))
+        rendered = next(render_results) if render_results else None
+        if rendered:
+            rendered = merge_rendered_file(rendered)
+        if rendered:
+            # Rendered in worker process
+            fheader, file_toc, renderer, md_params, md_html, zipped_md = rendered
+        else:
+            fheader, file_toc, renderer, md_params, md_html, zipped_md = md2html(md_text, filename=fname, config=file_config, filenumber=fnumber,
+                                                            filedir=filedir, plugin_defs=file_plugin_defs, prev_file=prev_file, next_file=next_file,
+                                                            index_id=index_id, qindex_id=qindex_id, zip_content=config.preview_port,
+                                                            images_zipdata=images_zipdict.get(fname))
         math_present = renderer.render_mathjax or MathInlineGrammar.any_block_math.search(md_text) or MathInlineGrammar.any_inline_math.search(md_text)
 
         if len(fnumbers) == 1 and config.separate and config.extract:
@@ -4253,8 +4751,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                         temdir = opt
                         tempath = os.path.join(tempath, 'index.html')
                     if os.path.exists(tempath):
-                        with open(tempath) as f:
-                            index_entries = read_index(f, path=tempath)
+                        index_entries = read_output_index(tempath)
                     else:
                          index_entries = []
                     for ind_fname, ind_fheader, doc_str, iso_due_str, iso_release_str, index_params in index_entries:
@@ -4412,7 +4909,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
             else:
                 tem_plugin_defs = file_plugin_defs.copy()
                 tem_plugin_defs.update(renderer.plugin_defs)
-                file_head_html = (js_params_fmt % sliauth.ordered_stringify(js_params)) + font_css(file_config.fontsize) + css_html + insert_resource('doc_include.js') + insert_resource('wcloud.js') + add_scripts
+                file_head_html = (js_params_fmt % sliauth.ordered_stringify(js_params)) + font_css(file_config.fontsize) + css_html + js_html + add_scripts
 
                 pre_html = file_head_html + plugin_heads(tem_plugin_defs, renderer.plugin_loads) + (mid_template % mid_params) + body_prefix
                 # Prefix index entry as comment
@@ -4423,17 +4920,22 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 index_entries += [ json.dumps(index_dict).replace('<', '&lt;').replace('>', '&gt;')]
                 index_head = '\n'.join([Index_prefix] + index_entries + [Index_suffix])+'\n'
                 out_index[outpath] = index_head
+                out_sidecars[outpath] = make_index_sidecar(index_head, fname)
                 pre_html = index_head + pre_html
 
-                tail = md_prefix + md_html + md_suffix
+                # Output pieces (not concatenated)
+                tail = [md_prefix, md_html, md_suffix]
                 if file_config.delay_sec or (file_config.gsheet_url and file_config.pace and file_config.printable):
-                    tail += Delay_image_format % (site_prefix, file_config.delay_sec or 10, '' if file_config.delay_sec else '&cancel=yes')
+                    tail.append(Delay_image_format % (site_prefix, file_config.delay_sec or 10, '' if file_config.delay_sec else '&cancel=yes'))
                 if Missing_ref_num_re.search(md_html) or return_html:
-                    # Still some missing reference numbers; output file later
+                    # Still some missing reference numbers; output file later (spooling rendered content, rather than retaining it in memory)
+                    if not return_html:
+                        tail = HtmlSpool(tail)
                     outfile_buffer.append([outname, outpath, fnumber, md_params, pre_html, tail, zipped_md])
                 else:
                     outfile_buffer.append([outname, outpath, fnumber, md_params, '', '', None])
-                    write_doc(dest_dir+outname, pre_html, tail)
+                    write_doc(outpath, pre_html, tail, precompress=config.precompress)
+                    write_index_sidecar(outpath, out_sidecars[outpath])
 
             if backup_dir:
                 bakname = backup_dir+os.path.basename(input_paths[fnumber-1])[:-3]+'-bak.md'
@@ -4455,6 +4957,9 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 md_parser = md2nb.MDParser(nb_converter_args)
                 md2md.write_file(dest_dir+fname+".ipynb", md_parser.parse_cells(md_text_modified))
 
+    if render_pool:
+        render_pool.join()
+
     toc_all_html = ''
     if toc_file:
         toc_path = dest_dir + toc_file
@@ -4508,8 +5013,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 if outpath in out_index:
                     index_entries = read_index(io.BytesIO(out_index[outpath].encode('utf8')), path=outpath)
                 elif os.path.exists(outpath):
-                    with open(outpath) as f:
-                        index_entries = read_index(f, path=outpath)
+                    index_entries = read_output_index(outpath)
                 else:
                     message('TOC-WARNING: Output file '+outpath+' not readable for indexing')
                     continue
@@ -4616,7 +5120,7 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 all_container_prefix  = '<div id="slidoc-all-container" class="slidoc-all-container">\n'
                 left_container_prefix = '<div id="slidoc-left-container" class="slidoc-left-container">\n'
                 left_container_suffix = '</div> <!--slidoc-left-container-->\n'
-                combined_html = [all_container_prefix, left_container_prefix, toc_output, left_container_suffix] + combined_html
+                combined_prefix = [all_container_prefix, left_container_prefix, toc_output, left_container_suffix]
             else:
                 if toc_list:
                     # Include file header info as HTML comment
@@ -4626,6 +5130,9 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 toc_all_html = ''.join( [Html_header, toc_js_params+toc_head_html, mid_template % toc_mid_params, body_prefix, toc_output, Html_footer] )
                 if not return_html:
                     md2md.write_file(toc_path, toc_all_html)
+                    if config.precompress:
+                        write_precompressed(toc_path)
+                    write_index_sidecar(toc_path, make_index_sidecar('\n'.join([Index_prefix]+toc_list+[Index_suffix])))
                     message("Created ToC file:", toc_path)
 
     if not config.dry_run or return_html:
@@ -4634,15 +5141,22 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 message('Created output files:', ', '.join(x[0] for x in outfile_buffer))
             for outname, outpath, fnumber, md_params, pre_html, tail, zipped_md in outfile_buffer:
                 if tail:
-                    # Update "missing" reference numbers and write output file
-                    tail = Missing_ref_num_re.sub(Missing_ref_num, tail)
+                    # Write output file (updating "missing" reference numbers)
                     if return_html:
-                        return {'outpath': outpath, 'out_html':md2md.str_join(Html_header, pre_html, tail, Html_footer), 'toc_html':md2md.stringify(toc_all_html), 'md_params':md_params, 'zipped_md':zipped_md, 'messages': messages}
+                        return {'outpath': outpath, 'out_html':render_doc(pre_html, tail), 'toc_html':md2md.stringify(toc_all_html), 'md_params':md_params, 'zipped_md':zipped_md,
+                                'index_sidecar': out_sidecars.get(outpath), 'messages': messages}
                     else:
-                        write_doc(outpath, pre_html, tail)
+                        write_doc(outpath, pre_html, tail, precompress=config.precompress)
+                        write_index_sidecar(outpath, out_sidecars[outpath])
             if return_html:
                 # No output files
                 return {'outpath': '', 'out_html':'', 'toc_html':toc_all_html, 'md_params':{}, 'zipped_md':None, 'messages': messages}
+
+            if build_manifest is not None and outfile_buffer:
+                for outname, outpath, fnumber, md_params, pre_html, tail, zipped_md in outfile_buffer:
+                    fname = orig_fnames[fnumber-1]
+                    build_manifest[fname] = dict(src_digest=src_digests.get(fname), **build_digests)
+                md2md.write_file(dest_dir+BUILD_MANIFEST, json.dumps(build_manifest, indent=2, sort_keys=True))
         if config.slides:
             message('Created *-slides.html files')
         if config.notebook:
@@ -4665,6 +5179,8 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 combined_html.append('<div class="slidoc-noslide">'+index_output+'</div>\n')
             elif not return_html:
                 md2md.write_file(dest_dir+config.index, index_output)
+                if config.precompress:
+                    write_precompressed(dest_dir+config.index)
                 message("Created index in", config.index)
 
         if config.crossref:
@@ -4702,6 +5218,8 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
                 combined_html.append('<div class="slidoc-noslide">'+qindex_output+'</div>\n')
             elif not return_html:
                 md2md.write_file(dest_dir+config.qindex, qindex_output)
+                if config.precompress:
+                    write_precompressed(dest_dir+config.qindex)
                 message("Created qindex in", config.qindex)
 
         if config.crossref:
@@ -4734,6 +5252,8 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
 
     if config.crossref and not return_html:
         md2md.write_file(dest_dir+config.crossref, ''.join(xref_list))
+        if config.precompress:
+            write_precompressed(dest_dir+config.crossref)
         message("Created crossref in", config.crossref)
 
     if combined_file:
@@ -4757,13 +5277,13 @@ def process_input_aux(input_files, input_paths, config_dict, default_args_dict={
         comb_params.update(SYMS)
         all_plugin_defs = base_plugin_defs.copy()
         all_plugin_defs.update(comb_plugin_defs)
-        output_data = [Html_header, (js_params_fmt % json.dumps(js_params))+head_html+plugin_heads(all_plugin_defs, comb_plugin_loads),
-                       mid_template % comb_params, body_prefix,
-                       '\n'.join(combined_html), Html_footer]
+        comb_head = (js_params_fmt % json.dumps(js_params))+head_html+plugin_heads(all_plugin_defs, comb_plugin_loads) + (mid_template % comb_params) + body_prefix
+        # Chapters are streamed from spool to output, rather than being joined in memory
+        comb_tail = join_pieces('\n', combined_prefix + list(combined_html) if return_html else itertools.chain(combined_prefix, combined_html))
         message('Created combined HTML file in '+combined_file)
         if return_html:
-            return {'outpath':dest_dir+combined_file, 'out_html':''.join(output_data), 'toc_html':toc_all_html, 'messages':messages}
-        md2md.write_file(dest_dir+combined_file, *output_data)
+            return {'outpath':dest_dir+combined_file, 'out_html':render_doc(comb_head, comb_tail), 'toc_html':toc_all_html, 'messages':messages}
+        write_doc(dest_dir+combined_file, comb_head, comb_tail, precompress=config.precompress)
     return {'messages':messages}
 
 
@@ -4792,6 +5312,7 @@ Formatted_by = 'Document formatted by <a href="https://github.com/mitotic/slidoc
 
 Index_prefix = '\n<!--SlidocIndex'
 Index_suffix = 'SlidocIndex-->\n'
+INDEX_SIDECAR_EXT = '.index.json'   # JSON sidecar for each HTML output file, with index entries (not served by sdserver)
 
 Toc_header = '''
 <h3>Table of Contents</h3>
@@ -4855,8 +5376,71 @@ function onGoogleAPILoad() {
 </script>
 '''
 
-def write_doc(path, head, tail):
-    md2md.write_file(path, Html_header, head, tail, Html_footer)
+class HtmlSpool(object):
+    # Sequence of HTML output pieces, spooled to a temporary file rather than being retained in memory
+    # (iteration reads back one piece at a time)
+    def __init__(self, pieces=[]):
+        self.spool = tempfile.TemporaryFile()
+        self.offsets = []   # [(offset, length)] for each piece
+        for piece in pieces:
+            self.append(piece)
+
+    def append(self, piece):
+        piece = md2md.stringify(piece)
+        self.spool.seek(0, os.SEEK_END)
+        self.offsets.append( (self.spool.tell(), len(piece)) )
+        self.spool.write(piece)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __iter__(self):
+        for offset, length in self.offsets:
+            self.spool.seek(offset)
+            yield self.spool.read(length)
+
+def join_pieces(sep, pieces):
+    # Streaming equivalent of sep.join(pieces)
+    for j, piece in enumerate(pieces):
+        if j:
+            yield sep
+        yield piece
+
+def write_html(outfile, head, tail):
+    # Write HTML document to file object (file or BytesIO) in order, where tail may be a string or an iterable of pieces (e.g., HtmlSpool)
+    # Missing reference numbers in each tail piece are resolved just before the piece is written
+    # (avoiding copies of the whole document in memory)
+    outfile.write(Html_header)
+    outfile.write(md2md.stringify(head))
+    for piece in ([tail] if isinstance(tail, basestring) else tail):
+        if Missing_ref_num_re.search(piece):
+            piece = Missing_ref_num_re.sub(Missing_ref_num, piece)
+        outfile.write(md2md.stringify(piece))
+    outfile.write(Html_footer)
+
+def render_doc(head, tail):
+    # Return HTML document as string (see write_html)
+    buf = io.BytesIO()
+    write_html(buf, head, tail)
+    return buf.getvalue()
+
+def write_doc(path, head, tail, precompress=False):
+    # Stream HTML document to output file (see write_html)
+    with open(path, 'w') as f:
+        write_html(f, head, tail)
+    if precompress:
+        write_precompressed(path)
+
+PRECOMPRESSED_EXTS = [('br', '.br'), ('gzip', '.gz')]   # (content encoding, file extension) for precompressed copies of output files, in order of preference
+
+def write_precompressed(path):
+    # Write gzip (and brotli, if available) compressed copies of output file, for serving with Content-Encoding
+    # (gzip header has no timestamp, i.e., compressed content depends only upon file content)
+    with open(path, 'rb') as fin, open(path+'.gz', 'wb') as fout:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=fout, mtime=0) as f:
+            shutil.copyfileobj(fin, f)
+    if brotli:
+        md2md.write_file(path+'.br', brotli.compress(md2md.read_file(path)))
 
 def parse_merge_args(args_text, source, parser, cmd_args_dict, default_args_dict={}, exclude_args=set(), include_args=set(), verbose=False):
     # Process file line args and merge with command line args, with command line args being final
@@ -5226,6 +5810,7 @@ Conf_parser.add_argument('--unhide_slides', help='Unhide all slides', action="st
 
 alt_parser = argparse.ArgumentParser(parents=[Conf_parser], add_help=False)
 alt_parser.add_argument('--anonymous', help='Allow anonymous access (also unset REQUIRE_LOGIN_TOKEN)', action="store_true", default=None)
+alt_parser.add_argument('--asset_dir', metavar='DIR', help='Directory for fingerprinted (content-hashed) JS/CSS resource files, served from --unbundle URL path')
 alt_parser.add_argument('--auth_key', metavar='DIGEST_AUTH_KEY', help='digest_auth_key (authenticate users with HMAC)')
 alt_parser.add_argument('--backup_dir', help='Directory to create backup files for last valid version in when dest_dir is specified')
 alt_parser.add_argument('--config', metavar='CONFIG_FILENAME', help='File containing default command line')
@@ -5238,6 +5823,7 @@ alt_parser.add_argument('--extract', metavar='SLIDE_NUMBER', type=int, help='Ext
 alt_parser.add_argument('--google_login', metavar='CLIENT_ID,API_KEY', help='client_id,api_key (authenticate via Google; not used)')
 alt_parser.add_argument('--gsheet_url', metavar='URL', help='Google spreadsheet_url (export sessions to Google Docs spreadsheet)')
 alt_parser.add_argument('--indexed', metavar='TOC,INDEX,QINDEX', help='Table_of_contents,concep_index,question_index base filenames, e.g., "toc,ind,qind" (if omitted, all input files are combined, unless pacing)')
+alt_parser.add_argument('--jobs', type=int, metavar='NUM', help='Number of worker processes for rendering multiple files in parallel (default: 1)')
 alt_parser.add_argument('--libraries_url', metavar='URL', help='URL for library files; default: %s' % LIBRARIES_URL)
 alt_parser.add_argument('--make', help='=all OR =filename; enable Make mode, i.e., only process .md files that are newer than corresponding .html files')
 alt_parser.add_argument('--modify_sessions', metavar='SESSION1,SESSION2,... OR overwrite OR truncate', help='Module sessions with questions to be modified')
@@ -5245,6 +5831,7 @@ alt_parser.add_argument('--notebook', help='Create notebook files', action="stor
 alt_parser.add_argument('--overwrite', help='Overwrite source and nb files', action="store_true", default=None)
 alt_parser.add_argument('-p', '--preview_port', type=int, default=0, metavar='PORT', help='Preview document in browser using specified localhost port')
 alt_parser.add_argument('--pptx_options', metavar='PPTX_OPTS', default='', help='Powerpoint conversion options (comma-separated)')
+alt_parser.add_argument('--precompress', help='Write gzip (and brotli, if available) compressed copies of HTML output files', action="store_true", default=None)
 alt_parser.add_argument('--preview_mode', help='Do not copy image files to dest directory', action="store_true", default=None)
 alt_parser.add_argument('--print_to_pdf', metavar='FILE', help='PDF output file name')
 alt_parser.add_argument('--proxy_url', metavar='URL', help='Proxy spreadsheet_url')
@@ -72,11 +72,97 @@ function initWebsocket() {
 
 initWebsocket();
 
+GService.msgpackSupported = !!(window.DataView && window.TextDecoder);
+
+GService.decodeMsgpack = function (buffer) {
+    // Decode MessagePack binary message (ArrayBuffer); bin values are returned as Uint8Array
+    var view = new DataView(buffer);
+    var bytes = new Uint8Array(buffer);
+    var decoder = new TextDecoder('utf-8');
+    var offset = 0;
+
+    function readStr(len) {
+	var value = decoder.decode(bytes.subarray(offset, offset+len));
+	offset += len;
+	return value;
+    }
+
+    function readBin(len) {
+	var value = bytes.slice(offset, offset+len);
+	offset += len;
+	return value;
+    }
+
+    function readArray(len) {
+	var value = [];
+	for (var j=0; j<len; j++)
+	    value.push(readValue());
+	return value;
+    }
+
+    function readMap(len) {
+	var value = {};
+	for (var j=0; j<len; j++) {
+	    var key = readValue();
+	    value[key] = readValue();
+	}
+	return value;
+    }
+
+    function readValue() {
+	var type = view.getUint8(offset);
+	offset += 1;
+	var value;
+	if (type <= 0x7f)
+	    return type;
+	if (type >= 0xe0)
+	    return type - 0x100;
+	if (type >= 0xa0 && type <= 0xbf)
+	    return readStr(type & 0x1f);
+	if (type >= 0x90 && type <= 0x9f)
+	    return readArray(type & 0x0f);
+	if (type >= 0x80 && type <= 0x8f)
+	    return readMap(type & 0x0f);
+
+	switch (type) {
+	case 0xc0: return null;
+	case 0xc2: return false;
+	case 0xc3: return true;
+	case 0xc4: value = view.getUint8(offset); offset += 1; return readBin(value);
+	case 0xc5: value = view.getUint16(offset); offset += 2; return readBin(value);
+	case 0xc6: value = view.getUint32(offset); offset += 4; return readBin(value);
+	case 0xca: value = view.getFloat32(offset); offset += 4; return value;
+	case 0xcb: value = view.getFloat64(offset); offset += 8; return value;
+	case 0xcc: value = view.getUint8(offset); offset += 1; return value;
+	case 0xcd: value = view.getUint16(offset); offset += 2; return value;
+	case 0xce: value = view.getUint32(offset); offset += 4; return value;
+	case 0xcf: value = view.getUint32(offset)*4294967296 + view.getUint32(offset+4); offset += 8; return value;
+	case 0xd0: value = view.getInt8(offset); offset += 1; return value;
+	case 0xd1: value = view.getInt16(offset); offset += 2; return value;
+	case 0xd2: value = view.getInt32(offset); offset += 4; return value;
+	case 0xd3: value = view.getInt32(offset)*4294967296 + view.getUint32(offset+4); offset += 8; return value;
+	case 0xd9: value = view.getUint8(offset); offset += 1; return readStr(value);
+	case 0xda: value = view.getUint16(offset); offset += 2; return readStr(value);
+	case 0xdb: value = view.getUint32(offset); offset += 4; return readStr(value);
+	case 0xdc: value = view.getUint16(offset); offset += 2; return readArray(value);
+	case 0xdd: value = view.getUint32(offset); offset += 4; return readArray(value);
+	case 0xde: value = view.getUint16(offset); offset += 2; return readMap(value);
+	case 0xdf: value = view.getUint32(offset); offset += 4; return readMap(value);
+	}
+	throw('Unsupported MessagePack type 0x'+type.toString(16)+' at offset '+(offset-1));
+    }
+
+    return readValue();
+}
+
 GService.openWebsocket = function (wsPath) {
+    if (GService.msgpackSupported) // Server may respond with MessagePack binary messages, if enabled
+	wsPath += ((wsPath.indexOf('?') >= 0) ? '&' : '?') + 'encoding=msgpack';
     var wsUrl = ((location.protocol === "https:") ? "wss://" : "ws://") + location.host + wsPath;
     Slidoc.log('GService.openWebsocket:', wsUrl);
 
     wsock.connection = new WebSocket(wsUrl);
+    wsock.connection.binaryType = 'arraybuffer';
 
     wsock.connection.onopen = function() {
 	Slidoc.log('GService.ws.onopen:');
@@ -99,9 +185,12 @@ GService.openWebsocket = function (wsPath) {
 
     wsock.connection.onmessage = function(evt) {
 	try {
-	    var msgObj = JSON.parse(evt.data);
+	    if (evt.data instanceof ArrayBuffer)
+		var msgObj = GService.decodeMsgpack(evt.data);
+	    else
+		var msgObj = JSON.parse(evt.data);
 	} catch (err) {
-            Slidoc.log('GService.ws.onmessage: Websocket JSON parsing error:', err, evt.data);
+            Slidoc.log('GService.ws.onmessage: Websocket message decoding error:', err, evt.data);
 	    return;
 	}
 	var callback_index = msgObj[0];
@@ -134,6 +223,8 @@ GService.openWebsocket = function (wsPath) {
 		    }
 		} else if (callback_method == 'close') {
 		    GService.closeWS(callback_args[0], callback_args[1]);
+		} else if (callback_method == 'error') {
+		    Slidoc.log('GService.ws.onmessage: ERROR from server: '+callback_args[0]);
 		} else if (callback_method == 'event') {
 		    if (wsock.eventReceiver)
 			wsock.eventReceiver(callback_args);